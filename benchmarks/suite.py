@@ -0,0 +1,500 @@
+"""
+Benchmark suite: throughput of mapcat's ingest paths on synthetic workloads.
+
+Workloads cover the parser, chunker, State, handlers and broadcast, plus the
+feature paths that come in pairs to compare: stdin readers, logcat filtering,
+the Python API vs. text commands, the parse cache, diagnostics rate limiting
+and the --ring input with binary vs. text records.
+
+Every workload is generated from a fixed seed, timed --repeat times (best and
+median are reported) and written as JSON with --output. --compare checks the
+results against a stored run and exits with status 1 if any workload is slower
+by more than --threshold percent.
+
+Usage:
+    python benchmarks/suite.py [--only NAME,...] [--scale F] [--repeat N]
+                               [--output results.json] [--compare baseline.json] [--threshold PCT]
+
+    # store a baseline, then check a change against it
+    python benchmarks/suite.py --output baseline.json
+    python benchmarks/suite.py --compare baseline.json
+"""
+import argparse
+import asyncio
+import contextlib
+import functools
+import json
+import multiprocessing
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from array import array
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import websockets  # noqa: E402
+
+from mapcat import api, diagnostics, inputs, logcat, parser, ring, server  # noqa: E402
+from mapcat.chunker import Chunker  # noqa: E402
+from mapcat.commands import COMMAND_HANDLERS  # noqa: E402
+from mapcat.main import handle_line  # noqa: E402
+from mapcat.state import State  # noqa: E402
+
+RESULTS_VERSION = 1
+
+
+class Case(NamedTuple):
+    """A prepared workload: run() does `ops` units of work; close() releases resources."""
+    run: Callable[[], None]
+    ops: int
+    close: Optional[Callable[[], None]] = None
+
+
+class Workload(NamedTuple):
+    name: str
+    unit: str
+    description: str
+    setup: Callable[[float], Case]  # scale -> Case; generation is not timed
+
+
+def point_lines(count: int) -> List[str]:
+    rng = random.Random(1)
+    return [f"add-point ({rng.uniform(-80, 80):.6f},{rng.uniform(-170, 170):.6f}) color=red radius=3 tag=t{i % 10}"
+            for i in range(count)]
+
+
+def polyline_line(vertices: int) -> str:
+    rng = random.Random(2)
+    coords = ';'.join(f"({52 + rng.random() * 0.1:.6f},{13 + rng.random() * 0.1:.6f})" for _ in range(vertices))
+    return f"add-polyline {coords} color=blue width=2"
+
+
+def setup_parse_points(scale: float) -> Case:
+    lines = point_lines(int(100_000 * scale))
+    parser.enable_cache(0)  # measure the parser, not the cache
+
+    def run():
+        for line in lines:
+            parser.parse_command(line)
+    return Case(run, len(lines))
+
+
+def setup_parse_polyline(scale: float) -> Case:
+    vertices = int(100_000 * scale)
+    line = polyline_line(vertices)
+    parser.enable_cache(0)
+    return Case(lambda: parser.parse_command(line), vertices)
+
+
+def setup_handler_points(scale: float) -> Case:
+    parsed = [parser.parse_command(line) for line in point_lines(int(100_000 * scale))]
+    handler = COMMAND_HANDLERS['add-point']
+
+    def run():
+        state = State()
+        for command in parsed:
+            json.dumps(handler(state, command))
+    return Case(run, len(parsed))
+
+
+def setup_handler_polyline(scale: float) -> Case:
+    vertices = int(100_000 * scale)
+    parsed = parser.parse_command(polyline_line(vertices))
+    handler = COMMAND_HANDLERS['add-polyline']
+    return Case(lambda: json.dumps(handler(State(), parsed)), vertices)
+
+
+def setup_chunker_out_of_order(scale: float) -> Case:
+    """Self-describing sessions of 8 chunks, delivered shuffled and interleaved across 16 open sessions."""
+    rng = random.Random(3)
+    sessions = int(2_000 * scale)
+    per_session = 8
+    chunks = []
+    for s in range(sessions):
+        text = polyline_line(40)
+        size = -(-len(text) // per_session)
+        parts = [(f"s{s}", seq + 1, per_session, text[seq * size:(seq + 1) * size]) for seq in range(per_session)]
+        rng.shuffle(parts)
+        chunks.append(parts)
+    # Interleave groups of 16 sessions so several are open at once
+    stream = []
+    for group in range(0, sessions, 16):
+        pending = [list(parts) for parts in chunks[group:group + 16]]
+        while any(pending):
+            for parts in pending:
+                if parts:
+                    stream.append(parts.pop())
+
+    def run():
+        chunker = Chunker('bench')
+        assembled = 0
+        for session_id, seq, total, content in stream:
+            if chunker.add_chunk_v2(session_id, seq, total, content):
+                assembled += 1
+        assert assembled == sessions, f"{assembled} of {sessions} sessions assembled"
+    return Case(run, len(stream))
+
+
+def setup_state_tag_churn(scale: float) -> Case:
+    """Add features in 100 consecutive tags; once 20 tags are live, each new tag removes the oldest."""
+    count = int(100_000 * scale)
+    per_tag = max(count // 100, 1)
+    coords = [[52.5, 13.4]]
+
+    def run():
+        state = State()
+        for i in range(count):
+            state.add_feature('point', coords, {'tag': f"tag{i // per_tag}", 'color': 'red'})
+            tag_index = i // per_tag
+            if i % per_tag == per_tag - 1 and tag_index >= 20:
+                state.remove_features_by_tag(f"tag{tag_index - 20}")
+    return Case(run, count)
+
+
+def setup_broadcast_fanout(scale: float) -> Case:
+    """server.broadcast to 20 local WebSocket clients; done when every client received every message."""
+    clients = 20
+    messages = int(5_000 * scale)
+    payload = json.dumps({'action': 'add', 'id': 'x' * 8, 'type': 'point', 'coords': [52.5, 13.4],
+                          'params': {'color': 'red', 'opacity': 1.0, 'radius': 4, 'border': 2, 'zorder': 0}})
+    loop = asyncio.new_event_loop()
+    server.set_state_getter(None)
+
+    async def connect():
+        ws_server = await websockets.serve(server.ws_handler, '127.0.0.1', 0, ping_interval=None)
+        port = ws_server.sockets[0].getsockname()[1]
+        connections = [await websockets.connect(f"ws://127.0.0.1:{port}", ping_interval=None, max_queue=None)
+                       for _ in range(clients)]
+        while len(server.clients) < clients:
+            await asyncio.sleep(0.01)
+        return ws_server, connections
+
+    ws_server, connections = loop.run_until_complete(connect())
+
+    async def receive(connection):
+        for _ in range(messages):
+            await connection.recv()
+
+    async def fanout():
+        readers = [asyncio.ensure_future(receive(connection)) for connection in connections]
+        for i in range(messages):
+            await server.broadcast(payload)
+            if i % 64 == 63:
+                await asyncio.sleep(0)  # let the clients drain, as between input batches
+        await asyncio.gather(*readers)
+
+    async def close():
+        for connection in connections:
+            await connection.close()
+        ws_server.close()
+        await ws_server.wait_closed()
+
+    return Case(lambda: loop.run_until_complete(fanout()), clients * messages,
+                lambda: (loop.run_until_complete(close()), loop.close()))
+
+
+def setup_stdin_reader(reader, pipeline: bool, scale: float) -> Case:
+    """
+    A 1M-line command file fed through a real pipe, the way `cat file | mapcat`
+    does, into an inputs reader; with pipeline, every line also goes through
+    handle_line (parse, handler, State) with broadcasting stubbed out.
+    """
+    count = int(1_000_000 * scale)
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, 'commands.txt')
+    with open(path, 'w') as f:
+        f.writelines(line + '\n' for line in point_lines(count))
+
+    async def no_broadcast(message):
+        pass
+
+    async def consume(batches):
+        received = 0
+        state, chunker = State(), Chunker()
+        async for batch in batches:
+            if pipeline:
+                for line in batch:
+                    await handle_line(line, state, chunker, False, False)
+            received += len(batch)
+        return received
+
+    def run():
+        cat = subprocess.Popen(['cat', path], stdout=subprocess.PIPE)
+        broadcast, server.broadcast = server.broadcast, no_broadcast
+        try:
+            with os.fdopen(cat.stdout.fileno(), 'r', closefd=False) as stream:
+                received = asyncio.run(consume(reader(stream)))
+        finally:
+            server.broadcast = broadcast
+        cat.wait()
+        cat.stdout.close()
+        assert received == count, f"{received} of {count} lines read"
+    return Case(run, count, lambda: shutil.rmtree(directory))
+
+
+def setup_logcat_filter(scale: float) -> Case:
+    """Unfiltered threadtime lines where 1 in 100 carries the Mapcat tag."""
+    rng = random.Random(4)
+    other_tags = ['ActivityManager', 'chatty', 'SurfaceFlinger', 'wpa_supplicant', 'MapcatHelper', 'GnssLocationProvider']
+    lines = []
+    for i in range(int(200_000 * scale)):
+        pid = rng.randint(100, 99999)
+        tag = 'Mapcat' if i % 100 == 0 else rng.choice(other_tags)
+        message = f"add-point (52.{i % 1000},13.{i % 997})" if tag == 'Mapcat' else f"event {i} state=ok"
+        lines.append(f"10-19 12:34:56.{i % 1000:03d} {pid:5d} {pid:5d} D {tag:<8s}: {message}")
+
+    def run():
+        for line in lines:
+            logcat.parse_line(line)
+    return Case(run, len(lines))
+
+
+def polyline_buffers(count: int, points: int) -> List[array]:
+    tracks = []
+    for f in range(count):
+        flat = array('d')
+        for p in range(points):
+            flat.append(52.0 + (f * points + p) % 10000 * 1e-5)
+            flat.append(13.0 + p * 1e-5)
+        tracks.append(flat)
+    return tracks
+
+
+def setup_text_polylines(scale: float) -> Case:
+    """Float buffers formatted as add-polyline lines, parsed and handled: the stdin path."""
+    tracks = polyline_buffers(int(100 * scale), 500)
+    handler = COMMAND_HANDLERS['add-polyline']
+    parser.enable_cache(0)
+
+    def run():
+        state = State()
+        for flat in tracks:
+            coords = ';'.join(f"({flat[i]},{flat[i + 1]})" for i in range(0, len(flat), 2))
+            handler(state, parser.parse_command(f"add-polyline {coords} color=blue"))
+    return Case(run, sum(len(flat) // 2 for flat in tracks))
+
+
+def setup_api_polylines(scale: float) -> Case:
+    """The same polylines through api.Session.add_polyline with flat array('d') buffers."""
+    tracks = polyline_buffers(int(100 * scale), 500)
+
+    def run():
+        session = api.Session()
+        for flat in tracks:
+            session.add_polyline(flat, color='blue')
+    return Case(run, sum(len(flat) // 2 for flat in tracks))
+
+
+def setup_parse_polygons(cache_size: int, scale: float) -> Case:
+    """Lines cycling through 50 polygons of 200 points, as when an app re-logs static geofences."""
+    shapes = [f"add-polygon {';'.join(f'({52 + s * 0.01 + p * 1e-5:.6f},{13 + p * 1e-5:.6f})' for p in range(200))}"
+              f" color=green tag=geofence id=fence-{s}" for s in range(50)]
+    lines = [shapes[i % len(shapes)] for i in range(int(2_000 * scale))]
+
+    def run():
+        parser.enable_cache(cache_size)  # every run starts cold
+        for line in lines:
+            parser.parse_command(line)
+    return Case(run, len(lines), lambda: parser.enable_cache(0))
+
+
+def setup_invalid_lines(buffered: bool, rate_limit: int, scale: float) -> Case:
+    """Out-of-range points through handle_line; diagnostics are written to os.devnull."""
+    lines = [f"add-point (95.{i},13.4) color=red" for i in range(int(50_000 * scale))]
+    devnull = open(os.devnull, 'w')
+
+    async def feed():
+        state, chunker = State(), Chunker()
+        for line in lines:
+            await handle_line(line, state, chunker, False, False)
+
+    def run():
+        with contextlib.redirect_stderr(devnull):
+            diagnostics.configure(buffered=buffered, rate_limit=rate_limit)
+            asyncio.run(feed())
+            diagnostics.get().close()  # the buffered writer's backlog is part of the cost
+
+    def close():
+        diagnostics.configure(buffered=False, rate_limit=0)
+        devnull.close()
+    return Case(run, len(lines), close)
+
+
+def produce_ring_updates(path: str, count: int, text: bool) -> None:
+    producer = ring.RingProducer(path)
+    for i in range(count):
+        lat, lng = 52.0 + i % 10000 * 1e-5, 13.0 + i % 7919 * 1e-5
+        if text:
+            send = functools.partial(producer.send_text, f"update-current-position ({lat},{lng})")
+        else:
+            send = functools.partial(producer.send_command, 'update-current-position', array('d', (lat, lng)))
+        while not send():
+            time.sleep(0)  # ring full: let the consumer catch up
+    producer.close()
+
+
+def setup_ring_input(text: bool, scale: float) -> Case:
+    """Position updates written by a producer process and applied to State, as mapcat --ring does."""
+    count = int(100_000 * scale)
+    directory = tempfile.mkdtemp()
+    handler = COMMAND_HANDLERS['update-current-position']
+
+    def run():
+        path = os.path.join(directory, 'bench.ring')
+        consumer = ring.RingConsumer(path)
+        state = State()
+        producer = multiprocessing.Process(target=produce_ring_updates, args=(path, count, text))
+        producer.start()
+        applied = 0
+        while applied < count:
+            items = consumer.read()
+            if not items:
+                time.sleep(0)
+            for record_type, item in items:
+                commands = [item] if record_type == ring.TYPE_COORDS else map(parser.parse_command, item)
+                for parsed in commands:
+                    handler(state, parsed)
+                    applied += 1
+        producer.join()
+        consumer.close()
+        os.remove(path)
+    return Case(run, count, lambda: shutil.rmtree(directory))
+
+
+WORKLOADS = [
+    Workload('parse_points', 'lines', 'parse_command on a flood of point lines', setup_parse_points),
+    Workload('parse_polyline_100k', 'vertices', 'parse_command on one 100k-vertex polyline', setup_parse_polyline),
+    Workload('handler_points', 'commands', 'add-point handler, State and json.dumps on parsed points', setup_handler_points),
+    Workload('handler_polyline_100k', 'vertices', 'add-polyline handler and json.dumps of a 100k-vertex polyline', setup_handler_polyline),
+    Workload('chunker_out_of_order', 'chunks', 'self-describing chunk sessions, shuffled and interleaved', setup_chunker_out_of_order),
+    Workload('state_tag_churn', 'features', 'State adds with rotating tags and remove-by-tag', setup_state_tag_churn),
+    Workload('broadcast_fanout', 'messages', 'server.broadcast to 20 local WebSocket clients', setup_broadcast_fanout),
+    Workload('stdin_readline', 'lines', 'piped stdin read one readline() at a time in the executor',
+             functools.partial(setup_stdin_reader, inputs.read_lines_executor, False)),
+    Workload('stdin_bulk', 'lines', 'piped stdin read in bulk blocks', functools.partial(setup_stdin_reader, inputs.read_lines_bulk, False)),
+    Workload('stdin_readline_handled', 'lines', 'stdin_readline, then parse, handler and State per line',
+             functools.partial(setup_stdin_reader, inputs.read_lines_executor, True)),
+    Workload('stdin_bulk_handled', 'lines', 'stdin_bulk, then parse, handler and State per line',
+             functools.partial(setup_stdin_reader, inputs.read_lines_bulk, True)),
+    Workload('logcat_filter', 'lines', 'logcat.parse_line on an unfiltered threadtime stream', setup_logcat_filter),
+    Workload('text_polylines', 'points', 'polylines formatted as text, parsed and handled', setup_text_polylines),
+    Workload('api_polylines', 'points', 'polylines through the Python API with float buffers', setup_api_polylines),
+    Workload('parse_polygons', 'lines', 'repeated polygon lines without the parse cache', functools.partial(setup_parse_polygons, 0)),
+    Workload('parse_polygons_cached', 'lines', 'repeated polygon lines with the parse cache',
+             functools.partial(setup_parse_polygons, parser.DEFAULT_CACHE_SIZE)),
+    Workload('errors_unthrottled', 'lines', 'invalid lines with direct, unthrottled diagnostics',
+             functools.partial(setup_invalid_lines, False, 0)),
+    Workload('errors_rate_limited', 'lines', 'invalid lines with buffered, rate-limited diagnostics',
+             functools.partial(setup_invalid_lines, True, diagnostics.DEFAULT_RATE_LIMIT)),
+    Workload('ring_binary', 'updates', '--ring position updates as binary records', functools.partial(setup_ring_input, False)),
+    Workload('ring_text', 'updates', '--ring position updates as text lines', functools.partial(setup_ring_input, True)),
+]
+
+
+def measure(workload: Workload, scale: float, repeat: int) -> Dict[str, object]:
+    case = workload.setup(scale)
+    try:
+        case.run()  # warm-up
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            case.run()
+            times.append(time.perf_counter() - start)
+    finally:
+        if case.close is not None:
+            case.close()
+    best = min(times)
+    return {
+        'unit': workload.unit,
+        'ops': case.ops,
+        'best_seconds': best,
+        'median_seconds': statistics.median(times),
+        'ops_per_sec': case.ops / best if best else 0.0,
+    }
+
+
+def environment() -> Dict[str, object]:
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = 'unknown'
+    return {
+        'commit': commit,
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+    }
+
+
+def compare(results: Dict[str, Dict], baseline: Dict[str, Dict], threshold: float) -> List[str]:
+    """Print the change against the baseline per workload; return the names that regressed."""
+    regressed = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None or base.get('ops') != result['ops']:
+            print(f"{name:>22}: no comparable baseline (different workload size)")
+            continue
+        change = (result['ops_per_sec'] / base['ops_per_sec'] - 1) * 100 if base['ops_per_sec'] else 0.0
+        flag = ''
+        if change < -threshold:
+            flag = '  REGRESSION'
+            regressed.append(name)
+        print(f"{name:>22}: {base['ops_per_sec']:>14,.0f} -> {result['ops_per_sec']:>14,.0f} {result['unit']}/sec ({change:+.1f}%){flag}")
+    return regressed
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    arg_parser.add_argument('--only', help='Comma-separated workloads to run (default: all): '
+                            + ', '.join(workload.name for workload in WORKLOADS))
+    arg_parser.add_argument('--scale', type=float, default=1.0, help='Workload size factor (default: 1)')
+    arg_parser.add_argument('--repeat', type=int, default=5, help='Timed runs per workload (default: 5)')
+    arg_parser.add_argument('--output', metavar='PATH', help='Write results as JSON')
+    arg_parser.add_argument('--compare', metavar='PATH', help='Compare with a results file written by --output')
+    arg_parser.add_argument('--threshold', type=float, default=10.0,
+                            help='Slowdown in percent that counts as a regression (default: 10)')
+    args = arg_parser.parse_args()
+
+    selected = WORKLOADS
+    if args.only:
+        names = set(args.only.split(','))
+        unknown = names - {workload.name for workload in WORKLOADS}
+        if unknown:
+            arg_parser.error(f"unknown workloads: {', '.join(sorted(unknown))}")
+        selected = [workload for workload in WORKLOADS if workload.name in names]
+
+    results = {}
+    for workload in selected:
+        result = measure(workload, args.scale, args.repeat)
+        results[workload.name] = result
+        print(f"{workload.name:>22}: {result['ops']} {workload.unit} in {result['best_seconds']:.3f}s "
+              f"(median {result['median_seconds']:.3f}s) = {result['ops_per_sec']:,.0f} {workload.unit}/sec")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'version': RESULTS_VERSION, 'environment': environment(), 'scale': args.scale,
+                       'repeat': args.repeat, 'results': results}, f, indent=2)
+            f.write('\n')
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print(f"Compared with {args.compare} (commit {baseline.get('environment', {}).get('commit', '?')}):")
+        regressed = compare(results, baseline.get('results', {}), args.threshold)
+        if regressed:
+            print(f"{len(regressed)} workload(s) slower than the baseline by more than {args.threshold:g}%")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,214 @@
+"""
+In-process Python API for producers that run in the same interpreter.
+
+Commands go straight to the command handlers with coordinates taken from Python
+sequences or float buffers, skipping text formatting and parsing.
+
+Example:
+    from mapcat import api
+
+    session = api.start(port=8080)           # or api.Session(state) inside mapcat
+    session.add_point((52.5, 13.4), color='red', label='Home')
+    with session.batch():
+        for track in tracks:
+            session.add_polyline(track, color='blue', tag='tracks')
+    session.remove(tag='tracks')
+"""
+import asyncio
+import json
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+from mapcat import server
+from mapcat.commands import COMMAND_HANDLERS
+from mapcat.state import State
+
+_pending_broadcasts: set = set()  # strong references until the broadcast tasks finish
+
+
+class Session:
+    """
+    Issue commands against a State and broadcast the results to browsers.
+
+    If the session is bound to an event loop (see start()), calls from other
+    threads are executed on that loop, so State is only ever touched from one
+    thread. Without a loop, commands update State and nothing is broadcast
+    unless an event loop is running in the calling thread.
+    """
+
+    def __init__(self, state: Optional[State] = None, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.state = state if state is not None else State()
+        self._loop = loop
+        self._batch: Optional[List[Dict[str, Any]]] = None
+
+    def add_point(self, coord, **params) -> Optional[str]:
+        """
+        Add a point. coord is a (lat, lng) pair.
+
+        Returns:
+            The feature ID, or None if the handler rejected the command (logged to stderr).
+
+        Raises:
+            ValueError: If the coordinate is malformed or out of range
+        """
+        message = self._execute('add-point', [_to_pair(coord)], params)
+        return message['id'] if message else None
+
+    def add_polyline(self, coords, **params) -> Optional[str]:
+        """
+        Add a polyline. coords is a sequence of (lat, lng) pairs or a flat float
+        buffer [lat0, lng0, lat1, lng1, ...] (array('d'), numpy array, memoryview).
+
+        Returns:
+            The feature ID, or None if the handler rejected the command.
+        """
+        message = self._execute('add-polyline', _to_coords(coords), params)
+        return message['id'] if message else None
+
+    def add_polygon(self, coords, **params) -> Optional[str]:
+        """Add a polygon; coords as for add_polyline. Returns the feature ID or None."""
+        message = self._execute('add-polygon', _to_coords(coords), params)
+        return message['id'] if message else None
+
+    def update_current_position(self, coord, **params) -> bool:
+        """Move the current position marker. Returns True on success."""
+        return self._execute('update-current-position', [_to_pair(coord)], params) is not None
+
+    def remove(self, id: Optional[str] = None, tag: Optional[str] = None) -> bool:
+        """Remove a feature by id, or all features with a tag. Returns True if anything was removed."""
+        params = {}
+        if id is not None:
+            params['id'] = id
+        if tag is not None:
+            params['tag'] = tag
+        return self._execute('remove', [], params) is not None
+
+    def clear(self) -> None:
+        """Remove all features."""
+        self._execute('clear', [], {})
+
+    @contextmanager
+    def batch(self) -> Iterator['Session']:
+        """
+        Collect the broadcasts of all commands in the block and send them as one
+        'batch' message when the block exits. Batches do not nest.
+        """
+        if self._batch is not None:
+            yield self
+            return
+        self._batch = []
+        try:
+            yield self
+        finally:
+            messages, self._batch = self._batch, None
+            if messages:
+                self._broadcast({'action': 'batch', 'messages': messages})
+
+    def _execute(self, cmd: str, coords: List[List[float]], params: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        if self._loop is not None and not self._on_loop():
+            # Run on the server loop so State is never mutated concurrently
+            async def run():
+                return self._execute(cmd, coords, params)
+            return asyncio.run_coroutine_threadsafe(run(), self._loop).result()
+
+        message = COMMAND_HANDLERS[cmd](self.state, {'cmd': cmd, 'coords': coords, 'params': params})
+        if message:
+            if self._batch is not None:
+                self._batch.append(message)
+            else:
+                self._broadcast(message)
+        return message
+
+    def _broadcast(self, message: Dict[str, Any]) -> None:
+        if self._loop is not None and not self._on_loop():
+            # A batch flushed in the caller's thread: send it from the server loop
+            asyncio.run_coroutine_threadsafe(server.broadcast(json.dumps(message)), self._loop).result()
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return  # no event loop, no connected browsers
+        task = loop.create_task(server.broadcast(json.dumps(message)))
+        _pending_broadcasts.add(task)
+        task.add_done_callback(_pending_broadcasts.discard)
+
+    def _on_loop(self) -> bool:
+        try:
+            return asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            return False
+
+
+def start(port: int = 8080, state: Optional[State] = None) -> Session:
+    """
+    Start the HTTP and WebSocket server in a background thread and return a
+    Session bound to it. The server runs until the process exits.
+
+    Args:
+        port: Port for both HTTP and WebSocket
+        state: Optional existing State to serve
+
+    Raises:
+        OSError: If the server cannot listen on the port (e.g. it is in use)
+    """
+    state = state if state is not None else State()
+    server.set_state_getter(lambda: state)
+    loop = asyncio.new_event_loop()
+    ready = threading.Event()
+    failure: List[BaseException] = []
+
+    def run():
+        asyncio.set_event_loop(loop)
+        try:
+            loop.run_until_complete(server.start_server(port))
+        except BaseException as e:
+            failure.append(e)
+            loop.close()
+            return
+        finally:
+            ready.set()  # never leave the caller waiting
+        loop.run_forever()
+
+    threading.Thread(target=run, name='mapcat-api', daemon=True).start()
+    ready.wait()
+    if failure:
+        raise failure[0]
+    return Session(state, loop)
+
+
+def _to_pair(coord) -> List[float]:
+    try:
+        lat, lng = coord
+        pair = [float(lat), float(lng)]
+    except (TypeError, ValueError):
+        raise ValueError(f"Expected a (lat, lng) pair, got {coord!r}")
+    _check_range(pair)
+    return pair
+
+
+def _to_coords(coords) -> List[List[float]]:
+    """Convert pairs or a flat float buffer into [[lat, lng], ...] with range checks."""
+    try:
+        view = memoryview(coords)
+    except TypeError:
+        view = None
+    if view is not None:
+        values = view.tolist()
+        if view.ndim == 1:
+            if len(values) % 2:
+                raise ValueError(f"Flat coordinate buffer needs an even number of values, got {len(values)}")
+            pairs = [[float(values[i]), float(values[i + 1])] for i in range(0, len(values), 2)]
+            for pair in pairs:
+                _check_range(pair)
+            return pairs
+        coords = values
+    return [_to_pair(coord) for coord in coords]
+
+
+def _check_range(pair: List[float]) -> None:
+    lat, lng = pair
+    if not (-90 <= lat <= 90):
+        raise ValueError(f"Latitude out of range: {lat}")
+    if not (-180 <= lng <= 180):
+        raise ValueError(f"Longitude out of range: {lng}")
@@ -0,0 +1,166 @@
+"""
+Record raw input lines to a capture file and replay them.
+
+Capture format (text, gzip-compressed when the path ends with .gz):
+    #mapcat-capture 1
+    @<index> <source tag>              declares a source, before its first record
+    <delta_us> <index> <raw line>      one record per input line
+
+delta_us is the monotonic time since the previous record, in microseconds.
+"""
+import asyncio
+import gzip
+import time
+from typing import Dict, List, Optional
+
+from mapcat import diagnostics
+from mapcat.inputs import LineSink
+
+CAPTURE_HEADER = '#mapcat-capture 1'
+FLUSH_INTERVAL = 1.0  # seconds between flushes of the capture file
+MAX_REPLAY_BATCH = 1024  # lines handed to the sink at once when replaying
+
+
+class CaptureError(Exception):
+    """Raised when a capture file cannot be opened or is malformed."""
+
+
+class ReplayStats:
+    """Counters reported after a replay."""
+
+    def __init__(self):
+        self.lines = 0
+        self.seconds = 0.0
+
+    @property
+    def lines_per_sec(self) -> float:
+        return self.lines / self.seconds if self.seconds else 0.0
+
+
+class Recorder:
+    """Append raw input lines with monotonic timestamps to a capture file."""
+
+    def __init__(self, path: str):
+        try:
+            if path.endswith('.gz'):
+                self._file = gzip.open(path, 'wt', encoding='utf-8', newline='\n', compresslevel=6)
+            else:
+                self._file = open(path, 'w', encoding='utf-8', newline='\n', buffering=1024 * 1024)
+        except OSError as e:
+            raise CaptureError(f"Cannot open capture file {path}: {e}")
+        self._file.write(CAPTURE_HEADER + '\n')
+        self._sources: Dict[str, int] = {}
+        self._last_ns = time.monotonic_ns()
+        self._last_flush = time.monotonic()
+
+    def record(self, source: str, lines: List[str]) -> None:
+        """Record a batch of lines received together from one source."""
+        index = self._sources.get(source)
+        if index is None:
+            index = self._sources[source] = len(self._sources)
+            self._file.write(f"@{index} {source}\n")
+        now_ns = time.monotonic_ns()
+        delta_us = (now_ns - self._last_ns) // 1000
+        self._last_ns = now_ns
+        # The first line carries the batch delay, the rest arrived at the same time
+        lines = [line.rstrip('\n') for line in lines]
+        records = [f"{delta_us} {index} {lines[0]}\n"]
+        records += [f"0 {index} {line}\n" for line in lines[1:]]
+        self._file.write(''.join(records))
+        if time.monotonic() - self._last_flush >= FLUSH_INTERVAL:
+            self.flush()
+
+    def wrap(self, sink: LineSink) -> LineSink:
+        """Return a sink that records every batch before passing it on."""
+        async def recording_sink(source, lines):
+            if lines:
+                self.record(source, lines)
+            await sink(source, lines)
+        return recording_sink
+
+    def flush(self) -> None:
+        self._file.flush()
+        self._last_flush = time.monotonic()
+
+    def close(self) -> None:
+        self._file.close()
+
+
+async def run_replay(path: str, sink: LineSink, speed: Optional[float] = 1.0) -> ReplayStats:
+    """
+    Feed a capture file to sink, preserving sources and (scaled) timing.
+
+    Args:
+        path: Capture file
+        sink: Coroutine receiving (source, lines)
+        speed: Time scale (2.0 replays twice as fast); None replays at max speed
+
+    Returns:
+        ReplayStats with line count and elapsed time.
+
+    Raises:
+        CaptureError: If the file cannot be opened or is not a capture file
+    """
+    # newline='\n' on both sides: a '\r' inside a line is content, not a record separator
+    opener = gzip.open if path.endswith('.gz') else open
+    try:
+        f = opener(path, 'rt', encoding='utf-8', newline='\n')
+    except OSError as e:
+        raise CaptureError(f"Cannot open capture file {path}: {e}")
+
+    loop = asyncio.get_running_loop()
+    stats = ReplayStats()
+    sources: Dict[int, str] = {}
+    batch: List[str] = []
+    batch_source = None
+    start = loop.time()
+    due = 0.0  # seconds since start at which the current record is due (unscaled)
+    with f:
+        if f.readline().rstrip('\n') != CAPTURE_HEADER:
+            raise CaptureError(f"{path} is not a mapcat capture file")
+        for number, record in enumerate(_records(f), start=2):
+            record = record.rstrip('\n')
+            if record.startswith('@'):
+                index, _, source = record[1:].partition(' ')
+                try:
+                    sources[int(index)] = source
+                except ValueError:
+                    _log_error(f"{path}:{number}: malformed source declaration, skipping")
+                continue
+            try:
+                delta_text, index_text, line = record.split(' ', 2)
+                delta_us = int(delta_text)
+                source = sources[int(index_text)]
+            except (ValueError, KeyError):
+                _log_error(f"{path}:{number}: malformed record, skipping")
+                continue
+
+            due += delta_us / 1_000_000
+            late = speed is None or delta_us == 0 or loop.time() - start >= due / speed
+            if batch and (source != batch_source or not late or len(batch) >= MAX_REPLAY_BATCH):
+                await sink(batch_source, batch)
+                stats.lines += len(batch)
+                batch = []
+                await asyncio.sleep(0)  # let WebSocket traffic through between batches
+            if not late:
+                await asyncio.sleep(start + due / speed - loop.time())
+            batch_source = source
+            batch.append(line)
+        if batch:
+            await sink(batch_source, batch)
+            stats.lines += len(batch)
+    stats.seconds = loop.time() - start
+    return stats
+
+
+def _records(f):
+    """Iterate capture records, stopping quietly at a truncated gzip tail (killed recorder)."""
+    try:
+        yield from f
+    except EOFError:
+        _log_error("capture file is truncated, replaying the records read so far")
+
+
+def _log_error(message: str):
+    """Log error to stderr in red."""
+    diagnostics.error("replay", message)
@@ -9,63 +9,125 @@ Protocol:
     begin id=<id>
     <id> <content> seq=<N>
     commit id=<id> total=<N>
+
+Self-describing protocol (v2), no begin/commit lines:
+    chunk <id> <seq>/<total> <content>
+
+A v2 session opens implicitly on its first chunk and is executed as soon as
+all <total> chunks are present.
+
+Session ids are namespaced per input source: SourceChunkers keeps one Chunker
+(with its own MAX_SESSIONS budget) per source tag, so concurrent producers can
+neither collide on ids nor evict each other's sessions.
+
+Compressed payload: if the reassembled content starts with 'z:', the rest is a
+base64-encoded zlib (or raw deflate) stream holding the command text.
 """
-import sys
-from typing import Optional, Dict, Any
+import base64
+import binascii
+import zlib
+from typing import Optional, Dict, List, Any, Tuple
 
-# ANSI color codes
-RED = '\033[91m'
-YELLOW = '\033[93m'
-RESET = '\033[0m'
+from mapcat import diagnostics
 
 
 class _PendingSession:
-    def __init__(self, session_id: str):
+    def __init__(self, session_id: str, total: Optional[int] = None):
         self.session_id = session_id
+        self.total = total  # known up front for v2 sessions, None for begin/commit sessions
         self.chunks: Dict[int, str] = {}  # seq -> raw content (seq= param already removed)
 
 
-MAX_SESSIONS = 100
+MAX_SESSIONS = 100  # per source
+MAX_SOURCES = 256
 MAX_TOTAL_CHUNKS = 1000
+MAX_DECOMPRESSED_BYTES = 64 * 1024 * 1024
+
+COMPRESSED_PREFIX = 'z:'
+_DECODE_BLOCK = 64 * 1024  # base64 characters per decompression step (multiple of 4)
 
 
 class Chunker:
-    def __init__(self):
+    def __init__(self, source: str = ''):
+        self.source = source
         self._sessions: Dict[str, _PendingSession] = {}
         self._session_order: list = []  # insertion-order tracking for FIFO eviction
 
-    def open_session(self, session_id: str) -> None:
+    def open_session(self, session_id: str, total: Optional[int] = None) -> None:
         """Open a new pending session. Warns and replaces if one already exists."""
         if session_id in self._sessions:
-            _log_warning(f"Duplicate begin for id='{session_id}', restarting session")
+            _log_warning(f"Duplicate begin for id='{session_id}', restarting session", self.source)
             if session_id in self._session_order:
                 self._session_order.remove(session_id)
         elif len(self._sessions) >= MAX_SESSIONS:
             evicted = self._session_order.pop(0)
             del self._sessions[evicted]
-            _log_warning(f"Max sessions ({MAX_SESSIONS}) reached, evicted oldest session id='{evicted}'")
-        self._sessions[session_id] = _PendingSession(session_id)
+            _log_warning(f"Max sessions ({MAX_SESSIONS}) reached, evicted oldest session id='{evicted}'", self.source)
+        self._sessions[session_id] = _PendingSession(session_id, total)
         self._session_order.append(session_id)
 
     def has_session(self, session_id: str) -> bool:
         return session_id in self._sessions
 
+    def pending_stats(self) -> Tuple[int, int]:
+        """Return (open sessions, buffered content characters)."""
+        buffered = sum(len(chunk) for session in self._sessions.values() for chunk in session.chunks.values())
+        return len(self._sessions), buffered
+
     def add_chunk(self, session_id: str, seq: int, content: str) -> None:
         """Add a chunk to the pending session. Logs error if session doesn't exist."""
         if seq < 1:
-            _log_error(f"Invalid seq={seq} for id='{session_id}': seq must be >= 1, ignoring chunk")
+            _log_error(f"Invalid seq={seq} for id='{session_id}': seq must be >= 1, ignoring chunk", self.source)
             return
         if session_id not in self._sessions:
-            _log_error(f"Chunk received for unknown session id='{session_id}' (missing begin?)")
+            _log_error(f"Chunk received for unknown session id='{session_id}' (missing begin?)", self.source)
             return
         session = self._sessions[session_id]
         if len(session.chunks) >= MAX_TOTAL_CHUNKS:
-            _log_error(f"Session id='{session_id}': chunk count exceeds limit of {MAX_TOTAL_CHUNKS}, ignoring chunk")
+            _log_error(f"Session id='{session_id}': chunk count exceeds limit of {MAX_TOTAL_CHUNKS}, ignoring chunk", self.source)
             return
         if seq in session.chunks:
-            _log_warning(f"Duplicate chunk seq={seq} for id='{session_id}', overwriting")
+            _log_warning(f"Duplicate chunk seq={seq} for id='{session_id}', overwriting", self.source)
+        session.chunks[seq] = content
+
+    def add_chunk_v2(self, session_id: str, seq: int, total: int, content: str) -> Optional[Dict[str, Any]]:
+        """
+        Add a self-describing chunk, opening the session implicitly if needed.
+
+        The session is committed automatically once all chunks 1..total are present.
+
+        Args:
+            session_id: The session ID from the chunk header
+            seq: Chunk number (1-based)
+            total: Total number of chunks in the session
+            content: Raw chunk content
+
+        Returns:
+            Parsed command dict when this chunk completes the session, otherwise None.
+        """
+        if total < 1 or total > MAX_TOTAL_CHUNKS:
+            _log_error(f"Invalid total={total} for id='{session_id}': must be 1..{MAX_TOTAL_CHUNKS}, ignoring chunk", self.source)
+            return None
+        if seq < 1 or seq > total:
+            _log_error(f"Invalid seq={seq} for id='{session_id}': must be 1..{total}, ignoring chunk", self.source)
+            return None
+
+        session = self._sessions.get(session_id)
+        if session is None:
+            self.open_session(session_id, total)
+            session = self._sessions[session_id]
+        elif session.total != total:
+            _log_error(f"Chunk for id='{session_id}' has total={total}, session expects total={session.total}, ignoring chunk", self.source)
+            return None
+
+        if seq in session.chunks:
+            _log_warning(f"Duplicate chunk seq={seq} for id='{session_id}', overwriting", self.source)
         session.chunks[seq] = content
 
+        if len(session.chunks) < total:
+            return None
+        return self.commit_session(session_id, total)
+
     def commit_session(self, session_id: str, total: int) -> Optional[Dict[str, Any]]:
         """
         Commit a session: concatenate chunks in seq order and parse the result.
@@ -81,7 +143,7 @@ class Chunker:
         from mapcat import parser
 
         if session_id not in self._sessions:
-            _log_error(f"commit received for unknown session id='{session_id}' (missing begin?)")
+            _log_error(f"commit received for unknown session id='{session_id}' (missing begin?)", self.source)
             return None
 
         session = self._sessions.pop(session_id)
@@ -89,11 +151,11 @@ class Chunker:
             self._session_order.remove(session_id)
 
         if total > MAX_TOTAL_CHUNKS:
-            _log_error(f"Session id='{session_id}': total={total} exceeds limit of {MAX_TOTAL_CHUNKS}, rejecting")
+            _log_error(f"Session id='{session_id}': total={total} exceeds limit of {MAX_TOTAL_CHUNKS}, rejecting", self.source)
             return None
 
         if len(session.chunks) > MAX_TOTAL_CHUNKS:
-            _log_error(f"Session id='{session_id}': {len(session.chunks)} chunks received, exceeds limit of {MAX_TOTAL_CHUNKS}, rejecting")
+            _log_error(f"Session id='{session_id}': {len(session.chunks)} chunks received, exceeds limit of {MAX_TOTAL_CHUNKS}, rejecting", self.source)
             return None
 
         if total > 0:
@@ -101,27 +163,130 @@ class Chunker:
             if missing:
                 _log_warning(
                     f"Session id='{session_id}': missing chunks {missing}, "
-                    f"executing with {len(session.chunks)} of {total} chunks"
+                    f"executing with {len(session.chunks)} of {total} chunks",
+                    self.source,
                 )
 
         if not session.chunks:
-            _log_error(f"Session id='{session_id}': no chunks received, nothing to execute")
+            _log_error(f"Session id='{session_id}': no chunks received, nothing to execute", self.source)
             return None
 
         # Concatenate chunks in seq order — split may occur anywhere, even mid-coordinate
         sorted_seqs = sorted(session.chunks.keys())
         combined = "".join(session.chunks[seq] for seq in sorted_seqs)
 
+        if combined.startswith(COMPRESSED_PREFIX):
+            combined = _decompress_payload(session_id, combined[len(COMPRESSED_PREFIX):], self.source)
+            if combined is None:
+                return None
+
         parsed = parser.parse_command(combined)
         if parsed is None:
-            _log_error(f"Session id='{session_id}': failed to parse reassembled command")
+            _log_error(f"Session id='{session_id}': failed to parse reassembled command", self.source)
         return parsed
 
 
-def _log_error(message: str):
-    print(f"{RED}FAIL: chunker{RESET}", file=sys.stderr)
-    print(f"{RED}FAIL: {message}{RESET}", file=sys.stderr)
+class SourceChunkers:
+    """
+    One Chunker per input source, so each producer gets its own session namespace
+    and its own MAX_SESSIONS budget.
+
+    At most MAX_SOURCES sources are tracked; the least recently active one is
+    dropped (with its pending sessions) when a new source appears beyond that.
+    """
+
+    def __init__(self):
+        self._chunkers: Dict[str, Chunker] = {}  # source -> Chunker, least recently active first
+
+    def for_source(self, source: str) -> Chunker:
+        """Return the Chunker for the given source tag, creating it on first use."""
+        chunker = self._chunkers.pop(source, None)
+        if chunker is None:
+            if len(self._chunkers) >= MAX_SOURCES:
+                evicted = next(iter(self._chunkers))
+                pending = len(self._chunkers.pop(evicted)._sessions)
+                _log_warning(f"Max sources ({MAX_SOURCES}) reached, dropped source '{evicted}' with {pending} pending sessions")
+            chunker = Chunker(source)
+        self._chunkers[source] = chunker  # re-insert to mark as most recently active
+        return chunker
+
+    def sources(self) -> List[str]:
+        """Return the tracked source tags."""
+        return list(self._chunkers)
+
+    def pending_stats(self) -> Tuple[int, int]:
+        """Return (open sessions, buffered content characters) over all sources."""
+        sessions = buffered = 0
+        for chunker in self._chunkers.values():
+            chunker_sessions, chunker_buffered = chunker.pending_stats()
+            sessions += chunker_sessions
+            buffered += chunker_buffered
+        return sessions, buffered
+
+
+def _decompress_payload(session_id: str, payload: str, source: str = '') -> Optional[str]:
+    """
+    Decode a base64 zlib/deflate payload into command text.
+
+    The payload is decoded and inflated block by block, so only one block of
+    compressed bytes is alive at a time and output is capped at MAX_DECOMPRESSED_BYTES.
+
+    Returns:
+        The decompressed command string, or None on error.
+    """
+    payload = "".join(payload.split())  # tolerate whitespace introduced by chunking
+    if len(payload) % 4:
+        _log_error(f"Session id='{session_id}': compressed payload is not valid base64 (length {len(payload)})", source)
+        return None
+
+    try:
+        head = base64.b64decode(payload[:4], validate=True)
+    except binascii.Error:
+        _log_error(f"Session id='{session_id}': compressed payload is not valid base64", source)
+        return None
+    # zlib streams start with a CMF/FLG pair divisible by 31; anything else is raw deflate
+    is_zlib = len(head) >= 2 and head[0] & 0x0F == 8 and (head[0] << 8 | head[1]) % 31 == 0
+    inflater = zlib.decompressobj(zlib.MAX_WBITS if is_zlib else -zlib.MAX_WBITS)
+
+    out = []
+    produced = 0
+    try:
+        for start in range(0, len(payload), _DECODE_BLOCK):
+            data = base64.b64decode(payload[start:start + _DECODE_BLOCK], validate=True)
+            while data:
+                piece = inflater.decompress(data, MAX_DECOMPRESSED_BYTES - produced + 1)
+                produced += len(piece)
+                if produced > MAX_DECOMPRESSED_BYTES:
+                    _log_error(f"Session id='{session_id}': decompressed payload exceeds limit of {MAX_DECOMPRESSED_BYTES} bytes, rejecting", source)
+                    return None
+                out.append(piece)
+                data = inflater.unconsumed_tail
+        out.append(inflater.flush())
+    except binascii.Error:
+        _log_error(f"Session id='{session_id}': compressed payload is not valid base64", source)
+        return None
+    except zlib.error as e:
+        _log_error(f"Session id='{session_id}': failed to decompress payload: {e}", source)
+        return None
+
+    if not inflater.eof:
+        _log_error(f"Session id='{session_id}': compressed payload is truncated", source)
+        return None
+
+    try:
+        return b"".join(out).decode('utf-8')
+    except UnicodeDecodeError:
+        _log_error(f"Session id='{session_id}': decompressed payload is not valid UTF-8", source)
+        return None
+
+
+def _log_error(message: str, source: str = ''):
+    diagnostics.error("chunker", message, _log_name(source))
+
+
+def _log_warning(message: str, source: str = ''):
+    diagnostics.warning("chunker", message, _log_name(source))
 
 
-def _log_warning(message: str):
-    print(f"{YELLOW}WARN: chunker: {message}{RESET}", file=sys.stderr)
+def _log_name(source: str) -> str:
+    return f"chunker[{source}]" if source else "chunker"
@@ -1,14 +1,11 @@
 """
 Command handlers for geospatial features.
 """
-import sys
 from typing import Optional, Dict, Any
+from mapcat import diagnostics, server, stats
+from mapcat.schema import COMMAND_SCHEMAS, VALIDATORS, format_help
 from mapcat.state import State
 
-# ANSI color codes
-RED = '\033[91m'
-RESET = '\033[0m'
-
 
 def handle_add_point(state: State, parsed_cmd: Dict[str, Any]) -> Optional[Dict[str, Any]]:
     """
@@ -21,50 +18,7 @@ def handle_add_point(state: State, parsed_cmd: Dict[str, Any]) -> Optional[Dict[
     Returns:
         Broadcast message dict or None on error
     """
-    # Validate: exactly 1 coordinate required
-    if len(parsed_cmd['coords']) != 1:
-        _log_error("add-point", f"add-point requires exactly 1 coordinate, got {len(parsed_cmd['coords'])}", parsed_cmd)
-        return None
-    
-    user_id = parsed_cmd['params'].get('id')
-    
-    # Apply defaults for parameters
-    params = parsed_cmd['params'].copy()
-    if 'color' not in params:
-        params['color'] = '#007cff'
-    if 'opacity' not in params:
-        params['opacity'] = 1.0
-    else:
-        params['opacity'] = float(params['opacity'])
-    if 'radius' not in params:
-        params['radius'] = 4
-    else:
-        params['radius'] = int(params['radius'])
-    if 'border' not in params:
-        params['border'] = 2
-    else:
-        params['border'] = int(params['border'])
-    if 'zorder' not in params:
-        params['zorder'] = 0
-    else:
-        try:
-            params['zorder'] = int(params['zorder'])
-        except (ValueError, TypeError):
-            _log_error("add-point", f"invalid zorder value: {params['zorder']!r}", parsed_cmd)
-            return None
-
-    try:
-        feature_id = state.add_feature('point', parsed_cmd['coords'], params, feature_id=user_id)
-        return {
-            'action': 'add',
-            'id': feature_id,
-            'type': 'point',
-            'coords': parsed_cmd['coords'][0],  # Single point [lat, lng]
-            'params': params
-        }
-    except ValueError as e:
-        _log_error("add-point", str(e), parsed_cmd)
-        return None
+    return _add_feature(state, 'add-point', parsed_cmd)
 
 
 def handle_add_polyline(state: State, parsed_cmd: Dict[str, Any]) -> Optional[Dict[str, Any]]:
@@ -78,54 +32,7 @@ def handle_add_polyline(state: State, parsed_cmd: Dict[str, Any]) -> Optional[Di
     Returns:
         Broadcast message dict or None on error
     """
-    # Validate: at least 2 coordinates required
-    if len(parsed_cmd['coords']) < 2:
-        _log_error("add-polyline", f"add-polyline requires at least 2 coordinates, got {len(parsed_cmd['coords'])}", parsed_cmd)
-        return None
-    
-    user_id = parsed_cmd['params'].get('id')
-    
-    # Apply defaults for parameters
-    params = parsed_cmd['params'].copy()
-    if 'color' not in params:
-        params['color'] = '#007cff'
-    if 'opacity' not in params:
-        params['opacity'] = 1.0
-    else:
-        params['opacity'] = float(params['opacity'])
-    if 'width' not in params:
-        params['width'] = 2
-    else:
-        params['width'] = int(params['width'])
-    if 'markers' not in params:
-        params['markers'] = 0
-    else:
-        params['markers'] = int(params['markers'])
-    if 'markerBorder' not in params:
-        params['markerBorder'] = 2
-    else:
-        params['markerBorder'] = int(params['markerBorder'])
-    if 'zorder' not in params:
-        params['zorder'] = 0
-    else:
-        try:
-            params['zorder'] = int(params['zorder'])
-        except (ValueError, TypeError):
-            _log_error("add-polyline", f"invalid zorder value: {params['zorder']!r}", parsed_cmd)
-            return None
-
-    try:
-        feature_id = state.add_feature('polyline', parsed_cmd['coords'], params, feature_id=user_id)
-        return {
-            'action': 'add',
-            'id': feature_id,
-            'type': 'polyline',
-            'coords': parsed_cmd['coords'],  # Array of points
-            'params': params
-        }
-    except ValueError as e:
-        _log_error("add-polyline", str(e), parsed_cmd)
-        return None
+    return _add_feature(state, 'add-polyline', parsed_cmd)
 
 
 def handle_add_polygon(state: State, parsed_cmd: Dict[str, Any]) -> Optional[Dict[str, Any]]:
@@ -139,46 +46,7 @@ def handle_add_polygon(state: State, parsed_cmd: Dict[str, Any]) -> Optional[Dic
     Returns:
         Broadcast message dict or None on error
     """
-    # Validate: at least 3 coordinates required
-    if len(parsed_cmd['coords']) < 3:
-        _log_error("add-polygon", f"add-polygon requires at least 3 coordinates, got {len(parsed_cmd['coords'])}", parsed_cmd)
-        return None
-    
-    user_id = parsed_cmd['params'].get('id')
-    
-    # Apply defaults for parameters
-    params = parsed_cmd['params'].copy()
-    if 'color' not in params:
-        params['color'] = '#007cff'
-    if 'opacity' not in params:
-        params['opacity'] = 0.3
-    else:
-        params['opacity'] = float(params['opacity'])
-    if 'border' not in params:
-        params['border'] = 2
-    else:
-        params['border'] = int(params['border'])
-    if 'zorder' not in params:
-        params['zorder'] = 0
-    else:
-        try:
-            params['zorder'] = int(params['zorder'])
-        except (ValueError, TypeError):
-            _log_error("add-polygon", f"invalid zorder value: {params['zorder']!r}", parsed_cmd)
-            return None
-
-    try:
-        feature_id = state.add_feature('polygon', parsed_cmd['coords'], params, feature_id=user_id)
-        return {
-            'action': 'add',
-            'id': feature_id,
-            'type': 'polygon',
-            'coords': parsed_cmd['coords'],  # Array of points
-            'params': params
-        }
-    except ValueError as e:
-        _log_error("add-polygon", str(e), parsed_cmd)
-        return None
+    return _add_feature(state, 'add-polygon', parsed_cmd)
 
 
 def handle_remove(state: State, parsed_cmd: Dict[str, Any]) -> Optional[Dict[str, Any]]:
@@ -192,16 +60,11 @@ def handle_remove(state: State, parsed_cmd: Dict[str, Any]) -> Optional[Dict[str
     Returns:
         Broadcast message dict or None on error
     """
-    feature_id = parsed_cmd['params'].get('id')
-    tag = parsed_cmd['params'].get('tag')
-    
-    if not feature_id and not tag:
-        _log_error("remove", "remove command requires either id or tag parameter", parsed_cmd)
-        return None
-    
-    if feature_id and tag:
-        _log_error("remove", "remove command accepts either id or tag, not both", parsed_cmd)
+    params = _validate('remove', parsed_cmd)
+    if params is None:
         return None
+    feature_id = params.get('id')
+    tag = params.get('tag')
     
     if feature_id:
         # Remove by ID
@@ -256,18 +119,73 @@ def handle_update_current_position(state: State, parsed_cmd: Dict[str, Any]) ->
     Returns:
         Broadcast message dict or None on error
     """
-    # Validate: exactly 1 coordinate required
-    if len(parsed_cmd['coords']) != 1:
-        _log_error("update-current-position", f"update-current-position requires exactly 1 coordinate, got {len(parsed_cmd['coords'])}", parsed_cmd)
+    params = _validate('update-current-position', parsed_cmd)
+    if params is None:
         return None
     
     return {
         'action': 'update-current-position',
         'coords': parsed_cmd['coords'][0],  # [lat, lng]
-        'params': parsed_cmd['params']
+        'params': params
     }
 
 
+def handle_stats(state: State, parsed_cmd: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Handle stats command - shows feature counts, memory use and queue sizes.
+
+    Args:
+        state: The State instance
+        parsed_cmd: Parsed command dict
+
+    Returns:
+        None (prints to stdout instead of broadcasting)
+    """
+    print(stats.format_stats(stats.collect(state)))
+    return None
+
+
+def handle_browser_stats(state: State, parsed_cmd: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Handle browser-stats command - shows the render performance reported by each browser.
+
+    Args:
+        state: The State instance
+        parsed_cmd: Parsed command dict
+
+    Returns:
+        None (prints to stdout instead of broadcasting)
+    """
+    print(format_browser_stats(server.browser_stats()))
+    return None
+
+
+def format_browser_stats(summaries) -> str:
+    """Render server.browser_stats() as a table, one row per browser."""
+    if not summaries:
+        return "No browser performance reports yet (browsers report every 5 seconds)"
+
+    def number(values, key, digits=1, scale=1):
+        return f"{values[key] * scale:.{digits}f}" if key in values else '-'
+
+    rows = [('client', 'fps', 'layers', 'msg/s', 'decode avg/max ms', 'add avg/max ms', 'long tasks')]
+    for client, client_stats in summaries:
+        rows.append((
+            client,
+            number(client_stats, 'fps'),
+            number(client_stats, 'layers', 0),
+            number(client_stats, 'messages_per_sec'),
+            f"{number(client_stats, 'decode_avg_ms', 2)}/{number(client_stats, 'decode_max_ms', 2)}",
+            f"{number(client_stats, 'add_avg_ms', 2)}/{number(client_stats, 'add_max_ms', 2)}",
+            f"{number(client_stats, 'long_tasks', 0)} ({number(client_stats, 'long_task_ratio', 0, 100)}% busy)",
+        ))
+    widths = [max(len(row[column]) for row in rows) for column in range(len(rows[0]))]
+    return '\n'.join(
+        '  '.join([row[0].ljust(widths[0])] + [cell.rjust(width) for cell, width in zip(row[1:], widths[1:])])
+        for row in rows
+    )
+
+
 def handle_help(state: State, parsed_cmd: Dict[str, Any]) -> Optional[Dict[str, Any]]:
     """
     Handle help command - shows available commands and parameters.
@@ -279,67 +197,41 @@ def handle_help(state: State, parsed_cmd: Dict[str, Any]) -> Optional[Dict[str,
     Returns:
         None (prints to stdout instead of broadcasting)
     """
-    help_text = """
-Available Commands:
-===================
-
-add-point (lat,lng) [parameters]
-  Add a point marker to the map
-  Parameters:
-    id=<id>           - Unique identifier (auto-generated if not provided)
-    tag=<tag>         - Tag for grouping features
-    color=<color>     - CSS color (named: red, blue; hex: #FF5733; default: #007cff)
-    label=<text>      - Label text (use quotes for spaces: label="My Point")
-    opacity=<0.0-1.0> - Transparency (default: 1.0)
-    radius=<pixels>   - Circle radius in pixels (default: 4)
-    border=<pixels>   - Border width in pixels (default: 2)
-    zorder=<int>      - Drawing order (default: 0; lower = behind; safe range: -400 to +600)
-  Example: add-point (52.5,13.4) color=red label="Home" radius=6 border=3
-
-add-polyline (lat,lng);(lat,lng);... [parameters]
-  Add a line connecting multiple points
-  Parameters:
-    id=<id>           - Unique identifier
-    tag=<tag>         - Tag for grouping
-    color=<color>     - Line color (default: #007cff)
-    width=<pixels>    - Line width in pixels (default: 2)
-    opacity=<0.0-1.0> - Transparency (default: 1.0)
-    markers=<pixels>  - Circle radius at points (0=off, default: 0)
-    label=<text>      - Label text
-    zorder=<int>      - Drawing order (default: 0; lower = behind; safe range: -400 to +600)
-  Example: add-polyline (52.5,13.4);(52.6,13.5) color=blue width=5
-
-add-polygon (lat,lng);(lat,lng);... [parameters]
-  Add a filled polygon area
-  Parameters:
-    id=<id>           - Unique identifier
-    tag=<tag>         - Tag for grouping
-    color=<color>     - Fill and border color (default: #007cff)
-    opacity=<0.0-1.0> - Fill transparency (default: 1.0)
-    label=<text>      - Label text
-    zorder=<int>      - Drawing order (default: 0; lower = behind; safe range: -400 to +600)
-  Example: add-polygon (52.1,13.1);(52.2,13.2);(52.15,13.15) color=green opacity=0.5
-
-update-current-position (lat,lng)
-  Update the current position marker (blue chevron)
-  Example: update-current-position (52.5,13.4)
-
-remove id=<id>
-  Remove a feature by its ID
-  Example: remove id=my-point
-
-remove tag=<tag>
-  Remove all features with a specific tag
-  Example: remove tag=traffic
-
-clear
-  Remove all features from the map
-  Example: clear
-
-help
-  Show this help message
-
-begin id=<id>
+    print(HELP_TEXT)
+    return None
+
+
+def _add_feature(state: State, cmd: str, parsed_cmd: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Validate an add-* command against its schema and store the feature."""
+    params = _validate(cmd, parsed_cmd)
+    if params is None:
+        return None
+    feature_type = COMMAND_SCHEMAS[cmd].feature_type
+    coords = parsed_cmd['coords']
+
+    try:
+        feature_id = state.add_feature(feature_type, coords, params, feature_id=params.get('id'))
+        return {
+            'action': 'add',
+            'id': feature_id,
+            'type': feature_type,
+            'coords': coords[0] if feature_type == 'point' else coords,  # Single point [lat, lng] or array of points
+            'params': params
+        }
+    except ValueError as e:
+        _log_error(cmd, str(e), parsed_cmd)
+        return None
+
+
+def _validate(cmd: str, parsed_cmd: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Run the compiled schema validator; log and return None on failure."""
+    params, error = VALIDATORS[cmd](parsed_cmd)
+    if error:
+        _log_error(cmd, error, parsed_cmd)
+    return params
+
+
+_PROTOCOL_HELP = """begin id=<id>
   Open a chunked session for assembling a long command split across multiple log lines
   Use when a command is too long for a single log line (e.g. Android Log.d limit ~4000 chars)
 
@@ -355,6 +247,18 @@ commit id=<id> total=<N>
   total: total number of expected chunks (used to warn about missing chunks)
   Example: commit id=abc123 total=2
 
+chunk <id> <seq>/<total> <content>
+  Self-describing chunk: no begin/commit lines needed
+  The session opens with its first chunk and executes once all <total> chunks arrived
+  Content is everything after the single space following <seq>/<total>, kept verbatim
+  Example: chunk abc123 1/2 add-polyline (52.5,13.4);(52.6,1
+           chunk abc123 2/2 3.5);(52.7,13.6) color=blue
+
+Compressed chunks
+  If the reassembled content of a session starts with z:, the rest is the command
+  compressed with zlib (or raw deflate) and base64-encoded
+  Example: chunk abc123 1/1 z:eJxLTEnRLcjPzCtR0DA10jPVMTTWM9EEAEiyBa4=
+
 Tips:
 -----
 - Coordinates: (latitude,longitude) - e.g., (52.5,13.4)
@@ -369,8 +273,12 @@ Tips:
 - Auto-focus and Follow Position can be toggled via web UI buttons
 - Map can be cleared via web UI Clear button
 """
-    print(help_text)
-    return None
+
+HELP_TEXT = (
+    "\nAvailable Commands:\n===================\n\n"
+    + "\n\n".join(format_help(schema) for schema in COMMAND_SCHEMAS.values())
+    + "\n\n" + _PROTOCOL_HELP
+)
 
 
 # Command registry
@@ -381,6 +289,8 @@ COMMAND_HANDLERS = {
     'remove': handle_remove,
     'clear': handle_clear,
     'update-current-position': handle_update_current_position,
+    'stats': handle_stats,
+    'browser-stats': handle_browser_stats,
     'help': handle_help,
 }
 
@@ -407,7 +317,6 @@ def _log_error(cmd: str, message: str, parsed_cmd: Dict[str, Any] = None):
         else:
             params_preview = params
         
-        print(f"{RED}FAIL: {cmd} {params_preview}{RESET}", file=sys.stderr)
+        diagnostics.error(cmd, message, f"{cmd} {params_preview}")
     else:
-        print(f"{RED}FAIL: {cmd}{RESET}", file=sys.stderr)
-    print(f"{RED}FAIL: {message}{RESET}", file=sys.stderr)
+        diagnostics.error(cmd, message)
@@ -0,0 +1,231 @@
+"""
+Diagnostics output: FAIL/WARN lines on stderr and --verbose OK lines on stdout.
+
+By default every record is written immediately. configure() switches to the
+mode mapcat runs in: records are queued and written by a background thread in
+one write per flush, and each category (parse, chunker, add-point, ...) may
+print at most a number of records per second. The rest are counted and
+summarized once per second:
+    FAIL: parse x1532 more in last 1s (last: Invalid command)
+
+With json=True every record is one JSON object per line, for log shipping:
+    {"time": 1760872496.1, "level": "error", "category": "parse", "header": "parse", "message": "..."}
+"""
+import json
+import sys
+import threading
+import time
+from typing import Callable, Dict, List, Optional, TextIO, Tuple
+
+# ANSI color codes
+RED = '\033[91m'
+GREEN = '\033[92m'
+YELLOW = '\033[93m'
+RESET = '\033[0m'
+
+DEFAULT_RATE_LIMIT = 20  # records per category per window
+RATE_WINDOW = 1.0  # seconds
+FLUSH_INTERVAL = 0.1  # seconds between writes of queued records
+
+ERROR = 'error'
+WARNING = 'warning'
+OK = 'ok'
+
+# (time, level, category, header, message, suppressed count for summaries)
+_Record = Tuple[float, str, str, str, str, int]
+
+
+class Diagnostics:
+    """
+    Rate-limited, optionally buffered writer for diagnostics.
+
+    Args:
+        buffered: Queue records for a background writer thread instead of writing them inline
+        rate_limit: Records per category and window; 0 disables rate limiting
+        json_format: Write JSON lines instead of colored text
+        window: Length of the rate-limit window in seconds
+    """
+
+    def __init__(self, buffered: bool = False, rate_limit: int = 0, json_format: bool = False,
+                 window: float = RATE_WINDOW):
+        self.buffered = buffered
+        self.rate_limit = rate_limit
+        self.json_format = json_format
+        self.window = window
+        self._lock = threading.Lock()
+        self._pending: List[_Record] = []
+        self._window_start = time.monotonic()
+        self._counts: Dict[Tuple[str, str], int] = {}  # (level, category) -> records in this window
+        self._last_suppressed: Dict[Tuple[str, str], str] = {}
+        self._wake = threading.Event()
+        self._closed = False
+        self._thread: Optional[threading.Thread] = None
+        if buffered:
+            self._thread = threading.Thread(target=self._run, name='mapcat-diagnostics', daemon=True)
+            self._thread.start()
+
+    def error(self, category: str, message: str, header: Optional[str] = None) -> None:
+        """Record a failure: 'FAIL: <header>' then 'FAIL: <message>' (header defaults to category)."""
+        self._add(ERROR, category, header or category, message)
+
+    def warning(self, category: str, message: str, header: Optional[str] = None) -> None:
+        """Record a warning: 'WARN: <header>: <message>'."""
+        self._add(WARNING, category, header or category, message)
+
+    def success(self, category: str, message: str) -> None:
+        """Record a --verbose success line: 'OK: <message>' on stdout."""
+        self._add(OK, category, category, message)
+
+    def flush(self) -> None:
+        """Write everything queued so far, including due summaries."""
+        with self._lock:
+            self._roll_window(time.monotonic())
+            records, self._pending = self._pending, []
+        self._write(records)
+
+    def close(self) -> None:
+        """Flush and stop the writer thread."""
+        self._closed = True
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+        self._summarize_all()
+        self.flush()
+
+    def _add(self, level: str, category: str, header: str, message: str) -> None:
+        now = time.monotonic()
+        record = (time.time(), level, category, header, message, 0)
+        if not self.buffered and not self.rate_limit:
+            self._write([record])
+            return
+        with self._lock:
+            self._roll_window(now)
+            if self.rate_limit:
+                key = (level, category)
+                count = self._counts.get(key, 0) + 1
+                self._counts[key] = count
+                if count > self.rate_limit:
+                    self._last_suppressed[key] = message
+                    return
+            if not self.buffered:
+                self._write([record])
+                return
+            self._pending.append(record)
+
+    def _roll_window(self, now: float) -> None:
+        """Queue summaries and reset counters once the window has passed (lock held)."""
+        if now - self._window_start < self.window:
+            return
+        self._summarize()
+        self._window_start = now
+
+    def _summarize(self) -> None:
+        summaries = []
+        for (level, category), count in self._counts.items():
+            suppressed = count - self.rate_limit
+            if suppressed > 0:
+                last = self._last_suppressed.get((level, category), '')
+                summaries.append((time.time(), level, category, category, last, suppressed))
+        self._counts.clear()
+        self._last_suppressed.clear()
+        if self.buffered:
+            self._pending.extend(summaries)
+        else:
+            self._write(summaries)
+
+    def _summarize_all(self) -> None:
+        with self._lock:
+            self._summarize()
+
+    def _run(self) -> None:
+        while not self._closed:
+            self._wake.wait(FLUSH_INTERVAL)
+            self._wake.clear()
+            self.flush()
+
+    def _write(self, records: List[_Record]) -> None:
+        if not records:
+            return
+        err: List[str] = []
+        out: List[str] = []
+        for record in records:
+            (out if record[1] == OK else err).append(self._format(record))
+        # Streams are looked up at write time, so redirected sys.stderr/sys.stdout are honored
+        for stream, lines in ((sys.stderr, err), (sys.stdout, out)):
+            if lines:
+                _write_stream(stream, ''.join(lines))
+
+    def _format(self, record: _Record) -> str:
+        timestamp, level, category, header, message, suppressed = record
+        if self.json_format:
+            data = {'time': round(timestamp, 3), 'level': level, 'category': category}
+            if suppressed:
+                data.update(suppressed=suppressed, window=self.window, last=message)
+            else:
+                data.update(header=header, message=message)
+            return json.dumps(data) + '\n'
+        window = f"{self.window:g}s"
+        if level == OK:
+            if suppressed:
+                return f"{GREEN}OK: {category} x{suppressed} more in last {window}{RESET}\n"
+            return f"{GREEN}OK: {message}{RESET}\n"
+        if level == WARNING:
+            if suppressed:
+                return f"{YELLOW}WARN: {category} x{suppressed} more in last {window} (last: {message}){RESET}\n"
+            return f"{YELLOW}WARN: {header}: {message}{RESET}\n"
+        if suppressed:
+            return f"{RED}FAIL: {category} x{suppressed} more in last {window} (last: {message}){RESET}\n"
+        return f"{RED}FAIL: {header}{RESET}\n{RED}FAIL: {message}{RESET}\n"
+
+
+def _write_stream(stream: TextIO, text: str) -> None:
+    try:
+        stream.write(text)
+        stream.flush()
+    except (OSError, ValueError):
+        pass  # closed or broken stream: diagnostics must never take mapcat down
+
+
+_diagnostics = Diagnostics()
+
+
+def configure(buffered: bool = True, rate_limit: int = DEFAULT_RATE_LIMIT, json_format: bool = False) -> Diagnostics:
+    """Replace the active Diagnostics (flushing the old one) and return the new one."""
+    global _diagnostics
+    _diagnostics.close()
+    _diagnostics = Diagnostics(buffered, rate_limit, json_format)
+    return _diagnostics
+
+
+def worker_initializer() -> Tuple[Callable[..., None], Tuple[int, bool]]:
+    """
+    Return (initializer, initargs) for a ProcessPoolExecutor whose workers log diagnostics.
+
+    Workers write directly, without a writer thread of their own, with the
+    same rate limit (per worker) and format. The initializer is picklable, for
+    pools whose workers are not forked.
+    """
+    return _init_worker, (_diagnostics.rate_limit, _diagnostics.json_format)
+
+
+def _init_worker(rate_limit: int, json_format: bool) -> None:
+    global _diagnostics
+    # Not close(): a forked worker's inherited queue and lock belong to the parent's writer thread
+    _diagnostics = Diagnostics(False, rate_limit, json_format)
+
+
+def get() -> Diagnostics:
+    """Return the active Diagnostics."""
+    return _diagnostics
+
+
+def error(category: str, message: str, header: Optional[str] = None) -> None:
+    _diagnostics.error(category, message, header)
+
+
+def warning(category: str, message: str, header: Optional[str] = None) -> None:
+    _diagnostics.warning(category, message, header)
+
+
+def success(category: str, message: str) -> None:
+    _diagnostics.success(category, message)
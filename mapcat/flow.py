@@ -0,0 +1,139 @@
+"""
+Render-acknowledgement flow control for browser connections.
+
+Every message sent to a client has an implicit sequence number: its position
+in that connection's message stream (the initial snapshot is 1). After
+applying and rendering messages, the browser sends
+
+    {"type": "ack", "seq": <last applied sequence number>}
+
+The first ack switches flow control on for the connection; clients that never
+ack are sent everything as before. With flow control on, at most max_unacked
+messages are in flight. Later messages are deferred and sent as one 'batch'
+message once acks open the window again, with current-position updates
+coalesced to the latest one. If the deferred messages grow beyond max_deferred
+messages or bytes, or the oldest is older than max_lag seconds, they are
+dropped and the client is resynchronized with a snapshot of the whole map that
+replaces what it shows, so a slow browser is never more than a bounded amount
+of work behind the input.
+"""
+import time
+from typing import Callable, List, Optional
+
+DEFAULT_MAX_UNACKED = 32  # messages in flight per client; 0 disables flow control
+DEFAULT_MAX_DEFERRED = 10_000  # messages
+DEFAULT_MAX_DEFERRED_BYTES = 16 * 1024 * 1024
+DEFAULT_MAX_LAG = 2.0  # seconds
+
+# Handlers build their message dicts with 'action' first, so position updates
+# are recognized from the JSON text without decoding it
+_POSITION_PREFIX = '{"action": "update-current-position"'
+
+
+class ClientFlow:
+    """
+    Send window of one client connection.
+
+    Args:
+        snapshot: Returns the JSON text of a full-map snapshot with 'replace': true,
+            used to resynchronize a client whose deferred messages were dropped
+        max_unacked: Messages in flight before new ones are deferred
+        max_deferred: Deferred messages before resynchronizing instead
+        max_deferred_bytes: Deferred bytes before resynchronizing instead
+        max_lag: Age in seconds of the oldest deferred message before resynchronizing instead
+    """
+
+    def __init__(self, snapshot: Callable[[], str], max_unacked: int = DEFAULT_MAX_UNACKED,
+                 max_deferred: int = DEFAULT_MAX_DEFERRED, max_deferred_bytes: int = DEFAULT_MAX_DEFERRED_BYTES,
+                 max_lag: float = DEFAULT_MAX_LAG):
+        self.snapshot = snapshot
+        self.max_unacked = max_unacked
+        self.max_deferred = max_deferred
+        self.max_deferred_bytes = max_deferred_bytes
+        self.max_lag = max_lag
+        self.enabled = False  # set by the first ack
+        self.sent = 0  # sequence number of the last message sent
+        self.acked = 0
+        self.deferred: List[str] = []
+        self.deferred_bytes = 0
+        self.deferred_since = 0.0
+        self.position: Optional[str] = None  # latest deferred update-current-position
+        self.resync = False
+        self.coalesced = 0  # messages not sent individually (merged position updates, dropped for resync)
+        self.resyncs = 0
+
+    @property
+    def unacked(self) -> int:
+        return self.sent - self.acked
+
+    def admit(self, message: str) -> bool:
+        """
+        Decide whether a broadcast message is sent to this client now.
+
+        Returns:
+            True if the caller sends it (counted as sent), False if it was deferred.
+        """
+        if not self.enabled or (not self.max_unacked) or (
+                self.sent - self.acked < self.max_unacked and not self._has_deferred()):
+            self.sent += 1
+            return True
+        self._defer(message)
+        return False
+
+    def count_sent(self) -> None:
+        """Count a message sent outside of admit() (the initial snapshot)."""
+        self.sent += 1
+
+    def ack(self, seq) -> Optional[str]:
+        """
+        Record an acknowledgement.
+
+        Returns:
+            A message to send now (deferred messages as one batch, or a resync
+            snapshot) that the caller must send, or None.
+        """
+        if not isinstance(seq, int) or isinstance(seq, bool):
+            return None
+        self.enabled = True
+        self.acked = max(self.acked, min(seq, self.sent))
+        if self.unacked >= self.max_unacked or not self._has_deferred():
+            return None
+        return self._flush()
+
+    def _has_deferred(self) -> bool:
+        return bool(self.deferred) or self.position is not None or self.resync
+
+    def _defer(self, message: str) -> None:
+        if message.startswith(_POSITION_PREFIX):
+            if self.position is not None:
+                self.coalesced += 1
+            self.position = message
+            return
+        if self.resync:
+            self.coalesced += 1  # the snapshot sent on resync will contain its effect
+            return
+        if not self.deferred:
+            self.deferred_since = time.monotonic()
+        self.deferred.append(message)
+        self.deferred_bytes += len(message)
+        if (len(self.deferred) > self.max_deferred or self.deferred_bytes > self.max_deferred_bytes
+                or time.monotonic() - self.deferred_since > self.max_lag):
+            self.coalesced += len(self.deferred)
+            self.deferred = []
+            self.deferred_bytes = 0
+            self.resync = True
+            self.resyncs += 1
+
+    def _flush(self) -> str:
+        messages = [self.snapshot()] if self.resync else self.deferred
+        if self.position is not None:
+            messages = messages + [self.position]
+        self.deferred = []
+        self.deferred_bytes = 0
+        self.position = None
+        self.resync = False
+        self.sent += 1
+        if len(messages) == 1:
+            return messages[0]
+        # The deferred messages are JSON already; join them without decoding
+        return '{"action": "batch", "messages": [' + ', '.join(messages) + ']}'
@@ -0,0 +1,329 @@
+"""
+Line readers and input sources for mapcat.
+
+Readers are async generators yielding lists of lines (batches), so the caller
+pays one await per block instead of one per line.
+
+Sources (run_file, run_fifo, run_tcp_listener, run_udp_listener) run until
+cancelled and hand every batch to a sink coroutine together with a source tag:
+    file:<path>  fifo:<path>  tcp:<host>:<port>  udp:<host>:<port>
+For TCP and UDP the tag names the remote peer, so each producer is its own source.
+"""
+import asyncio
+import os
+import stat
+from typing import AsyncIterator, Awaitable, Callable, List, Tuple
+
+from mapcat import diagnostics
+
+READ_BLOCK_SIZE = 256 * 1024
+FOLLOW_POLL_INTERVAL = 0.2  # seconds between checks of a followed file at EOF
+MAX_UDP_BACKLOG = 10000  # datagrams queued before new ones are dropped
+
+LineSink = Callable[[str, List[str]], Awaitable[None]]
+
+
+class _LineSplitter:
+    """Split a byte stream into decoded lines, carrying partial lines across blocks."""
+
+    def __init__(self):
+        self._pending: List[bytes] = []  # tail of the previous blocks without a newline yet
+
+    def feed(self, block: bytes) -> List[str]:
+        """Return the complete lines ending in this block (without terminators)."""
+        end = block.rfind(b'\n')
+        if end < 0:
+            self._pending.append(block)
+            return []
+        if self._pending:
+            self._pending.append(block[:end])
+            data = b''.join(self._pending)
+            self._pending.clear()
+        else:
+            data = block[:end]
+        if end + 1 < len(block):
+            self._pending.append(block[end + 1:])
+        return data.decode('utf-8', 'replace').split('\n')
+
+    def flush(self) -> List[str]:
+        """Return the trailing partial line, if any, and reset."""
+        if not self._pending:
+            return []
+        data = b''.join(self._pending)
+        self._pending.clear()
+        return [data.decode('utf-8', 'replace')]
+
+
+async def read_lines_executor(stream) -> AsyncIterator[List[str]]:
+    """
+    Read lines one at a time via stream.readline() in the default executor.
+
+    Works with any file-like object but costs one thread-pool round-trip per line.
+
+    Yields:
+        Single-line batches; lines keep their terminator.
+    """
+    loop = asyncio.get_event_loop()
+    while True:
+        line = await loop.run_in_executor(None, stream.readline)
+        if not line:
+            return
+        yield [line]
+
+
+async def read_lines_bulk(stream, block_size: int = READ_BLOCK_SIZE) -> AsyncIterator[List[str]]:
+    """
+    Read large blocks from the stream's file descriptor and split them into lines.
+
+    Pipes and sockets are read through an asyncio StreamReader (no threads
+    involved); regular files and devices, which the event loop cannot poll, are
+    read in blocks through the default executor. Bytes are decoded as UTF-8, invalid
+    sequences are replaced.
+
+    Args:
+        stream: Object with fileno() (e.g. sys.stdin)
+        block_size: Maximum number of bytes per read
+
+    Yields:
+        Batches of lines without their '\\n' terminator.
+    """
+    loop = asyncio.get_running_loop()
+    fd = stream.fileno()
+
+    if _is_pollable(fd):
+        reader = asyncio.StreamReader(limit=block_size, loop=loop)
+        # Duplicate the descriptor: the transport closes its pipe object at EOF
+        pipe = os.fdopen(os.dup(fd), 'rb', buffering=0)
+        transport, _ = await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader, loop=loop), pipe)
+
+        async def read_block():
+            return await reader.read(block_size)
+    else:
+        transport = None
+
+        async def read_block():
+            return await loop.run_in_executor(None, os.read, fd, block_size)
+
+    splitter = _LineSplitter()
+    try:
+        while True:
+            block = await read_block()
+            if not block:
+                break
+            lines = splitter.feed(block)
+            if lines:
+                yield lines
+        rest = splitter.flush()
+        if rest:
+            yield rest
+    finally:
+        if transport is not None:
+            transport.close()
+
+
+async def run_file(path: str, sink: LineSink, follow: bool = False,
+                   poll_interval: float = FOLLOW_POLL_INTERVAL) -> None:
+    """
+    Read a file from the start and pass its lines to sink.
+
+    With follow=True, keep reading appended lines like `tail -F`: a truncated file
+    is re-read from the start, and a rotated (replaced or deleted) file is drained
+    and then re-opened by name once it reappears.
+
+    Args:
+        path: File path
+        sink: Coroutine receiving (source, lines)
+        follow: Keep following the file after EOF
+        poll_interval: Seconds between checks at EOF (follow mode only)
+    """
+    source = f"file:{path}"
+    if not follow:
+        try:
+            f = open(path, 'rb')
+        except OSError as e:
+            _log_error(source, f"Cannot open file: {e}")
+            return
+        with f:
+            async for batch in read_lines_bulk(f):
+                await sink(source, batch)
+        return
+
+    loop = asyncio.get_running_loop()
+    splitter = _LineSplitter()
+    f = None
+    waiting_logged = False
+    try:
+        while True:
+            if f is None:
+                try:
+                    f = open(path, 'rb')
+                    waiting_logged = False
+                except FileNotFoundError:
+                    if not waiting_logged:
+                        _log_error(source, "File not found, waiting for it to appear")
+                        waiting_logged = True
+                    await asyncio.sleep(poll_interval)
+                    continue
+                except OSError as e:
+                    _log_error(source, f"Cannot open file: {e}")
+                    return
+
+            block = await loop.run_in_executor(None, f.read, READ_BLOCK_SIZE)
+            if block:
+                lines = splitter.feed(block)
+                if lines:
+                    await sink(source, lines)
+                continue
+
+            # At EOF: detect rotation and truncation
+            try:
+                current = os.stat(path)
+            except FileNotFoundError:
+                current = None
+            if current is None or current.st_ino != os.fstat(f.fileno()).st_ino:
+                # Rotated: anything written to the old file before the switch was read above
+                rest = splitter.flush()
+                if rest:
+                    await sink(source, rest)
+                f.close()
+                f = None
+                if current is None:
+                    await asyncio.sleep(poll_interval)
+            elif current.st_size < f.tell():
+                # Truncated in place: start over from the beginning
+                splitter.flush()
+                f.seek(0)
+            else:
+                await asyncio.sleep(poll_interval)
+    finally:
+        if f is not None:
+            f.close()
+
+
+async def run_fifo(path: str, sink: LineSink) -> None:
+    """
+    Read lines from a named pipe and pass them to sink.
+
+    When the last writer closes the pipe, it is re-opened to wait for the next writer.
+    """
+    source = f"fifo:{path}"
+    while True:
+        try:
+            # A blocking open would wait for a writer in a thread that cancellation
+            # cannot interrupt; a non-blocking read end is polled by the event loop
+            # and reports EOF only after a writer has connected and gone away
+            f = os.fdopen(os.open(path, os.O_RDONLY | os.O_NONBLOCK), 'rb', buffering=0)
+        except OSError as e:
+            _log_error(source, f"Cannot open named pipe: {e}")
+            return
+        with f:
+            async for batch in read_lines_bulk(f):
+                await sink(source, batch)
+
+
+async def run_tcp_listener(host: str, port: int, sink: LineSink) -> None:
+    """
+    Accept TCP connections and pass newline-separated lines to sink.
+
+    Each connection is its own source, tagged tcp:<peer-host>:<peer-port>.
+    """
+    async def on_connection(reader, writer):
+        peer = writer.get_extra_info('peername')
+        source = f"tcp:{peer[0]}:{peer[1]}"
+        splitter = _LineSplitter()
+        try:
+            while True:
+                block = await reader.read(READ_BLOCK_SIZE)
+                if not block:
+                    break
+                lines = splitter.feed(block)
+                if lines:
+                    await sink(source, lines)
+            rest = splitter.flush()
+            if rest:
+                await sink(source, rest)
+        except ConnectionError as e:
+            _log_error(source, f"Connection lost: {e}")
+        finally:
+            writer.close()
+
+    try:
+        tcp_server = await asyncio.start_server(on_connection, host, port)
+    except OSError as e:
+        _log_error(f"tcp:{host}:{port}", f"Cannot listen: {e}")
+        return
+    async with tcp_server:
+        await tcp_server.serve_forever()
+
+
+class _DatagramQueue(asyncio.DatagramProtocol):
+    def __init__(self, queue: asyncio.Queue, listen: str):
+        self._queue = queue
+        self._listen = listen
+        self._dropped = 0
+
+    def datagram_received(self, data: bytes, addr: Tuple[str, int]) -> None:
+        try:
+            self._queue.put_nowait((f"udp:{addr[0]}:{addr[1]}", data))
+        except asyncio.QueueFull:
+            self._dropped += 1
+            if self._dropped == 1 or self._dropped % 1000 == 0:
+                _log_error(self._listen, f"Backlog full, dropped {self._dropped} datagrams so far")
+
+
+async def run_udp_listener(host: str, port: int, sink: LineSink) -> None:
+    """
+    Receive UDP datagrams, each holding one or more newline-separated lines.
+
+    Each sender address is its own source, tagged udp:<peer-host>:<peer-port>.
+    """
+    listen = f"udp:{host}:{port}"
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue(MAX_UDP_BACKLOG)
+    try:
+        transport, _ = await loop.create_datagram_endpoint(
+            lambda: _DatagramQueue(queue, listen), local_addr=(host, port))
+    except OSError as e:
+        _log_error(listen, f"Cannot listen: {e}")
+        return
+    try:
+        while True:
+            source, data = await queue.get()
+            await sink(source, data.decode('utf-8', 'replace').split('\n'))
+    finally:
+        transport.close()
+
+
+def parse_listen_address(value: str) -> Tuple[str, int]:
+    """
+    Parse '[HOST:]PORT' into (host, port). HOST defaults to 127.0.0.1.
+
+    Raises:
+        ValueError: If the port is not a number in 0..65535
+    """
+    host, sep, port_text = value.rpartition(':')
+    if not sep:
+        host = '127.0.0.1'
+    port = int(port_text)
+    if not 0 <= port <= 65535:
+        raise ValueError(f"port out of range: {port}")
+    return host.strip('[]') or '127.0.0.1', port
+
+
+def has_fileno(stream) -> bool:
+    """Return True if the stream is backed by a real file descriptor."""
+    try:
+        stream.fileno()
+    except (AttributeError, OSError, ValueError):
+        return False
+    return True
+
+
+def _is_pollable(fd: int) -> bool:
+    mode = os.fstat(fd).st_mode
+    return stat.S_ISFIFO(mode) or stat.S_ISSOCK(mode)
+
+
+def _log_error(source: str, message: str):
+    """Log error to stderr in red."""
+    diagnostics.error("input", message, f"input {source}")
@@ -0,0 +1,234 @@
+"""
+Bulk loader for large recorded command files (--load).
+
+The file is read in large blocks cut at line boundaries. Blocks are parsed in
+parallel by worker processes and the results are applied to State in file
+order, without broadcasting; browsers get one snapshot once loading is done.
+
+Plain, gzip (.gz) and zstandard (.zst, needs the optional 'zstandard' package)
+files are supported.
+"""
+import asyncio
+import gc
+import gzip
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, Union
+
+from mapcat import diagnostics, parser, profiling
+from mapcat.commands import COMMAND_HANDLERS
+from mapcat.schema import COMMAND_SCHEMAS
+from mapcat.state import State
+
+LOAD_BLOCK_SIZE = 4 * 1024 * 1024
+MAX_IN_FLIGHT_PER_WORKER = 2  # batches queued per worker before the reader waits
+WORKER_START_METHOD = 'forkserver'  # see parser_pool()
+
+# Worker result for one line: a parsed command, None if parsing failed, or the raw
+# line when it needs the sequential path (chunked protocol, unknown first token)
+LineResult = Union[Dict[str, Any], None, str]
+
+
+class LoadError(Exception):
+    """Raised when a command file cannot be opened or read."""
+
+
+class LoadStats:
+    """Counters reported after a bulk load."""
+
+    def __init__(self):
+        self.bytes = 0
+        self.lines = 0
+        self.commands = 0
+        self.failed = 0
+        self.seconds = 0.0
+
+    @property
+    def mb_per_sec(self) -> float:
+        return self.bytes / (1024 * 1024) / self.seconds if self.seconds else 0.0
+
+
+def open_command_file(path: str):
+    """
+    Open a command file for binary reading, decompressing .gz and .zst files.
+
+    Raises:
+        LoadError: If the file cannot be opened or zstandard is not installed
+    """
+    try:
+        if path.endswith('.gz'):
+            return gzip.open(path, 'rb')
+        if path.endswith('.zst'):
+            try:
+                import zstandard
+            except ImportError:
+                raise LoadError("Reading .zst files requires the 'zstandard' package (pip install zstandard)")
+            return zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), read_across_frames=True, closefd=True)
+        return open(path, 'rb', buffering=0)
+    except OSError as e:
+        raise LoadError(f"Cannot open {path}: {e}")
+
+
+def iter_blocks(stream, block_size: int = LOAD_BLOCK_SIZE) -> Iterator[bytes]:
+    """Yield blocks of whole lines (each ending at a newline, except possibly the last)."""
+    tail = b''
+    while True:
+        block = stream.read(block_size)
+        if not block:
+            break
+        end = block.rfind(b'\n')
+        if end < 0:
+            tail += block
+            continue
+        yield tail + block[:end + 1]
+        tail = block[end + 1:]
+    if tail:
+        yield tail
+
+
+def parse_block(block: bytes) -> List[LineResult]:
+    """Parse every line of a block of bytes (runs in worker processes)."""
+    return parse_lines(block.decode('utf-8', 'replace').split('\n'))
+
+
+def parse_lines(lines: List[str], timed: bool = False) -> List[LineResult]:
+    """
+    Parse lines into one result per line (runs in worker processes).
+
+    Lines whose first token is not a registered command (including blank lines)
+    are returned raw and unstripped, so that the chunked protocol
+    (begin/commit/chunk and session-id lines) is resolved in order by the caller.
+    With timed, each parsed command carries its parse time in ns as '_parse_ns',
+    for the 'parse' stage of --profile.
+    """
+    results: List[LineResult] = []
+    for raw in lines:
+        line = raw.strip()
+        cmd = line.split(None, 1)[0] if line else ''
+        if cmd not in COMMAND_HANDLERS:
+            results.append(raw)
+            continue
+        if timed:
+            start = profiling.now()
+        parsed = parser.parse_command(line)
+        if parsed is not None:
+            parsed['_original_line'] = _condense_line(cmd, line)
+            if timed:
+                parsed['_parse_ns'] = profiling.now() - start
+        results.append(parsed)
+    return results
+
+
+def parser_pool(workers: int) -> ProcessPoolExecutor:
+    """
+    Create a pool of parser processes for parse_lines and parse_block.
+
+    Workers are started by a fork server instead of being forked from mapcat:
+    by the time a pool is created, mapcat runs other threads (diagnostics
+    writer, executor threads, the API loop), and a forked child could inherit
+    a lock one of them holds. Each worker is set up with the parent's
+    diagnostics and parse cache settings.
+    """
+    initializer, initargs = diagnostics.worker_initializer()
+    cache = parser.get_cache()
+    cache_args = (cache.maxsize, cache.min_length) if cache is not None else None
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(WORKER_START_METHOD),
+                               initializer=_init_worker, initargs=(initializer, initargs, cache_args))
+
+
+def _init_worker(init_diagnostics: Callable[..., None], diagnostics_args: tuple, cache_args: Optional[tuple]) -> None:
+    init_diagnostics(*diagnostics_args)
+    if cache_args is not None:
+        parser.enable_cache(*cache_args)
+
+
+async def load_file(path: str, state: State, apply_raw: Callable[[str], Awaitable[None]],
+                    workers: Optional[int] = None, pause_gc: bool = False) -> LoadStats:
+    """
+    Load a command file into state.
+
+    Args:
+        path: Command file (.gz/.zst are decompressed)
+        state: State to populate
+        apply_raw: Coroutine that processes a line through the normal pipeline;
+            used for chunked-protocol lines, which depend on file order
+        workers: Parser processes (default: CPU count); 0 or 1 parses inline
+        pause_gc: Disable the cyclic garbage collector while loading
+
+    Returns:
+        LoadStats with byte/line/command counts and elapsed time.
+
+    Raises:
+        LoadError: If the file cannot be opened or read
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    stats = LoadStats()
+    gc_was_enabled = gc.isenabled()
+    if pause_gc:
+        gc.disable()
+    start = time.perf_counter()
+    try:
+        with open_command_file(path) as stream:
+            blocks = _counted(iter_blocks(stream), stats)
+            if workers <= 1:
+                for block in blocks:
+                    await _apply_results(parse_block(block), state, apply_raw, stats)
+            else:
+                with parser_pool(workers) as pool:
+                    pending = []
+                    for block in blocks:
+                        pending.append(pool.submit(parse_block, block))
+                        if len(pending) >= workers * MAX_IN_FLIGHT_PER_WORKER:
+                            results = await asyncio.wrap_future(pending.pop(0))
+                            await _apply_results(results, state, apply_raw, stats)
+                    for future in pending:
+                        await _apply_results(await asyncio.wrap_future(future), state, apply_raw, stats)
+    except (OSError, EOFError) as e:
+        raise LoadError(f"Cannot read {path}: {e}")
+    finally:
+        stats.seconds = time.perf_counter() - start
+        if pause_gc and gc_was_enabled:
+            gc.enable()
+    return stats
+
+
+async def _apply_results(results: List[LineResult], state: State,
+                         apply_raw: Callable[[str], Awaitable[None]], stats: LoadStats) -> None:
+    for result in results:
+        if isinstance(result, str):
+            if not result.strip():
+                continue
+            stats.lines += 1
+            await apply_raw(result)
+            continue
+        stats.lines += 1
+        if result is None:
+            stats.failed += 1
+        elif COMMAND_HANDLERS[result['cmd']](state, result) is None:
+            if not COMMAND_SCHEMAS[result['cmd']].informational:
+                stats.failed += 1
+        else:
+            stats.commands += 1
+
+
+def _counted(blocks: Iterator[bytes], stats: LoadStats) -> Iterator[bytes]:
+    for block in blocks:
+        stats.bytes += len(block)
+        yield block
+
+
+def _condense_line(cmd: str, line: str) -> str:
+    """
+    Shorten a long line for error previews before shipping it between processes.
+
+    Error logs show the first 48 and last 16 characters of the parameters, so
+    keeping exactly those produces the same preview.
+    """
+    if len(line) <= 256:
+        return line
+    head = len(cmd) + 1 + 48
+    return line[:head] + '...' + line[-16:]
+
@@ -0,0 +1,419 @@
+"""
+Synthetic load generator and end-to-end latency harness.
+
+`mapcat-loadgen emit` writes a realistic command stream at a target rate, to
+pipe into mapcat by hand:
+
+    mapcat-loadgen emit --rate 2000 | mapcat
+
+The stream mixes a moving current position, tracks that grow and are re-sent
+(remove + add-polyline with the same id), tag refreshes (remove tag=... and a
+burst of points) and long polygons split into self-describing chunks.
+
+`mapcat-loadgen bench` starts a real `mapcat --no-open` process, feeds the
+stream into its stdin and connects a headless WebSocket consumer. Every added
+feature is a probe: the time from writing its (last) line to receiving its
+'add' message gives the stdin-to-client latency. With --ramp the rate is
+raised step by step until latency diverges, which gives the maximum
+sustainable rate.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import socket
+import sys
+import time
+from collections import deque
+from typing import Deque, Dict, Iterator, List, NamedTuple, Optional, Set, Tuple
+
+from mapcat.profiling import LatencyHistogram
+
+TICK = 0.005  # seconds between writes in the paced writer
+CONNECT_TIMEOUT = 10.0
+DRAIN_TIMEOUT = 3.0  # seconds to wait for outstanding probes after a step
+DEFAULT_MAX_LATENCY = 0.5  # p99 seconds beyond which a rate counts as unsustainable
+MAX_LOSS = 0.01  # share of probes that may be missing
+
+# (line, probe id): the probe id is the id of the feature whose 'add' message
+# completes the line, or None for lines that are not measured
+Line = Tuple[str, Optional[str]]
+
+
+class LoadGenerator:
+    """
+    Endless, reproducible stream of mapcat commands.
+
+    Args:
+        seed: Random seed; the same seed gives the same stream
+        tracks: Number of tracks that grow in turn
+        chunk_vertices: Vertices of each chunked polygon
+    """
+
+    # Share of steps per scenario
+    MIX = (('position', 0.55), ('track', 0.25), ('tags', 0.1), ('chunked', 0.1))
+
+    def __init__(self, seed: int = 1, tracks: int = 20, chunk_vertices: int = 400):
+        self.rng = random.Random(seed)
+        self.position = [52.52, 13.40]
+        self.heading = 0.0
+        self.tracks: List[List[Tuple[float, float]]] = [[] for _ in range(tracks)]
+        self.next_track = 0
+        self.tag_version = 0
+        self.emitted_tags: Set[str] = set()
+        self.chunk_vertices = chunk_vertices
+        self.counter = 0
+        self._pending: Deque[Line] = deque()
+
+    def lines(self, count: int) -> List[Line]:
+        """Return the next count lines of the stream."""
+        while len(self._pending) < count:
+            self._pending.extend(self._step())
+        return [self._pending.popleft() for _ in range(count)]
+
+    def clear(self) -> str:
+        """
+        Return a clear command and forget the features it removes.
+
+        Lines generated but not yet returned come after the clear: their removes
+        are dropped, and the tracks and tags they add are still remembered, so
+        the stream neither removes a missing feature nor re-adds an existing id.
+        """
+        self._pending = deque(line for line in self._pending if not line[0].startswith('remove '))
+        pending_ids = {probe_id for _, probe_id in self._pending if probe_id is not None}
+        for index, track in enumerate(self.tracks):
+            if f"track-{index}" not in pending_ids:
+                track.clear()
+        self.emitted_tags = {tag for tag in self.emitted_tags
+                             if any(f" tag={tag} " in line for line, _ in self._pending)}
+        return "clear"
+
+    def __iter__(self) -> Iterator[Line]:
+        while True:
+            if not self._pending:
+                self._pending.extend(self._step())
+            yield self._pending.popleft()
+
+    def _step(self) -> List[Line]:
+        pick = self.rng.random()
+        for scenario, share in self.MIX:
+            pick -= share
+            if pick < 0:
+                break
+        self.counter += 1
+        return getattr(self, f"_{scenario}")()
+
+    def _move(self) -> Tuple[float, float]:
+        self.heading += self.rng.uniform(-0.3, 0.3)
+        self.position[0] = min(max(self.position[0] + 0.0002 * math.cos(self.heading), -85), 85)
+        self.position[1] = min(max(self.position[1] + 0.0003 * math.sin(self.heading), -175), 175)
+        return self.position[0], self.position[1]
+
+    def _position(self) -> List[Line]:
+        lat, lng = self._move()
+        return [(f"update-current-position ({lat:.6f},{lng:.6f})", None)]
+
+    def _track(self) -> List[Line]:
+        index = self.next_track
+        self.next_track = (index + 1) % len(self.tracks)
+        track = self.tracks[index]
+        if not track:
+            track.append((self.position[0] + self.rng.uniform(-0.01, 0.01), self.position[1] + self.rng.uniform(-0.01, 0.01)))
+        for _ in range(5):
+            lat, lng = track[-1]
+            track.append((lat + self.rng.uniform(-0.0005, 0.0005), lng + self.rng.uniform(-0.0005, 0.0005)))
+        del track[:-500]  # keep lines at realistic lengths
+        coords = ';'.join(f"({lat:.6f},{lng:.6f})" for lat, lng in track)
+        track_id = f"track-{index}"
+        lines: List[Line] = [] if len(track) == 6 else [(f"remove id={track_id}", None)]
+        lines.append((f"add-polyline {coords} id={track_id} color=blue width=3 tag=tracks", track_id))
+        return lines
+
+    def _tags(self) -> List[Line]:
+        self.tag_version += 1
+        tag = f"pois-{self.tag_version % 4}"
+        lines: List[Line] = []
+        if tag in self.emitted_tags:  # removing a tag that was never added would only log an error
+            lines.append((f"remove tag={tag}", None))
+        self.emitted_tags.add(tag)
+        for i in range(20):
+            point_id = f"poi-{self.tag_version}-{i}"
+            lat = self.position[0] + self.rng.uniform(-0.02, 0.02)
+            lng = self.position[1] + self.rng.uniform(-0.02, 0.02)
+            lines.append((f"add-point ({lat:.6f},{lng:.6f}) id={point_id} tag={tag} color=orange radius=5", point_id))
+        return lines
+
+    def _chunked(self) -> List[Line]:
+        polygon_id = f"area-{self.counter}"
+        lat0, lng0 = self.position
+        coords = ';'.join(
+            f"({lat0 + 0.01 * math.cos(2 * math.pi * i / self.chunk_vertices):.6f},"
+            f"{lng0 + 0.015 * math.sin(2 * math.pi * i / self.chunk_vertices):.6f})"
+            for i in range(self.chunk_vertices))
+        command = f"add-polygon {coords} id={polygon_id} color=green opacity=0.2 tag=areas"
+        size = 3000  # stays below the ~4000 character limit of Android log lines
+        parts = [command[i:i + size] for i in range(0, len(command), size)]
+        total = len(parts)
+        return [(f"chunk {polygon_id} {seq}/{total} {part}", polygon_id if seq == total else None)
+                for seq, part in enumerate(parts, 1)]
+
+
+class StepResult(NamedTuple):
+    """Outcome of running the stream at one rate."""
+    target_rate: float
+    achieved_rate: float  # lines written per second
+    lines: int
+    probes: int
+    received: int
+    latency: LatencyHistogram
+
+    @property
+    def loss(self) -> float:
+        return 1 - self.received / self.probes if self.probes else 0.0
+
+    def as_dict(self) -> Dict[str, float]:
+        return {
+            'target_rate': self.target_rate,
+            'achieved_rate': round(self.achieved_rate, 1),
+            'lines': self.lines,
+            'probes': self.probes,
+            'received': self.received,
+            'p50_ms': self.latency.percentile(50) / 1e6,
+            'p90_ms': self.latency.percentile(90) / 1e6,
+            'p99_ms': self.latency.percentile(99) / 1e6,
+            'max_ms': self.latency.max / 1e6,
+        }
+
+
+class Consumer:
+    """
+    Headless WebSocket client that matches received 'add' messages to probes.
+
+    Args:
+        ack: Acknowledge every message right away, like a browser that renders instantly
+    """
+
+    def __init__(self, ack: bool = False):
+        self.ack = ack
+        self.sent: Dict[str, Deque[int]] = {}  # probe id -> write times (ids are re-used by growing tracks)
+        self.outstanding = 0
+        self.latency = LatencyHistogram()
+        self.received = 0
+        self._seq = 0
+
+    def expect(self, probe_id: str, written: int) -> None:
+        self.sent.setdefault(probe_id, deque()).append(written)
+        self.outstanding += 1
+
+    def reset(self) -> None:
+        self.sent.clear()
+        self.outstanding = 0
+        self.latency = LatencyHistogram()
+        self.received = 0
+
+    async def run(self, websocket) -> None:
+        async for raw in websocket:
+            now = time.perf_counter_ns()
+            self._seq += 1
+            try:
+                message = json.loads(raw)
+            except ValueError:
+                continue
+            self._handle(message, now)
+            if self.ack:
+                await websocket.send(json.dumps({'type': 'ack', 'seq': self._seq}))
+
+    def _handle(self, message, now: int) -> None:
+        action = message.get('action')
+        if action == 'batch':
+            for inner in message.get('messages', []):
+                self._handle(inner, now)
+        elif action == 'snapshot':
+            for inner in message.get('features', []):
+                self._handle(inner, now)
+        elif action == 'add':
+            times = self.sent.get(message.get('id'))
+            if times:
+                self.latency.record(now - times.popleft())
+                self.received += 1
+                self.outstanding -= 1
+
+
+async def run_step(process, consumer: Consumer, generator: LoadGenerator, rate: float, duration: float) -> StepResult:
+    """Write the stream at rate lines/sec for duration seconds and collect probe latencies."""
+    consumer.reset()
+    stdin = process.stdin
+    start = time.perf_counter()
+    written = 0
+    probes = 0
+    while True:
+        elapsed = time.perf_counter() - start
+        if elapsed >= duration:
+            break
+        due = int(elapsed * rate) - written
+        if due > 0:
+            batch = generator.lines(due)
+            stdin.write(''.join(f"{line}\n" for line, _ in batch).encode('utf-8'))
+            await stdin.drain()  # blocks when mapcat stops reading: the rate is then not reached
+            now = time.perf_counter_ns()
+            for _, probe_id in batch:
+                if probe_id is not None:
+                    consumer.expect(probe_id, now)
+                    probes += 1
+            written += due
+        await asyncio.sleep(TICK)
+    achieved = written / (time.perf_counter() - start)
+
+    deadline = time.perf_counter() + DRAIN_TIMEOUT
+    while consumer.outstanding and time.perf_counter() < deadline:
+        await asyncio.sleep(0.05)
+    return StepResult(rate, achieved, written, probes, consumer.received, consumer.latency)
+
+
+def diverged(result: StepResult, max_latency: float) -> bool:
+    """True if mapcat did not keep up: too slow, too much loss, or the writer was held back."""
+    return (result.latency.percentile(99) > max_latency * 1e9
+            or result.loss > MAX_LOSS
+            or result.achieved_rate < 0.95 * result.target_rate)
+
+
+async def bench(args) -> List[StepResult]:
+    port = args.port or _free_port()
+    command = [sys.executable, '-m', 'mapcat.main', '--no-open', '--port', str(port)] + args.mapcat_args
+    process = await asyncio.create_subprocess_exec(
+        *command, stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.DEVNULL,
+        stderr=None if args.show_stderr else asyncio.subprocess.DEVNULL)
+    import websockets  # only needed for bench; keeps `emit` free of the import cost
+    try:
+        websocket = await _connect(websockets, port)
+        consumer = Consumer(ack=args.ack)
+        consumer_task = asyncio.create_task(consumer.run(websocket))
+        generator = LoadGenerator(seed=args.seed)
+        results = []
+        rate = args.rate
+        while True:
+            result = await run_step(process, consumer, generator, rate, args.duration)
+            results.append(result)
+            print(_format_step(result), flush=True)
+            if not args.ramp or diverged(result, args.max_latency) or rate * args.ramp_factor > args.max_rate:
+                break
+            process.stdin.write(f"{generator.clear()}\n".encode())
+            await process.stdin.drain()
+            await asyncio.sleep(0.5)
+            rate *= args.ramp_factor
+        consumer_task.cancel()
+        await websocket.close()
+        return results
+    finally:
+        if process.returncode is None:
+            process.terminate()
+            await process.wait()
+
+
+async def _connect(websockets, port: int):
+    deadline = time.perf_counter() + CONNECT_TIMEOUT
+    while True:
+        try:
+            return await websockets.connect(f"ws://127.0.0.1:{port}", max_size=None, ping_interval=None)
+        except OSError:
+            if time.perf_counter() > deadline:
+                raise
+            await asyncio.sleep(0.1)
+
+
+def _free_port() -> int:
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+
+def _format_step(result: StepResult) -> str:
+    values = result.as_dict()
+    return (f"rate {values['target_rate']:>8,.0f}/s (achieved {values['achieved_rate']:>8,.0f}): "
+            f"{values['received']}/{values['probes']} probes, latency p50 {values['p50_ms']:.1f} ms, "
+            f"p90 {values['p90_ms']:.1f} ms, p99 {values['p99_ms']:.1f} ms, max {values['max_ms']:.1f} ms")
+
+
+def emit(args) -> None:
+    """Write the stream to stdout at the target rate (or as fast as possible with --rate 0)."""
+    generator = LoadGenerator(seed=args.seed)
+    out = sys.stdout
+    start = time.perf_counter()
+    written = 0
+    limit = args.lines
+    try:
+        while limit is None or written < limit:
+            elapsed = time.perf_counter() - start
+            if args.duration and elapsed >= args.duration:
+                break
+            due = int(elapsed * args.rate) - written if args.rate else 1000
+            if limit is not None:
+                due = min(due, limit - written)
+            if due > 0:
+                out.write(''.join(f"{line}\n" for line, _ in generator.lines(due)))
+                out.flush()
+                written += due
+            if args.rate:
+                time.sleep(TICK)
+    except BrokenPipeError:
+        # The reader went away (e.g. mapcat was stopped); exit quietly
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+
+
+def parse_args(argv=None):
+    parser_arg = argparse.ArgumentParser(description="Synthetic mapcat load generator and latency harness")
+    commands = parser_arg.add_subparsers(dest='mode', required=True)
+
+    emit_parser = commands.add_parser('emit', help="Write a command stream to stdout")
+    emit_parser.add_argument("--rate", type=float, default=1000, help="Lines per second; 0 = as fast as possible (default: 1000)")
+    emit_parser.add_argument("--duration", type=float, default=0, help="Stop after this many seconds (default: run until stopped)")
+    emit_parser.add_argument("--lines", type=int, default=None, help="Stop after this many lines")
+    emit_parser.add_argument("--seed", type=int, default=1, help="Random seed (default: 1)")
+
+    bench_parser = commands.add_parser('bench', help="Measure stdin-to-WebSocket latency of a local mapcat process")
+    bench_parser.add_argument("--rate", type=float, default=1000, help="Lines per second (start rate with --ramp; default: 1000)")
+    bench_parser.add_argument("--duration", type=float, default=5, help="Seconds per rate step (default: 5)")
+    bench_parser.add_argument("--ramp", action="store_true", help="Raise the rate until latency diverges and report the highest sustainable rate")
+    bench_parser.add_argument("--ramp-factor", type=float, default=1.5, help="Rate multiplier per step (default: 1.5)")
+    bench_parser.add_argument("--max-rate", type=float, default=1_000_000, help="Stop ramping at this rate (default: 1000000)")
+    bench_parser.add_argument("--max-latency", type=float, default=DEFAULT_MAX_LATENCY, help=f"p99 latency in seconds that counts as diverged (default: {DEFAULT_MAX_LATENCY})")
+    bench_parser.add_argument("--ack", action="store_true", help="Acknowledge messages like a browser, so mapcat's flow control is active")
+    bench_parser.add_argument("--port", type=int, default=0, help="Port for mapcat (default: a free port)")
+    bench_parser.add_argument("--seed", type=int, default=1, help="Random seed (default: 1)")
+    bench_parser.add_argument("--output", metavar="PATH", help="Write the step results as JSON")
+    bench_parser.add_argument("--show-stderr", action="store_true", help="Let mapcat's diagnostics through")
+    bench_parser.add_argument("mapcat_args", nargs=argparse.REMAINDER, help="Extra mapcat options after --")
+    args = parser_arg.parse_args(argv)
+    if args.mode == 'bench' and args.mapcat_args[:1] == ['--']:
+        args.mapcat_args = args.mapcat_args[1:]
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.mode == 'emit':
+        emit(args)
+        return
+
+    results = asyncio.run(bench(args))
+    sustainable = [result for result in results if not diverged(result, args.max_latency)]
+    if args.ramp:
+        if sustainable:
+            print(f"Max sustainable rate: {sustainable[-1].target_rate:,.0f} lines/sec "
+                  f"(p99 below {args.max_latency * 1000:.0f} ms, under {MAX_LOSS:.0%} loss)")
+        else:
+            print(f"Not sustainable even at {results[0].target_rate:,.0f} lines/sec")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'steps': [result.as_dict() for result in results],
+                'max_sustainable_rate': sustainable[-1].target_rate if sustainable else None,
+                'max_latency': args.max_latency,
+            }, f, indent=2)
+            f.write('\n')
+
+
+if __name__ == '__main__':
+    main()
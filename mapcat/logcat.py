@@ -0,0 +1,77 @@
+"""
+Parser for native logcat output (threadtime, time and brief formats).
+
+Lines whose tag is not TAG are rejected with a bounded substring search before
+any regex runs, so an unfiltered logcat stream costs one str.find() per
+foreign line.
+
+Formats:
+    threadtime: 10-19 12:34:56.789  1234  5678 D Mapcat  : <message>
+    time:       10-19 12:34:56.789 D/Mapcat( 1234): <message>
+    brief:      D/Mapcat( 1234): <message>
+"""
+import re
+from typing import Dict, Optional, Tuple
+
+TAG = 'Mapcat'
+
+# Tag position window: the threadtime header is 33 chars with 5-digit pid/tid,
+# modern pid_max allows 7 digits each.
+_THREADTIME_MARKER = f' {TAG} '
+_THREADTIME_COLON = f' {TAG}:'
+_THREADTIME_WINDOW = (28, 48)
+_BRIEF_MARKER = f'/{TAG}'
+_TIME_PREFIX_LEN = 19  # 'MM-DD HH:MM:SS.mmm '
+
+_THREADTIME_RE = re.compile(
+    r'(\d\d-\d\d \d\d:\d\d:\d\d\.\d+)\s+(\d+)\s+(\d+) ([VDIWEFA]) (\S+)\s*: ?(.*)', re.DOTALL)
+_BRIEF_RE = re.compile(r'([VDIWEFA])/(\S+?)\s*\(\s*(\d+)\): ?(.*)', re.DOTALL)
+_TIME_RE = re.compile(r'(\d\d-\d\d \d\d:\d\d:\d\d\.\d+) ')
+
+
+def parse_line(line: str) -> Optional[Tuple[str, Dict[str, str]]]:
+    """
+    Extract the message and metadata from a logcat line tagged TAG.
+
+    Args:
+        line: One logcat line (terminator allowed)
+
+    Returns:
+        (message, meta) where meta has 'level', 'pid' and, when present in the
+        format, 'time' and 'tid'; None for lines with another tag or no match.
+    """
+    # brief: 'D/Mapcat( 1234): ...'
+    if line.startswith(_BRIEF_MARKER, 1):
+        return _parse_brief(line, None)
+
+    # time: 'MM-DD HH:MM:SS.mmm D/Mapcat( 1234): ...'
+    if line.startswith(_BRIEF_MARKER, _TIME_PREFIX_LEN + 1):
+        match = _TIME_RE.match(line)
+        if match is None:
+            return None
+        return _parse_brief(line[match.end():], match.group(1))
+
+    # threadtime: tag sits after time, pid, tid and level
+    start, end = _THREADTIME_WINDOW
+    if line.find(_THREADTIME_MARKER, start, end) < 0 and line.find(_THREADTIME_COLON, start, end) < 0:
+        return None
+    match = _THREADTIME_RE.match(line)
+    if match is None or match.group(5) != TAG:
+        return None
+    message = match.group(6).rstrip('\r\n')
+    return message, {
+        'time': match.group(1),
+        'pid': match.group(2),
+        'tid': match.group(3),
+        'level': match.group(4),
+    }
+
+
+def _parse_brief(line: str, time: Optional[str]) -> Optional[Tuple[str, Dict[str, str]]]:
+    match = _BRIEF_RE.match(line)
+    if match is None or match.group(2) != TAG:
+        return None
+    meta = {'pid': match.group(3), 'level': match.group(1)}
+    if time is not None:
+        meta['time'] = time
+    return match.group(4).rstrip('\r\n'), meta
@@ -7,15 +7,15 @@ import sys
 import webbrowser
 import asyncio
 import json
-from mapcat import server, parser
+import os
+import re
+import signal
+import time
+from mapcat import server, parser, inputs, logcat, loader, capture, pipeline, ring, diagnostics, metrics, profiling, flow, stats, tiles, mbtiles
 from mapcat.state import State
 from mapcat.commands import COMMAND_HANDLERS
-from mapcat.chunker import Chunker
-
-# ANSI color codes
-RED = '\033[91m'
-GREEN = '\033[92m'
-RESET = '\033[0m'
+from mapcat.schema import COMMAND_SCHEMAS
+from mapcat.chunker import SourceChunkers
 
 # Import readline for better REPL experience (arrow keys, history)
 try:
@@ -25,13 +25,247 @@ except ImportError:
 
 def parse_args():
 	parser_arg = argparse.ArgumentParser(description="Mapcat CLI")
-	parser_arg.add_argument("--port", type=int, default=8080, help="Port for HTTP/WebSocket server (default: 8080)")
+	parser_arg.add_argument("--port", type=int, default=8080, help="Port for the HTTP and WebSocket server (default: 8080)")
 	parser_arg.add_argument("--no-open", action="store_true", help="Do not auto-open browser")
 	parser_arg.add_argument("--verbose", action="store_true", help="Print OK messages for successful commands")
+	parser_arg.add_argument("--log-format", choices=["text", "json"], default="text", help="Diagnostics format: colored text or one JSON object per line (default: text)")
+	parser_arg.add_argument("--log-rate", type=int, default=diagnostics.DEFAULT_RATE_LIMIT, metavar="N", help=f"Print at most N diagnostics per category per second, summarizing the rest (default: {diagnostics.DEFAULT_RATE_LIMIT}; 0 = unlimited)")
+	parser_arg.add_argument("--logcat", action="store_true", help="Inputs are native logcat output (threadtime/time/brief); only Mapcat-tagged lines are used")
+	parser_arg.add_argument("--load", metavar="PATH", help="Bulk-load a recorded command file (.gz/.zst allowed) before serving")
+	parser_arg.add_argument("--load-workers", type=int, default=None, metavar="N", help="Parser processes for --load (default: CPU count; 1 parses inline)")
+	parser_arg.add_argument("--load-pause-gc", action="store_true", help="Disable the garbage collector while --load runs")
+	parser_arg.add_argument("--parse-workers", type=int, default=None, metavar="N", help="Parser processes for large batches and long lines (default: CPU count; 1 parses on the event loop)")
+	parser_arg.add_argument("--parse-cache", type=int, default=parser.DEFAULT_CACHE_SIZE, metavar="N", help=f"Cache the parse results of up to N repeated long lines (default: {parser.DEFAULT_CACHE_SIZE}; 0 disables)")
+	parser_arg.add_argument("--max-unacked", type=int, default=flow.DEFAULT_MAX_UNACKED, metavar="N", help=f"Messages a browser may have unrendered before further updates are batched for it (default: {flow.DEFAULT_MAX_UNACKED}; 0 disables flow control)")
+	parser_arg.add_argument("--profile", action="store_true", help="Time every command per stage (read, chunk, parse, handler, serialize, broadcast) and print latency percentiles at exit")
+	parser_arg.add_argument("--profile-trace", metavar="PATH", help="With profiling, write every timed stage to a Chrome trace-event file at exit (implies --profile)")
+	parser_arg.add_argument("--profile-sample", metavar="PATH", help="Sample the main thread's stack every millisecond and write folded stacks for flame graphs at exit (implies --profile)")
+	parser_arg.add_argument("--record", metavar="PATH", help="Record every raw input line with its timing to a capture file (.gz compresses)")
+	parser_arg.add_argument("--replay", metavar="PATH", help="Replay a capture file through the input pipeline")
+	parser_arg.add_argument("--replay-speed", type=_replay_speed, default=1.0, metavar="SPEED", help="Replay speed factor, or 'max' for no delays (default: 1)")
+	parser_arg.add_argument("--file", action="append", default=[], metavar="PATH", help="Also read commands from a file (repeatable)")
+	parser_arg.add_argument("--follow", action="append", default=[], metavar="PATH", help="Read a file and keep following it like tail -F, across rotation and truncation (repeatable)")
+	parser_arg.add_argument("--fifo", action="append", default=[], metavar="PATH", help="Read commands from a named pipe, re-opening it for each writer (repeatable)")
+	parser_arg.add_argument("--tcp", action="append", default=[], type=_listen_address, metavar="[HOST:]PORT", help="Accept command lines over TCP (default host: 127.0.0.1; repeatable)")
+	parser_arg.add_argument("--udp", action="append", default=[], type=_listen_address, metavar="[HOST:]PORT", help="Accept command lines as UDP datagrams (default host: 127.0.0.1; repeatable)")
+	tile_sources = parser_arg.add_mutually_exclusive_group()
+	tile_sources.add_argument("--tile-cache", metavar="DIR", help="Serve map tiles through mapcat, cached on disk in DIR")
+	tile_sources.add_argument("--mbtiles", metavar="PATH", help="Serve map tiles from a local MBTiles archive (raster: png, jpg, webp)")
+	parser_arg.add_argument("--tile-cache-size", type=int, default=tiles.DEFAULT_CACHE_MB, metavar="MB", help=f"Size limit of the tile cache; least recently used tiles are deleted (default: {tiles.DEFAULT_CACHE_MB})")
+	parser_arg.add_argument("--tile-upstream", default=tiles.DEFAULT_UPSTREAM, metavar="URL", help="Tile server for --tile-cache, with {z}, {x}, {y} and optionally {s} (default: OpenStreetMap)")
+	parser_arg.add_argument("--mbtiles-connections", type=int, default=mbtiles.DEFAULT_CONNECTIONS, metavar="N", help=f"Read-only SQLite connections for --mbtiles (default: {mbtiles.DEFAULT_CONNECTIONS})")
+	parser_arg.add_argument("--mbtiles-hot-cache", type=int, default=mbtiles.DEFAULT_HOT_CACHE_MB, metavar="MB", help=f"Memory for recently served --mbtiles tiles (default: {mbtiles.DEFAULT_HOT_CACHE_MB})")
+	parser_arg.add_argument("--ring", action="append", default=[], metavar="PATH", help="Consume a shared-memory ring buffer file, creating it if needed (repeatable)")
 	return parser_arg.parse_args()
 
 
-async def stdin_broadcast_loop(is_tty, state, verbose):
+def _listen_address(value):
+	"""argparse type for [HOST:]PORT."""
+	try:
+		return inputs.parse_listen_address(value)
+	except ValueError:
+		raise argparse.ArgumentTypeError(f"expected [HOST:]PORT, got '{value}'")
+
+
+def _replay_speed(value):
+	"""argparse type for --replay-speed: a positive factor or 'max' (None)."""
+	if value == 'max':
+		return None
+	try:
+		speed = float(value)
+	except ValueError:
+		speed = 0
+	if speed <= 0:
+		raise argparse.ArgumentTypeError(f"expected a positive number or 'max', got '{value}'")
+	return speed
+
+
+async def replay(path, sink, speed, ingest=None):
+	"""Run --replay and report the achieved throughput (including the apply stage)."""
+	try:
+		stats = await capture.run_replay(path, sink, speed)
+		if ingest is not None:
+			start = time.perf_counter()
+			await ingest.join()
+			stats.seconds += time.perf_counter() - start
+	except capture.CaptureError as e:
+		_log_error("replay", str(e))
+		return
+	print(f"Replayed {stats.lines} lines in {stats.seconds:.2f}s = {stats.lines_per_sec:,.0f} lines/sec")
+
+
+def make_line_sink(state, chunkers, verbose, logcat_format=False, ingest=None):
+	"""
+	Build the sink coroutine that input sources feed their lines into.
+
+	Every source tag gets its own chunk session namespace from chunkers.
+	With logcat_format, only lines tagged Mapcat are processed; each logcat pid
+	is its own source and the time/pid/tid metadata is attached to features.
+
+	Args:
+		state: State instance
+		chunkers: SourceChunkers shared by all inputs
+		verbose: True if OK messages should be printed
+		logcat_format: True if lines are native logcat output
+		ingest: Optional IngestPipeline (see make_ingest_pipeline); lines are
+			then parsed by its workers and applied by its ordered apply stage
+	"""
+	if logcat_format:
+		def entries_of(source, lines):
+			entries = []
+			for line in lines:
+				entry = logcat.parse_line(line)
+				if entry is not None:
+					message, meta = entry
+					entries.append((message, chunkers.for_source(f"{source}:pid={meta['pid']}"), meta))
+			return entries
+	else:
+		def entries_of(source, lines):
+			chunker = chunkers.for_source(source)
+			return [(line, chunker, None) for line in lines]
+
+	if ingest is not None:
+		async def sink(source, lines):
+			metrics.INPUT_LINES.inc(len(lines), metrics.input_kind(source))
+			await ingest.submit(entries_of(source, lines))
+		return sink
+
+	async def sink(source, lines):
+		received = time.monotonic()
+		metrics.INPUT_LINES.inc(len(lines), metrics.input_kind(source))
+		for line, chunker, meta in entries_of(source, lines):
+			await handle_line(line, state, chunker, False, verbose, meta)
+		metrics.END_TO_END_LATENCY.observe(time.monotonic() - received)
+	return sink
+
+
+def make_command_sink(state, verbose, ingest=None):
+	"""
+	Build the sink for commands that arrive already parsed (binary ring records).
+
+	Lines still queued in ingest are applied first, so commands keep their order
+	relative to text lines of the same source.
+	"""
+	async def command_sink(source, commands):
+		if ingest is not None:
+			await ingest.join()
+		for parsed in commands:
+			await _dispatch(state, parsed, parsed['_original_line'], False, verbose)
+	return command_sink
+
+
+def make_ingest_pipeline(state, verbose, workers):
+	"""
+	Build an IngestPipeline whose entries are (line, chunker, meta) tuples.
+
+	Lines pre-parsed by the worker pool go straight to their handler; chunked
+	protocol lines and batches parsed inline take the regular handle_line path.
+	Under --profile, a pre-parsed line's 'parse' stage is the time measured in
+	the worker and its 'total' stage starts when its batch was submitted.
+	"""
+	async def apply(entries, results, submitted):
+		if results is None:
+			for line, chunker, meta in entries:
+				await handle_line(line, state, chunker, False, verbose, meta)
+			return
+		for (line, chunker, meta), parsed in zip(entries, results):
+			# Raw results need the sequential chunk protocol; a command name that is
+			# also an open session id is a chunk line too
+			if isinstance(parsed, str) or (parsed is not None and chunker.has_session(parsed['cmd'])):
+				await handle_line(line, state, chunker, False, verbose, meta)
+			elif parsed is None:
+				metrics.PARSE_FAILURES.inc()
+				_log_error("parse", "Invalid command", line.strip())
+			else:
+				parsed['meta'] = meta
+				parse_ns = parsed.pop('_parse_ns', None)
+				if parse_ns is not None and profiling.active:
+					profiling.active.record_duration('parse', parsed['cmd'], parse_ns)
+				await _dispatch(state, parsed, parsed['_original_line'], False, verbose, started=submitted)
+
+	return pipeline.IngestPipeline(apply, lambda entry: entry[0], workers)
+
+
+async def bulk_load(args, state, chunkers, verbose):
+	"""
+	Run --load: populate state from a command file and report throughput.
+
+	Returns:
+		True on success, False if the file could not be read.
+	"""
+	chunker = chunkers.for_source(f"file:{args.load}")
+
+	async def apply_raw(line):
+		await handle_line(line, state, chunker, False, verbose)
+
+	print(f"Loading {args.load}...")
+	try:
+		stats = await loader.load_file(args.load, state, apply_raw, args.load_workers, args.load_pause_gc)
+	except loader.LoadError as e:
+		_log_error("load", str(e))
+		return False
+	print(
+		f"Loaded {stats.lines} lines ({stats.bytes / (1024 * 1024):.1f} MB) in {stats.seconds:.2f}s "
+		f"= {stats.mb_per_sec:.1f} MB/s, {len(state.features)} features, {stats.failed} failed"
+	)
+	return True
+
+
+def register_metrics(state, chunkers):
+	"""Expose State and chunker sizes on /metrics; read only when scraped."""
+	def collect():
+		sessions, buffered = chunkers.pending_stats()
+		return [
+			('mapcat_features', 'gauge', 'Features on the map, by type',
+				[({'type': feature_type}, count) for feature_type, count in state.feature_counts.items()]),
+			('mapcat_vertices', 'gauge', 'Coordinates of the features on the map, by type',
+				[({'type': feature_type}, count) for feature_type, count in state.vertex_counts.items()]),
+			('mapcat_chunk_sessions', 'gauge', 'Open chunked sessions over all sources', [({}, sessions)]),
+			('mapcat_chunk_buffered_bytes', 'gauge', 'Content buffered in open chunked sessions', [({}, buffered)]),
+		]
+	metrics.REGISTRY.add_collector('state', collect)
+
+
+def register_stats(chunkers, ingest=None):
+	"""Report chunk sessions and the ingest queue in the stats command and GET /stats."""
+	def chunker_stats():
+		sessions, buffered = chunkers.pending_stats()
+		return {'sessions': sessions, 'buffered_bytes': buffered}
+	stats.add_source('chunker', chunker_stats)
+	if ingest is not None:
+		def ingest_stats():
+			queued, capacity = ingest.queued()
+			return {'queued_batches': queued, 'max_batches': capacity}
+		stats.add_source('ingest', ingest_stats)
+
+
+def start_input_sources(args, sink, replay_sink=None, ingest=None, command_sink=None):
+	"""
+	Start one task per --file/--follow/--fifo/--tcp/--udp/--ring/--replay option.
+
+	Args:
+		args: Parsed command-line arguments
+		sink: Sink for live sources (possibly recording)
+		replay_sink: Sink for --replay, which must not be recorded again (default: sink)
+		ingest: IngestPipeline behind the sinks, if any
+		command_sink: Sink for pre-parsed binary ring records (see make_command_sink)
+
+	Returns:
+		List of asyncio tasks running the sources.
+	"""
+	sources = []
+	if args.replay:
+		sources.append(replay(args.replay, replay_sink or sink, args.replay_speed, ingest))
+	sources += [inputs.run_file(path, sink) for path in args.file]
+	sources += [inputs.run_file(path, sink, follow=True) for path in args.follow]
+	sources += [inputs.run_fifo(path, sink) for path in args.fifo]
+	sources += [inputs.run_tcp_listener(host, port, sink) for host, port in args.tcp]
+	sources += [inputs.run_udp_listener(host, port, sink) for host, port in args.udp]
+	sources += [ring.run_ring(path, sink, command_sink) for path in args.ring]
+	return [asyncio.create_task(source) for source in sources]
+
+
+async def stdin_broadcast_loop(is_tty, state, verbose, chunkers=None, source='stdin', sink=None, recorder=None):
 	"""
 	Read stdin and broadcast lines.
 	If is_tty, run in REPL mode with prompts.
@@ -41,137 +275,226 @@ async def stdin_broadcast_loop(is_tty, state, verbose):
 		is_tty: True if running in interactive TTY mode
 		state: State instance
 		verbose: True if OK messages should be printed
+		chunkers: Optional SourceChunkers shared with other inputs
+		source: Source tag of this input; chunk sessions are namespaced by it
+		sink: Optional sink for piped input (see make_line_sink); it must record
+			lines itself if recording is wanted
+		recorder: Optional capture.Recorder receiving REPL lines
 	"""
 	loop = asyncio.get_event_loop()
-	chunker = Chunker()
+	if chunkers is None:
+		chunkers = SourceChunkers()
 
 	try:
-		while True:
-			# Read line
-			if is_tty:
-				# Use input() for interactive mode (supports readline)
-				try:
-					line = await loop.run_in_executor(None, input, "> ")
-				except EOFError:
-					print("\nExit")
-					break
+		if not is_tty:
+			# Piped mode: read stdin in large blocks; fall back to readline() for
+			# stream objects without a file descriptor
+			if inputs.has_fileno(sys.stdin):
+				batches = inputs.read_lines_bulk(sys.stdin)
 			else:
-				# Use stdin.readline() for piped mode
-				line = await loop.run_in_executor(None, sys.stdin.readline)
-				if not line:
-					break
-
-			line = line.strip()
-
-			# Skip empty lines
-			if not line:
-				continue
-
-			# --- Chunked protocol ---
-			# Check early (before parse_command) whether the first token is a known session
-			# ID, so it isn't treated as an unknown command.
-			first_token = line.split(None, 1)[0]
-			if chunker.has_session(first_token):
-				rest = line.split(None, 1)[1] if ' ' in line else ''
-				seq, content = _extract_seq(rest)
-				if seq is None:
-					_log_error("chunk", "Missing seq=<N> on chunk line", line)
-					if is_tty:
-						print("< ERROR: Missing seq=<N> on chunk line")
-				else:
-					chunker.add_chunk(first_token, seq, content)
-				continue
-
-			# Parse command normally (handles begin, commit, and all existing commands)
-			parsed = parser.parse_command(line)
-			if not parsed:
-				_log_error("parse", "Invalid command", line)
-				if is_tty:
-					print("< ERROR: Invalid command")
-				continue  # Parser already logged error
-
-			# begin → open session
-			if parsed['cmd'] == 'begin':
-				session_id = parsed['params'].get('id', '')
-				if not session_id:
-					_log_error("begin", "begin requires id=<id>", line)
-					if is_tty:
-						print("< ERROR: begin requires id=<id>")
-				else:
-					chunker.open_session(session_id)
-				continue
-
-			# commit → assemble chunks and dispatch
-			if parsed['cmd'] == 'commit':
-				session_id = parsed['params'].get('id', '')
-				try:
-					total = int(parsed['params'].get('total', 0))
-				except ValueError:
-					_log_error("commit", "total must be a number", line)
-					if is_tty:
-						print("< ERROR: commit total must be a number")
-					continue
-				if not session_id:
-					_log_error("commit", "commit requires id=<id>", line)
-					if is_tty:
-						print("< ERROR: commit requires id=<id>")
-					continue
-				assembled = chunker.commit_session(session_id, total)
-				if assembled:
-					assembled['_original_line'] = line
-					handler = COMMAND_HANDLERS.get(assembled['cmd'])
-					if not handler:
-						_log_error(assembled['cmd'], "Unknown command in assembled chunk", line)
-						if is_tty:
-							print(f"< ERROR: Unknown command '{assembled['cmd']}'")
-						continue
-					message = handler(state, assembled)
-					if message:
-						await server.broadcast(json.dumps(message))
-						if verbose:
-							_log_success(assembled['cmd'], line)
-						if is_tty:
-							print(f"< OK {assembled['cmd']} id={message.get('id', 'N/A')}")
-					elif assembled['cmd'] != 'help':
-						if is_tty:
-							print("< ERROR: Command failed")
-				continue
-			# --- End chunked protocol ---
-
-			# Add original line to parsed command for error reporting
-			parsed['_original_line'] = line
-
-			# Get handler
-			handler = COMMAND_HANDLERS.get(parsed['cmd'])
-			if not handler:
-				_log_error(parsed['cmd'], f"Unknown command", line)
-				if is_tty:
-					print(f"< ERROR: Unknown command '{parsed['cmd']}'")
-				continue
-
-			# Execute handler
-			message = handler(state, parsed)
-			if message:
-				# Broadcast to WebSocket clients
-				await server.broadcast(json.dumps(message))
-
-				# Log success to stdout (if verbose)
-				if verbose:
-					_log_success(parsed['cmd'], line)
-
-				# Echo response in REPL mode
-				if is_tty:
-					print(f"< OK {parsed['cmd']} id={message.get('id', 'N/A')}")
-			elif parsed['cmd'] != 'help':
-				# Handler returned None (failed) - error already logged by handler
-				if is_tty:
-					print(f"< ERROR: Command failed")
+				batches = inputs.read_lines_executor(sys.stdin)
+			if sink is None:
+				sink = make_line_sink(state, chunkers, verbose)
+			if profiling.active:
+				batches = profiling.active.timed(batches)
+			async for batch in batches:
+				await sink(source, batch)
+			if recorder is not None:
+				recorder.flush()
+			return
+
+		chunker = chunkers.for_source(source)
+
+		while True:
+			# Use input() for interactive mode (supports readline)
+			try:
+				line = await loop.run_in_executor(None, input, "> ")
+			except EOFError:
+				print("\nExit")
+				break
+
+			if recorder is not None:
+				recorder.record(source, [line])
+			metrics.INPUT_LINES.inc(1, source)
+			await handle_line(line, state, chunker, is_tty, verbose)
 	except KeyboardInterrupt:
 		if is_tty:
 			print("\nExit")
 		sys.exit(0)
 
 
+async def handle_line(line, state, chunker, is_tty, verbose, meta=None):
+	"""
+	Process one raw input line: chunk reassembly, parsing, handler and broadcast.
+
+	Args:
+		line: Raw input line (may still carry its line terminator)
+		state: State instance
+		chunker: Chunker holding the pending sessions of the line's source
+		is_tty: True if running in interactive TTY mode
+		verbose: True if OK messages should be printed
+		meta: Optional source metadata (e.g. logcat time/pid/tid) attached to added features
+	"""
+	profiler = profiling.active
+	started = profiling.now() if profiler else 0
+
+	# Self-describing chunks keep their content verbatim (a split may fall on a space),
+	# so the header is matched before the line is stripped.
+	chunk_v2 = _parse_chunk_v2(line)
+	if chunk_v2 is not None:
+		session_id, seq, total, content = chunk_v2
+		assembled = chunker.add_chunk_v2(session_id, seq, total, content)
+		if profiler:
+			profiler.record('chunk', 'chunk', started)
+		if assembled:
+			assembled['_original_line'] = line.strip()
+			assembled['meta'] = meta
+			await _dispatch(state, assembled, line.strip(), is_tty, verbose, "Unknown command in assembled chunk", started)
+		return
+
+	line = line.strip()
+
+	# Skip empty lines
+	if not line:
+		return
+
+	# --- Chunked protocol ---
+	# Check early (before parse_command) whether the first token is a known session
+	# ID, so it isn't treated as an unknown command.
+	first_token = line.split(None, 1)[0]
+	if first_token == 'chunk':
+		_log_error("chunk", "chunk requires <id> <seq>/<total> <content>", line)
+		if is_tty:
+			print("< ERROR: chunk requires <id> <seq>/<total> <content>")
+		return
+	if chunker.has_session(first_token):
+		rest = line.split(None, 1)[1] if ' ' in line else ''
+		seq, content = _extract_seq(rest)
+		if seq is None:
+			_log_error("chunk", "Missing seq=<N> on chunk line", line)
+			if is_tty:
+				print("< ERROR: Missing seq=<N> on chunk line")
+		else:
+			chunker.add_chunk(first_token, seq, content)
+			if profiler:
+				profiler.record('chunk', 'chunk', started)
+		return
+
+	# Parse command normally (handles begin, commit, and all existing commands)
+	parsed = parser.parse_command(line)
+	if profiler:
+		profiler.record('parse', parsed['cmd'] if parsed else 'invalid', started)
+	if not parsed:
+		metrics.PARSE_FAILURES.inc()
+		_log_error("parse", "Invalid command", line)
+		if is_tty:
+			print("< ERROR: Invalid command")
+		return  # Parser already logged error
+
+	# begin → open session
+	if parsed['cmd'] == 'begin':
+		session_id = parsed['params'].get('id', '')
+		if not session_id:
+			_log_error("begin", "begin requires id=<id>", line)
+			if is_tty:
+				print("< ERROR: begin requires id=<id>")
+		else:
+			chunker.open_session(session_id)
+			if profiler:
+				profiler.record('chunk', 'begin', started)
+		return
+
+	# commit → assemble chunks and dispatch
+	if parsed['cmd'] == 'commit':
+		session_id = parsed['params'].get('id', '')
+		try:
+			total = int(parsed['params'].get('total', 0))
+		except ValueError:
+			_log_error("commit", "total must be a number", line)
+			if is_tty:
+				print("< ERROR: commit total must be a number")
+			return
+		if not session_id:
+			_log_error("commit", "commit requires id=<id>", line)
+			if is_tty:
+				print("< ERROR: commit requires id=<id>")
+			return
+		assembled = chunker.commit_session(session_id, total)
+		if profiler:
+			profiler.record('chunk', 'commit', started)
+		if assembled:
+			assembled['_original_line'] = line
+			assembled['meta'] = meta
+			await _dispatch(state, assembled, line, is_tty, verbose, "Unknown command in assembled chunk", started)
+		return
+	# --- End chunked protocol ---
+
+	# Add original line to parsed command for error reporting
+	parsed['_original_line'] = line
+	parsed['meta'] = meta
+	await _dispatch(state, parsed, line, is_tty, verbose, started=started)
+
+
+async def _dispatch(state, parsed, line, is_tty, verbose, unknown_message="Unknown command", started=0):
+	"""
+	Run the handler for a parsed command and broadcast its result.
+
+	Args:
+		state: State instance
+		parsed: Parsed command dict
+		line: Original command line (for logging)
+		is_tty: True if running in interactive TTY mode
+		verbose: True if OK messages should be printed
+		unknown_message: Error message logged when no handler exists
+		started: profiling.now() timestamp of the start of the line, for the
+			'total' stage of --profile (0: not recorded)
+	"""
+	# Get handler
+	handler = COMMAND_HANDLERS.get(parsed['cmd'])
+	if not handler:
+		metrics.HANDLER_FAILURES.inc(1, 'unknown')
+		_log_error(parsed['cmd'], unknown_message, line)
+		if is_tty:
+			print(f"< ERROR: Unknown command '{parsed['cmd']}'")
+		return
+
+	# Execute handler
+	profiler = profiling.active
+	if profiler:
+		stage_start = profiling.now()
+	message = handler(state, parsed)
+	if profiler:
+		stage_start = profiler.record('handler', parsed['cmd'], stage_start)
+	if message:
+		metrics.COMMANDS.inc(1, parsed['cmd'])
+		if parsed.get('meta') and message['action'] == 'add':
+			state.get_feature(message['id'])['meta'] = parsed['meta']
+			message['meta'] = parsed['meta']
+
+		# Broadcast to WebSocket clients
+		payload = json.dumps(message)
+		if profiler:
+			stage_start = profiler.record('serialize', parsed['cmd'], stage_start)
+		await server.broadcast(payload)
+		if profiler:
+			profiler.record('broadcast', parsed['cmd'], stage_start)
+			if started:
+				profiler.record('total', parsed['cmd'], started)
+
+		# Log success to stdout (if verbose)
+		if verbose:
+			_log_success(parsed['cmd'], line)
+
+		# Echo response in REPL mode
+		if is_tty:
+			print(f"< OK {parsed['cmd']} id={message.get('id', 'N/A')}")
+	elif not COMMAND_SCHEMAS[parsed['cmd']].informational:
+		# Handler returned None (failed) - error already logged by handler
+		metrics.HANDLER_FAILURES.inc(1, parsed['cmd'])
+		if is_tty:
+			print(f"< ERROR: Command failed")
+
+
 def main():
 	args = parse_args()
 	port = args.port
@@ -181,11 +504,33 @@ def main():
 	# Detect if stdin is a TTY (interactive) or piped
 	is_tty = sys.stdin.isatty()
 	
+	# Piped input is logged from a background writer; the REPL logs inline so
+	# errors appear before the next prompt
+	diagnostics.configure(buffered=not is_tty, rate_limit=args.log_rate, json_format=args.log_format == 'json')
+
 	# Initialize state
 	state = State()
+	parser.enable_cache(args.parse_cache)
+	if args.profile or args.profile_trace or args.profile_sample:
+		profiling.start(args.profile_trace, args.profile_sample)
 	
 	# Register state getter for new WebSocket connections
 	server.set_state_getter(lambda: state)
+	server.set_max_unacked(args.max_unacked)
+	if args.tile_cache:
+		try:
+			server.set_tile_source(tiles.TileCache(args.tile_cache, args.tile_cache_size * 1024 * 1024, args.tile_upstream))
+		except OSError as e:
+			_log_error("tiles", f"cannot use tile cache {args.tile_cache}: {e}")
+			diagnostics.get().close()  # the buffered writer would not get to print it
+			sys.exit(1)
+	elif args.mbtiles:
+		try:
+			server.set_tile_source(mbtiles.MBTilesSource(args.mbtiles, args.mbtiles_connections, args.mbtiles_hot_cache * 1024 * 1024))
+		except mbtiles.MBTilesError as e:
+			_log_error("tiles", str(e))
+			diagnostics.get().close()  # the buffered writer would not get to print it
+			sys.exit(1)
 
 	print(f"Starting Mapcat server on port {port}...")
 	
@@ -194,37 +539,82 @@ def main():
 	else:
 		print("Reading commands from stdin...")
 
-	# Start HTTP server in background
-	server.start_http_server(port)
-
-	# Start WebSocket server and stdin loop
+	recorder = None
+	if args.record:
+		try:
+			recorder = capture.Recorder(args.record)
+		except capture.CaptureError as e:
+			_log_error("record", str(e))
+			diagnostics.get().close()  # the buffered writer would not get to print it
+			sys.exit(1)
+		print(f"Recording input to {args.record}")
+
+	# Start HTTP/WebSocket server, extra input sources and stdin loop
 	async def runner():
-		ws_server = await server.start_ws_server(port)
+		chunkers = SourceChunkers()
+		register_metrics(state, chunkers)
+		lag_task = asyncio.create_task(metrics.monitor_loop_lag())
+		# Bulk load before serving, so browsers receive the loaded state as one snapshot
+		if args.load:
+			await bulk_load(args, state, chunkers, verbose)
+		ws_server = await server.start_server(port)
+		workers = args.parse_workers if args.parse_workers is not None else (os.cpu_count() or 1)
+		ingest = make_ingest_pipeline(state, verbose, workers) if workers > 1 else None
+		register_stats(chunkers, ingest)
+		sink = make_line_sink(state, chunkers, verbose, args.logcat, ingest)
+		live_sink = recorder.wrap(sink) if recorder else sink
+		command_sink = make_command_sink(state, verbose, ingest)
+		source_tasks = start_input_sources(args, live_sink, sink, ingest, command_sink)
 		async with ws_server:
-			# In piped mode, delay browser opening to ensure server is ready
-			if not is_tty and not no_open:
+			# In piped mode (or after a bulk load), delay browser opening to ensure server is ready
+			if (not is_tty or args.load) and not no_open:
 				await asyncio.sleep(0.5)
 				url = f"http://localhost:{port}/"
 				print(f"Opening browser at {url}")
 				webbrowser.open(url)
 			
-			await stdin_broadcast_loop(is_tty, state, verbose)
+			await stdin_broadcast_loop(is_tty, state, verbose, chunkers, sink=live_sink, recorder=recorder)
+			if ingest is not None:
+				await ingest.join()
 			
 			# Keep server running after stdin closes (for piped mode)
 			if not is_tty:
+				cache = parser.get_cache()
+				if verbose and cache is not None:
+					cache_stats = cache.stats()
+					print(f"Parse cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses ({cache_stats['hit_rate']:.0%})", file=sys.stderr)
 				print("Commands processed. Server running. Press Ctrl+C to exit.")
 				try:
 					await asyncio.Future()  # Run forever
 				except asyncio.CancelledError:
 					pass
 
+			for task in source_tasks + [lag_task]:
+				task.cancel()
+			if ingest is not None:
+				ingest.close()
+
 	# Open browser immediately in interactive mode
-	if is_tty and not no_open:
+	if is_tty and not no_open and not args.load:
 		url = f"http://localhost:{port}/"
 		print(f"Opening browser at {url}")
 		webbrowser.open(url)
 
-	asyncio.run(runner())
+	# Turn SIGTERM into a normal exit so the capture file is closed properly
+	signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+	try:
+		asyncio.run(runner())
+	finally:
+		if recorder is not None:
+			recorder.close()
+		try:
+			profiler = profiling.stop()
+		except profiling.ProfileError as e:
+			_log_error("profile", str(e))
+		else:
+			if profiler is not None:
+				print(profiler.report(), file=sys.stderr)
+		diagnostics.get().close()
 
 
 def _extract_seq(text: str):
@@ -234,7 +624,6 @@ def _extract_seq(text: str):
     Returns:
         (seq, content_without_seq) on success, or (None, text) if seq is missing/invalid.
     """
-    import re
     matches = list(re.finditer(r'(?:^|\s)seq=(\d+)(?:\s|$)', text))
     if not matches:
         return None, text
@@ -244,6 +633,28 @@ def _extract_seq(text: str):
     return seq, content
 
 
+_CHUNK_V2_RE = re.compile(r'chunk (\S+) (\d+)/(\d+)(?: (.*))?', re.DOTALL)
+
+
+def _parse_chunk_v2(line: str):
+    """
+    Parse a self-describing chunk line: chunk <id> <seq>/<total> <content>
+
+    Content is everything after the single space following the header, kept
+    verbatim (only the line terminator is removed).
+
+    Returns:
+        (session_id, seq, total, content) or None if the line is not a v2 chunk.
+    """
+    line = line.lstrip()
+    if not line.startswith('chunk '):
+        return None
+    match = _CHUNK_V2_RE.fullmatch(line.rstrip('\r\n'))
+    if not match:
+        return None
+    return match.group(1), int(match.group(2)), int(match.group(3)), match.group(4) or ''
+
+
 def _log_success(cmd: str, line: str):
     """
     Log success to stdout in green.
@@ -262,7 +673,7 @@ def _log_success(cmd: str, line: str):
     else:
         params_preview = params
     
-    print(f"{GREEN}OK: {cmd} {params_preview}{RESET}")
+    diagnostics.success(cmd, f"{cmd} {params_preview}")
 
 
 def _log_error(cmd: str, message: str, line: str = ""):
@@ -285,10 +696,9 @@ def _log_error(cmd: str, message: str, line: str = ""):
         else:
             params_preview = params
         
-        print(f"{RED}FAIL: {cmd} {params_preview}{RESET}", file=sys.stderr)
+        diagnostics.error(cmd, message, f"{cmd} {params_preview}")
     else:
-        print(f"{RED}FAIL: {cmd}{RESET}", file=sys.stderr)
-    print(f"{RED}FAIL: {message}{RESET}", file=sys.stderr)
+        diagnostics.error(cmd, message)
 
 
 if __name__ == "__main__":
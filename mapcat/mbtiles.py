@@ -0,0 +1,204 @@
+"""
+Map tiles from a local MBTiles archive, for rigs without network access.
+
+An MBTiles file is an SQLite database with a `tiles` table (zoom_level,
+tile_column, tile_row, tile_data; rows counted from the south, TMS style) and
+a `metadata` table of name/value pairs (format, minzoom, maxzoom, bounds,
+attribution, ...). See https://github.com/mapbox/mbtiles-spec.
+
+MBTilesSource has the tile source interface of tiles.TileCache. Lookups run
+in worker threads on a small pool of read-only connections; recently served
+tiles are kept in memory, so panning over the same area never touches SQLite.
+"""
+import asyncio
+import os
+import queue
+import sqlite3
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from mapcat.tiles import MAX_ZOOM, TILE_PATH, Key, Tile, TileError, image_type, valid_tile
+
+DEFAULT_CONNECTIONS = 4
+DEFAULT_HOT_CACHE_MB = 64
+RASTER_FORMATS = ('png', 'jpg', 'jpeg', 'webp')
+VIEW_MAX_ZOOM = 19  # Leaflet may zoom past the archive's maxzoom, scaling up its deepest tiles
+
+
+class MBTilesError(Exception):
+    """The file is not a usable MBTiles archive."""
+
+
+class MBTilesSource:
+    """
+    Serve tiles from an MBTiles archive.
+
+    Args:
+        path: MBTiles file
+        connections: Read-only SQLite connections shared by concurrent lookups
+        hot_bytes: Size limit of the in-memory cache of recently served tiles
+
+    Raises:
+        MBTilesError: If the file cannot be opened, has no tiles table or holds vector tiles
+    """
+
+    def __init__(self, path: str, connections: int = DEFAULT_CONNECTIONS,
+                 hot_bytes: int = DEFAULT_HOT_CACHE_MB * 1024 * 1024):
+        if not os.path.isfile(path):
+            raise MBTilesError(f"{path}: no such file")
+        self.path = path
+        self.hot_bytes = hot_bytes
+        self.hot: 'OrderedDict[Key, Tile]' = OrderedDict()  # least recently used first
+        self.hot_total = 0
+        self.hits = 0
+        self.reads = 0
+        self.missing = 0
+        self.errors = 0
+        self._pool: 'queue.LifoQueue[sqlite3.Connection]' = queue.LifoQueue()
+        try:
+            for _ in range(max(connections, 1)):
+                self._pool.put(self._connect())
+            self.metadata = self._read_metadata()
+        except sqlite3.Error as e:
+            self.close()
+            raise MBTilesError(f"{path}: {e}")
+        self.format = self.metadata.get('format', 'png').lower()
+        if self.format not in RASTER_FORMATS:
+            self.close()
+            raise MBTilesError(f"{path}: '{self.format}' tiles are not supported, the map shows raster tiles (png, jpg, webp) only")
+        self.min_zoom = _int(self.metadata.get('minzoom'), 0)
+        self.max_zoom = _int(self.metadata.get('maxzoom'), MAX_ZOOM)
+
+    def _connect(self) -> sqlite3.Connection:
+        # Read-only and immutable: no locking or journal files next to the archive
+        uri = f"file:{os.path.abspath(self.path)}?mode=ro&immutable=1"
+        return sqlite3.connect(uri, uri=True, check_same_thread=False)
+
+    def _read_metadata(self) -> Dict[str, str]:
+        connection = self._pool.get()
+        try:
+            connection.execute("SELECT 1 FROM tiles LIMIT 1").fetchall()
+            try:
+                rows = connection.execute("SELECT name, value FROM metadata").fetchall()
+            except sqlite3.OperationalError:
+                rows = []  # metadata is optional in practice
+        finally:
+            self._pool.put(connection)
+        return {str(name): str(value) for name, value in rows if name is not None and value is not None}
+
+    async def get(self, z: int, x: int, y: int) -> Optional[Tile]:
+        """
+        Return a tile from the hot cache or the archive.
+
+        Returns:
+            The tile, or None if the archive does not have it
+
+        Raises:
+            TileError: If the archive could not be read
+        """
+        if not valid_tile(z, x, y, self.max_zoom):
+            return None
+        key = (z, x, y)
+        tile = self.hot.get(key)
+        if tile is not None:
+            self.hits += 1
+            self.hot.move_to_end(key)
+            return tile
+        self.reads += 1
+        try:
+            data = await asyncio.to_thread(self._query, key)
+        except TileError:
+            self.errors += 1
+            raise
+        if data is None:
+            self.missing += 1
+            return None
+        tile = Tile(data, image_type(data))
+        if key not in self.hot:
+            self.hot[key] = tile
+            self.hot_total += len(data)
+            while self.hot_total > self.hot_bytes and self.hot:
+                _, evicted = self.hot.popitem(last=False)
+                self.hot_total -= len(evicted.data)
+        return tile
+
+    def _query(self, key: Key) -> Optional[bytes]:
+        """Runs in a worker thread, on a connection taken from the pool."""
+        z, x, y = key
+        connection = self._pool.get()
+        try:
+            row = connection.execute(
+                "SELECT tile_data FROM tiles WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?",
+                (z, x, (1 << z) - 1 - y)).fetchone()
+        except sqlite3.Error as e:
+            # A broken archive must not look like missing tiles
+            raise TileError(f"{self.path}: cannot read tile {z}/{x}/{y}: {e}")
+        finally:
+            self._pool.put(connection)
+        return bytes(row[0]) if row is not None and row[0] is not None else None
+
+    def close(self) -> None:
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                return
+
+    def layer(self) -> Dict[str, Any]:
+        """Leaflet tileLayer options for index.html."""
+        extension = 'jpg' if self.format == 'jpeg' else self.format
+        options: Dict[str, Any] = {
+            'url': TILE_PATH.replace('.png', f".{extension}"),
+            'minZoom': self.min_zoom,
+            'maxNativeZoom': self.max_zoom,
+            'maxZoom': max(self.max_zoom, VIEW_MAX_ZOOM),
+            'attribution': self.metadata.get('attribution') or self.metadata.get('name') or os.path.basename(self.path),
+        }
+        bounds = _bounds(self.metadata.get('bounds'))
+        if bounds is not None:
+            options['bounds'] = bounds
+        return options
+
+    def stats(self) -> Dict[str, Any]:
+        """Stats source for the stats command and GET /stats."""
+        return {
+            'source': 'mbtiles',
+            'path': self.path,
+            'format': self.format,
+            'hot_tiles': len(self.hot),
+            'hot_bytes': self.hot_total,
+            'max_hot_bytes': self.hot_bytes,
+            'hits': self.hits,
+            'reads': self.reads,
+            'missing': self.missing,
+            'errors': self.errors,
+        }
+
+    def metrics(self) -> List[Tuple[str, str, str, List]]:
+        """Collector for /metrics."""
+        return [
+            ('mapcat_tile_requests_total', 'counter', 'Tile requests, by result (hit: hot cache, read: from the archive)',
+                [({'result': 'hit'}, self.hits), ({'result': 'read'}, self.reads)]),
+            ('mapcat_tile_missing_total', 'counter', 'Requested tiles the archive does not have', [({}, self.missing)]),
+            ('mapcat_tile_read_errors_total', 'counter', 'Tiles that could not be read from the archive', [({}, self.errors)]),
+            ('mapcat_tile_hot_cache_tiles', 'gauge', 'Tiles in the in-memory hot cache', [({}, len(self.hot))]),
+            ('mapcat_tile_hot_cache_bytes', 'gauge', 'Size of the tiles in the in-memory hot cache', [({}, self.hot_total)]),
+        ]
+
+
+def _int(value: Optional[str], default: int) -> int:
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        return default
+
+
+def _bounds(value: Optional[str]) -> Optional[List[List[float]]]:
+    """MBTiles 'left,bottom,right,top' as Leaflet [[south, west], [north, east]]."""
+    try:
+        west, south, east, north = (float(part) for part in value.split(','))
+    except (AttributeError, ValueError):
+        return None
+    if not (-180 <= west < east <= 180 and -90 <= south < north <= 90):
+        return None
+    return [[south, west], [north, east]]
@@ -0,0 +1,170 @@
+"""
+Prometheus-style metrics, served as text on GET /metrics.
+
+Counters and histograms are plain dict/list updates on the hot path. Values
+that already live elsewhere (feature counts, chunker sessions, clients) are
+read by collectors only when /metrics is scraped; the scrape runs on the event
+loop so collectors see consistent data structures.
+"""
+import asyncio
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple, TypeVar
+
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+LOOP_LAG_INTERVAL = 0.25  # seconds between event loop lag samples
+SCRAPE_TIMEOUT = 5.0
+
+T = TypeVar('T')
+
+# A collector returns (name, type, help, [(labels, value), ...]) tuples
+Sample = Tuple[Dict[str, str], float]
+Collector = Callable[[], Iterable[Tuple[str, str, str, List[Sample]]]]
+
+
+class Counter:
+    """Monotonic counter with optional labels (values passed positionally to inc)."""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, *labelvalues: str) -> None:
+        self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def value(self, *labelvalues: str) -> float:
+        return self._values.get(labelvalues, 0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for labelvalues, value in list(self._values.items()):
+            lines.append(f"{self.name}{_labels(zip(self.labelnames, labelvalues))} {_number(value)}")
+        return lines
+
+
+class Histogram:
+    """Histogram with fixed upper bounds; observe() is one bisect and two additions."""
+
+    def __init__(self, name: str, help: str, buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)  # last slot: above the largest bound
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self._counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        cumulative = 0
+        for bound, count in zip(self.buckets, self._counts):
+            cumulative += count
+            lines.append(f'{self.name}_bucket{{le="{_number(bound)}"}} {cumulative}')
+        lines.append(f'{self.name}_bucket{{le="+Inf"}} {self.count}')
+        lines.append(f"{self.name}_sum {_number(self.sum)}")
+        lines.append(f"{self.name}_count {self.count}")
+        return lines
+
+
+class Registry:
+    """Metrics and collectors rendered together."""
+
+    def __init__(self):
+        self.metrics: List = []
+        self.collectors: Dict[str, Collector] = {}
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        metric = Counter(name, help, labelnames)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help: str, buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        metric = Histogram(name, help, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def add_collector(self, key: str, collector: Collector) -> None:
+        """Register (or replace) a collector of values computed at scrape time."""
+        self.collectors[key] = collector
+
+    def render(self) -> str:
+        """Render every metric in the Prometheus text format (call on the event loop)."""
+        lines: List[str] = []
+        for metric in self.metrics:
+            lines += metric.render()
+        for collector in list(self.collectors.values()):
+            for name, metric_type, help, samples in collector():
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {metric_type}")
+                lines += [f"{name}{_labels(labels.items())} {_number(value)}" for labels, value in samples]
+        return '\n'.join(lines) + '\n'
+
+    def render_threadsafe(self) -> str:
+        """Render from any thread, on the registered event loop when it is running."""
+        return self.call_threadsafe(self.render)
+
+    def call_threadsafe(self, fn: Callable[[], T]) -> T:
+        """Call fn from any thread, on the registered event loop when it is running."""
+        loop = self.loop
+        if loop is None or not loop.is_running() or _on_loop(loop):
+            return fn()
+
+        async def call():
+            return fn()
+        return asyncio.run_coroutine_threadsafe(call(), loop).result(SCRAPE_TIMEOUT)
+
+
+REGISTRY = Registry()
+
+INPUT_LINES = REGISTRY.counter('mapcat_input_lines_total', 'Input lines received, by input kind', ['input'])
+COMMANDS = REGISTRY.counter('mapcat_commands_total', 'Commands executed successfully', ['command'])
+PARSE_FAILURES = REGISTRY.counter('mapcat_parse_failures_total', 'Input lines that could not be parsed')
+HANDLER_FAILURES = REGISTRY.counter('mapcat_handler_failures_total', 'Commands rejected by their handler (or unknown)', ['command'])
+BROADCAST_MESSAGES = REGISTRY.counter('mapcat_broadcast_messages_total', 'WebSocket messages sent, summed over clients')
+BROADCAST_BYTES = REGISTRY.counter('mapcat_broadcast_bytes_total', 'WebSocket payload bytes sent, summed over clients')
+LOOP_LAG = REGISTRY.histogram('mapcat_event_loop_lag_seconds', 'Delay of a timer on the event loop beyond its due time')
+END_TO_END_LATENCY = REGISTRY.histogram(
+    'mapcat_end_to_end_latency_seconds', 'Time from receiving an input batch until its last command was broadcast')
+
+
+async def monitor_loop_lag(interval: float = LOOP_LAG_INTERVAL) -> None:
+    """Sample event loop lag into LOOP_LAG until cancelled."""
+    loop = asyncio.get_running_loop()
+    REGISTRY.loop = loop
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        LOOP_LAG.observe(max(loop.time() - start - interval, 0.0))
+
+
+def input_kind(source: str) -> str:
+    """Metric label for a source tag: 'tcp:1.2.3.4:5' -> 'tcp' (keeps label cardinality low)."""
+    return source.split(':', 1)[0]
+
+
+def _on_loop(loop: asyncio.AbstractEventLoop) -> bool:
+    try:
+        return asyncio.get_running_loop() is loop
+    except RuntimeError:
+        return False
+
+
+def _labels(pairs: Iterable[Tuple[str, str]]) -> str:
+    text = ','.join(f'{key}="{_escape(str(value))}"' for key, value in pairs)
+    return f"{{{text}}}" if text else ''
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _number(value: float) -> str:
+    if isinstance(value, int) or float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
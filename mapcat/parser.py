@@ -2,12 +2,82 @@
 Parser for command strings from logcat.
 """
 import re
-import sys
-from typing import Optional, Dict, List, Any
+from typing import Optional, Dict, List, Any, Tuple
 
-# ANSI color codes
-RED = '\033[91m'
-RESET = '\033[0m'
+from mapcat import diagnostics
+
+DEFAULT_CACHE_SIZE = 1024
+CACHE_MIN_LINE_LENGTH = 64  # shorter lines parse quickly and are not cached
+
+
+class ParseCache:
+    """
+    Bounded LRU cache of parsed command lines.
+
+    Entries are stored immutably: coordinates as tuples of (lat, lng) tuples,
+    shared by every result of the same line, and parameters copied into a new
+    dict for each result, so callers may modify the returned dict and its params.
+    Lines that fail to parse are not cached, so their errors are logged every time.
+    """
+
+    def __init__(self, maxsize: int = DEFAULT_CACHE_SIZE, min_length: int = CACHE_MIN_LINE_LENGTH):
+        self.maxsize = maxsize
+        self.min_length = min_length
+        self.hits = 0
+        self.misses = 0
+        self._entries: Dict[str, Tuple[str, tuple, tuple]] = {}
+
+    def parse(self, line: str) -> Optional[Dict[str, Any]]:
+        """Parse a stripped, non-empty line, using the cached result if there is one."""
+        entry = self._entries.pop(line, None)
+        if entry is not None:
+            self.hits += 1
+            self._entries[line] = entry  # re-insert as most recently used
+        else:
+            self.misses += 1
+            parsed = _parse(line)
+            if parsed is None:
+                return None
+            entry = (parsed['cmd'], tuple(tuple(pair) for pair in parsed['coords']), tuple(parsed['params'].items()))
+            self._entries[line] = entry
+            if len(self._entries) > self.maxsize:
+                del self._entries[next(iter(self._entries))]  # least recently used
+        cmd, coords, params = entry
+        return {'cmd': cmd, 'coords': coords, 'params': dict(params)}
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters and current size."""
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'size': len(self._entries),
+            'maxsize': self.maxsize,
+        }
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+
+_cache: Optional[ParseCache] = None
+
+
+def enable_cache(maxsize: int = DEFAULT_CACHE_SIZE, min_length: int = CACHE_MIN_LINE_LENGTH) -> Optional[ParseCache]:
+    """
+    Cache the results of parse_command for repeated lines; maxsize 0 disables the cache.
+
+    Returns:
+        The new ParseCache, or None if disabled.
+    """
+    global _cache
+    _cache = ParseCache(maxsize, min_length) if maxsize > 0 else None
+    return _cache
+
+
+def get_cache() -> Optional[ParseCache]:
+    """Return the active ParseCache, if any."""
+    return _cache
 
 
 def parse_command(line: str) -> Optional[Dict[str, Any]]:
@@ -25,13 +95,24 @@ def parse_command(line: str) -> Optional[Dict[str, Any]]:
     Returns:
         Dict with 'cmd', 'coords' (list of [lat, lng]), and 'params' (dict)
         Returns None if parsing fails.
+        With the cache enabled (enable_cache), long lines have 'coords' as an
+        immutable tuple of (lat, lng) tuples.
     """
     line = line.strip()
     if not line:
         return None
-    
+    cache = _cache
+    if cache is not None and len(line) >= cache.min_length:
+        return cache.parse(line)
+    return _parse(line)
+
+
+def _parse(line: str) -> Optional[Dict[str, Any]]:
+    """Parse a stripped, non-empty line (see parse_command)."""
     # Split into tokens, respecting quotes
-    tokens = _tokenize(line)
+    tokens = _split_simple(line) if '"' not in line and "'" not in line else None
+    if tokens is None:
+        tokens = _tokenize(line)
     if not tokens:
         return None
     
@@ -100,6 +181,21 @@ def parse_command(line: str) -> Optional[Dict[str, Any]]:
     }
 
 
+def _split_simple(line: str) -> Optional[List[str]]:
+    """
+    Fast path of _tokenize for lines without quotes.
+
+    Splitting on spaces gives the same tokens as long as every token has balanced
+    parentheses; otherwise returns None and the caller falls back to _tokenize.
+    """
+    tokens = [token for token in line.split(' ') if token]
+    for token in tokens:
+        if '(' in token or ')' in token:
+            if token.count('(') != token.count(')'):
+                return None
+    return tokens
+
+
 def _tokenize(line: str) -> List[str]:
     """
     Split line into tokens, respecting quoted strings.
@@ -144,5 +240,4 @@ def _tokenize(line: str) -> List[str]:
 
 def _log_error(message: str):
     """Log error to stderr in red."""
-    print(f"{RED}FAIL: parse{RESET}", file=sys.stderr)
-    print(f"{RED}FAIL: {message}{RESET}", file=sys.stderr)
+    diagnostics.error("parse", message)
@@ -0,0 +1,114 @@
+"""
+Staged ingest pipeline: readers -> parser worker processes -> ordered apply stage.
+
+Readers submit batches of entries. Large batches and very long lines are parsed
+by a process pool while the event loop keeps serving WebSocket traffic; small
+batches skip the pool. A single apply task consumes batches strictly in
+submission order, so command order is preserved across the whole pipeline.
+"""
+import asyncio
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Awaitable, Callable, List, Optional, Tuple
+
+from mapcat import diagnostics, metrics, profiling
+from mapcat.loader import LineResult, parse_lines, parser_pool
+
+PARALLEL_MIN_LINES = 64  # batches with at least this many lines are parsed in the pool
+PARALLEL_MIN_LINE_BYTES = 16 * 1024  # a single line this long is parsed in the pool
+MAX_POOL_BATCH = 2048  # larger batches are split so workers share the load
+MAX_IN_FLIGHT_PER_WORKER = 2  # queued batches per worker before submit() waits
+
+# apply(entries, results, submitted): results is None when the batch was not
+# pre-parsed; submitted is the profiling.now() timestamp of submit() under
+# --profile, 0 otherwise
+ApplyFunc = Callable[[List[Any], Optional[List[LineResult]], int], Awaitable[None]]
+
+
+class IngestPipeline:
+    """
+    Ordered pipeline with an optional process pool for parsing.
+
+    Entries are opaque to the pipeline; line_of(entry) returns the text to parse.
+    """
+
+    def __init__(self, apply: ApplyFunc, line_of: Callable[[Any], str], workers: Optional[int] = None):
+        if workers is None:
+            workers = os.cpu_count() or 1
+        self._apply = apply
+        self._line_of = line_of
+        self._workers = workers
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._queue: asyncio.Queue = asyncio.Queue(max(workers, 1) * MAX_IN_FLIGHT_PER_WORKER)
+        self._task: Optional[asyncio.Task] = None
+
+    async def submit(self, entries: List[Any]) -> None:
+        """Queue a batch for parsing and in-order application; waits while the pipeline is full."""
+        if not entries:
+            return
+        if self._task is None:
+            self._task = asyncio.create_task(self._apply_loop())
+        profiler = profiling.active
+        submitted = profiling.now() if profiler else 0
+        if self._workers > 1 and self._wants_pool(entries):
+            loop = asyncio.get_running_loop()
+            for start in range(0, len(entries), MAX_POOL_BATCH):
+                part = entries[start:start + MAX_POOL_BATCH]
+                lines = [self._line_of(entry) for entry in part]
+                future = loop.run_in_executor(self._get_pool(), parse_lines, lines, profiler is not None)
+                await self._queue.put((part, future, time.monotonic(), submitted))
+        else:
+            await self._queue.put((entries, None, time.monotonic(), submitted))
+
+    def queued(self) -> Tuple[int, int]:
+        """Return (batches waiting to be applied, queue capacity)."""
+        return self._queue.qsize(), self._queue.maxsize
+
+    async def join(self) -> None:
+        """Wait until every submitted batch has been applied."""
+        await self._queue.join()
+
+    def close(self) -> None:
+        """Stop the apply task and shut the worker pool down."""
+        if self._task is not None:
+            self._task.cancel()
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def _wants_pool(self, entries: List[Any]) -> bool:
+        if len(entries) >= PARALLEL_MIN_LINES:
+            return True
+        return any(len(self._line_of(entry)) >= PARALLEL_MIN_LINE_BYTES for entry in entries)
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        # Created on first use: interactive sessions never pay for the worker processes
+        if self._pool is None:
+            self._pool = parser_pool(self._workers)
+        return self._pool
+
+    async def _apply_loop(self) -> None:
+        while True:
+            entries, future, received, submitted = await self._queue.get()
+            try:
+                results = None
+                if future is not None:
+                    try:
+                        results = await future
+                    except BrokenProcessPool as e:
+                        _log_error(f"Parser worker failed ({e}), parsing batch inline")
+                        self._pool = None
+                    except Exception as e:
+                        _log_error(f"Parsing a batch in a worker failed ({e!r}), parsing it inline")
+                await self._apply(entries, results, submitted)
+                metrics.END_TO_END_LATENCY.observe(time.monotonic() - received)
+            except Exception as e:
+                _log_error(f"Failed to apply batch of {len(entries)} lines: {e!r}")
+            finally:
+                self._queue.task_done()
+
+
+def _log_error(message: str):
+    """Log error to stderr in red."""
+    diagnostics.error("pipeline", message)
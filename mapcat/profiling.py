@@ -0,0 +1,278 @@
+"""
+Per-stage latency profiling for --profile.
+
+Every command is timestamped as it moves through the stages of the input path:
+
+    read       stdin block read and split into lines (per batch)
+    chunk      chunk reassembly (chunk lines, begin and commit)
+    parse      parse_command
+    handler    command handler (validation and State update)
+    serialize  json.dumps of the broadcast message
+    broadcast  server.broadcast
+    total      from the start of the line until its broadcast finished
+
+Durations go into HDR-style histograms per (stage, command), printed as
+percentiles at exit. Optionally every timed span is written to a Chrome
+trace-event file (open in chrome://tracing or https://ui.perfetto.dev), and a
+sampling profiler writes the main thread's stacks in the folded format read by
+flamegraph.pl and speedscope.
+
+When profiling is off, `active` is None and each instrumented stage costs one
+attribute lookup.
+"""
+import json
+import os
+import sys
+import threading
+import time
+from typing import AsyncIterator, Dict, List, Optional, Tuple, TypeVar
+
+SUB_BUCKET_BITS = 8  # 8 significant bits: values are recorded within 1%
+PERCENTILES = (50, 90, 99, 99.9)
+MAX_TRACE_EVENTS = 1_000_000  # later spans are counted but not written
+SAMPLE_INTERVAL = 0.001  # seconds between stack samples
+
+STAGES = ('read', 'chunk', 'parse', 'handler', 'serialize', 'broadcast', 'total')
+
+T = TypeVar('T')
+
+now = time.perf_counter_ns
+
+
+class ProfileError(Exception):
+    """Raised when a profile output file cannot be written."""
+
+
+class LatencyHistogram:
+    """
+    Log-linear histogram of integer durations (nanoseconds), as in HdrHistogram.
+
+    Values below 2**SUB_BUCKET_BITS have a bucket each; above that every power of
+    two is split into 2**(SUB_BUCKET_BITS-1) buckets, so any value is known
+    within 1% while a histogram spanning nanoseconds to minutes stays a few
+    hundred buckets.
+    """
+
+    def __init__(self):
+        self._counts: Dict[int, int] = {}
+        self.count = 0
+        self.total = 0
+        self.min = 0
+        self.max = 0
+
+    def record(self, value: int) -> None:
+        shift = value.bit_length() - SUB_BUCKET_BITS
+        index = value if shift <= 0 else (shift << (SUB_BUCKET_BITS - 1)) + (value >> shift)
+        self._counts[index] = self._counts.get(index, 0) + 1
+        if not self.count or value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+        self.count += 1
+        self.total += value
+
+    def percentile(self, percent: float) -> int:
+        """Return the highest value equivalent to the given percentile (0 when empty)."""
+        if not self.count:
+            return 0
+        rank = max(1, -(-self.count * percent // 100))  # ceil without float drift
+        seen = 0
+        for index in sorted(self._counts):
+            seen += self._counts[index]
+            if seen >= rank:
+                return min(_bucket_high(index), self.max)
+        return self.max
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+
+def _bucket_high(index: int) -> int:
+    """Largest value that maps to a bucket index."""
+    if index < 1 << SUB_BUCKET_BITS:
+        return index
+    shift = (index >> (SUB_BUCKET_BITS - 1)) - 1
+    mantissa = index - (shift << (SUB_BUCKET_BITS - 1))
+    return ((mantissa + 1) << shift) - 1
+
+
+class Profiler:
+    """
+    Stage histograms plus optional trace and sample outputs.
+
+    Args:
+        trace_path: Write a Chrome trace-event JSON file here on close()
+        sample_path: Sample the calling thread's stack and write folded stacks here on close()
+        sample_interval: Seconds between stack samples
+    """
+
+    def __init__(self, trace_path: Optional[str] = None, sample_path: Optional[str] = None,
+                 sample_interval: float = SAMPLE_INTERVAL):
+        self.histograms: Dict[Tuple[str, str], LatencyHistogram] = {}
+        self.trace_path = trace_path
+        self.sample_path = sample_path
+        self._origin = now()
+        self._events: Optional[List[Tuple[str, str, int, int]]] = [] if trace_path else None
+        self.dropped_events = 0
+        self._sampler = _Sampler(threading.get_ident(), sample_interval) if sample_path else None
+
+    def record(self, stage: str, command: str, start: int) -> int:
+        """
+        Record a span from start (a now() timestamp) until now.
+
+        Returns:
+            The end timestamp, so consecutive stages can be chained.
+        """
+        end = now()
+        self.record_duration(stage, command, end - start)
+        events = self._events
+        if events is not None:
+            if len(events) < MAX_TRACE_EVENTS:
+                events.append((stage, command, start, end))
+            else:
+                self.dropped_events += 1
+        return end
+
+    def record_duration(self, stage: str, command: str, duration: int) -> None:
+        """
+        Record a span measured elsewhere, e.g. in a parser worker process.
+
+        Its timestamps are on another process's clock, so it is not traced.
+        """
+        key = (stage, command)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = LatencyHistogram()
+        histogram.record(duration)
+
+    async def timed(self, iterator: AsyncIterator[T], stage: str = 'read', command: str = '*') -> AsyncIterator[T]:
+        """Yield from an async iterator, recording how long each item took to arrive."""
+        while True:
+            start = now()
+            try:
+                item = await iterator.__anext__()
+            except StopAsyncIteration:
+                return
+            self.record(stage, command, start)
+            yield item
+
+    def report(self) -> str:
+        """Render the percentile table, stages in pipeline order."""
+        order = {stage: position for position, stage in enumerate(STAGES)}
+        header = ['stage', 'command', 'count', 'mean'] + [f'p{p:g}' for p in PERCENTILES] + ['max']
+        rows = [header]
+        for (stage, command), histogram in sorted(
+                self.histograms.items(), key=lambda item: (order.get(item[0][0], len(order)), item[0])):
+            rows.append([stage, command, str(histogram.count), _duration(histogram.mean)]
+                        + [_duration(histogram.percentile(p)) for p in PERCENTILES] + [_duration(histogram.max)])
+        if len(rows) == 1:
+            return "Profile: no commands recorded"
+        widths = [max(len(row[column]) for row in rows) for column in range(len(header))]
+        lines = ["Profile (latency per stage and command):"]
+        for row in rows:
+            cells = [row[0].ljust(widths[0]), row[1].ljust(widths[1])]
+            cells += [cell.rjust(width) for cell, width in zip(row[2:], widths[2:])]
+            lines.append('  ' + '  '.join(cells))
+        return '\n'.join(lines)
+
+    def close(self) -> None:
+        """
+        Stop sampling and write the trace and sample files.
+
+        Raises:
+            ProfileError: If an output file cannot be written
+        """
+        if self._sampler is not None:
+            self._sampler.stop()
+        try:
+            if self.trace_path:
+                self._write_trace()
+            if self.sample_path and self._sampler is not None:
+                with open(self.sample_path, 'w') as f:
+                    for stack, count in sorted(self._sampler.stacks.items()):
+                        f.write(f"{stack} {count}\n")
+        except OSError as e:
+            raise ProfileError(f"Cannot write profile output: {e}") from e
+
+    def _write_trace(self) -> None:
+        pid = os.getpid()
+        origin = self._origin
+        events = [
+            {'name': stage, 'cat': command, 'ph': 'X', 'pid': pid, 'tid': 1,
+             'ts': (start - origin) / 1000, 'dur': (end - start) / 1000, 'args': {'command': command}}
+            for stage, command, start, end in self._events or ()
+        ]
+        with open(self.trace_path, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms',
+                       'otherData': {'dropped_events': self.dropped_events}}, f)
+
+
+class _Sampler:
+    """Background thread that samples one thread's Python stack at a fixed interval."""
+
+    def __init__(self, thread_id: int, interval: float):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Dict[str, int] = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='mapcat-profile-sampler', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        labels: Dict[object, str] = {}  # code object -> label, so formatting happens once per function
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                return  # sampled thread has exited
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                label = labels.get(code)
+                if label is None:
+                    label = labels[code] = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+                names.append(label)
+                frame = frame.f_back
+            stack = ';'.join(reversed(names))
+            self.stacks[stack] = self.stacks.get(stack, 0) + 1
+
+
+def _duration(nanoseconds: float) -> str:
+    if nanoseconds < 1_000:
+        return f"{nanoseconds:.0f}ns"
+    if nanoseconds < 1_000_000:
+        return f"{nanoseconds / 1_000:.1f}us"
+    if nanoseconds < 1_000_000_000:
+        return f"{nanoseconds / 1_000_000:.1f}ms"
+    return f"{nanoseconds / 1_000_000_000:.2f}s"
+
+
+active: Optional[Profiler] = None
+
+
+def start(trace_path: Optional[str] = None, sample_path: Optional[str] = None) -> Profiler:
+    """Start profiling the calling thread; instrumented stages record into the returned Profiler."""
+    global active
+    active = Profiler(trace_path, sample_path)
+    return active
+
+
+def stop() -> Optional[Profiler]:
+    """
+    Stop profiling and write the output files.
+
+    Returns:
+        The stopped Profiler, or None if profiling was not active.
+
+    Raises:
+        ProfileError: If an output file cannot be written
+    """
+    global active
+    profiler, active = active, None
+    if profiler is not None:
+        profiler.close()
+    return profiler
@@ -0,0 +1,358 @@
+"""
+Shared-memory ring buffer input for high-rate producers on the same host.
+
+A producer and mapcat map the same file. The producer appends records and
+publishes them by advancing write_pos; mapcat polls write_pos, copies the new
+records out and advances read_pos. No syscall is made per record.
+
+File layout (all integers little-endian):
+    offset  0  8s   magic b'MCRING01'
+    offset  8  u32  version (1)
+    offset 12  u32  reserved
+    offset 16  u64  capacity: size of the data area in bytes (multiple of 8)
+    offset 24  u64  write_pos: bytes ever written (producer-owned)
+    offset 32  u64  read_pos: bytes ever consumed (consumer-owned)
+    offset 40  u64  dropped: records the producer dropped because the ring was full
+    offset 64       data area (capacity bytes)
+
+Positions grow forever; a record starts at data offset pos % capacity. Each
+record is an 8-byte header followed by the payload, padded to 8 bytes:
+    u32 payload length, u16 type, u16 command code (binary records only)
+
+Record types:
+    0 PAD     filler up to the end of the data area; the next record starts at offset 0
+    1 TEXT    UTF-8 command lines separated by newlines (any mapcat input)
+    2 COORDS  binary command: u32 coordinate count n, u32 params length m,
+              n (lat, lng) float64 pairs, then m bytes of UTF-8 params text
+              ("color=red label=\\"Home\\"", same syntax as text commands)
+
+Command codes for COORDS records: 1 add-point, 2 add-polyline, 3 add-polygon,
+4 update-current-position.
+
+A record never wraps: if it does not fit before the end of the data area, the
+producer writes a PAD record and continues at offset 0. There is one producer
+and one consumer per ring file; the producer stores the whole record before
+storing write_pos, the consumer copies records out before storing read_pos.
+"""
+import asyncio
+import mmap
+import os
+import struct
+from array import array
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from mapcat import diagnostics, parser, stats
+from mapcat.inputs import LineSink
+
+MAGIC = b'MCRING01'
+VERSION = 1
+HEADER_SIZE = 64
+DEFAULT_CAPACITY = 16 * 1024 * 1024
+RING_POLL_INTERVAL = 0.01  # longest sleep while the ring is empty
+MAX_RING_BATCH = 1024 * 1024  # bytes consumed before yielding to the event loop
+
+TYPE_PAD = 0
+TYPE_TEXT = 1
+TYPE_COORDS = 2
+
+COMMAND_CODES = {
+    'add-point': 1,
+    'add-polyline': 2,
+    'add-polygon': 3,
+    'update-current-position': 4,
+}
+COMMAND_NAMES = {code: cmd for cmd, code in COMMAND_CODES.items()}
+
+_HEADER = struct.Struct('<8sIIQQQQ')
+_POS = struct.Struct('<Q')
+_RECORD = struct.Struct('<IHH')
+_COORDS = struct.Struct('<II')
+_CAPACITY_OFFSET = 16
+_WRITE_POS_OFFSET = 24
+_READ_POS_OFFSET = 32
+_DROPPED_OFFSET = 40
+
+# Receives decoded COORDS records as parsed command dicts, in ring order
+CommandSink = Callable[[str, List[Dict[str, Any]]], Awaitable[None]]
+
+
+class RingError(Exception):
+    """Raised when a ring file cannot be created, opened or is not a ring."""
+
+
+class _Ring:
+    """A mapped ring file; creates and initializes it if it does not exist."""
+
+    def __init__(self, path: str, capacity: int = DEFAULT_CAPACITY):
+        if capacity < 4096 or capacity % 8:
+            raise RingError(f"Ring capacity must be a multiple of 8 and at least 4096, got {capacity}")
+        try:
+            try:
+                fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_EXCL, 0o600)
+                created = True
+            except FileExistsError:
+                fd = os.open(path, os.O_RDWR)
+                created = False
+            try:
+                if created:
+                    os.ftruncate(fd, HEADER_SIZE + capacity)
+                elif os.fstat(fd).st_size < HEADER_SIZE:
+                    raise RingError(f"{path} is not a mapcat ring file")
+                self._map = mmap.mmap(fd, 0)
+            finally:
+                os.close(fd)
+        except OSError as e:
+            raise RingError(f"Cannot open ring file {path}: {e}")
+
+        if created:
+            _HEADER.pack_into(self._map, 0, MAGIC, VERSION, 0, capacity, 0, 0, 0)
+        magic, version, _, capacity, _, _, _ = _HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != VERSION:
+            self._map.close()
+            raise RingError(f"{path} is not a mapcat ring file (version {VERSION})")
+        if len(self._map) < HEADER_SIZE + capacity:
+            self._map.close()
+            raise RingError(f"{path} is shorter than its declared capacity")
+        self.path = path
+        self.capacity = capacity
+
+    def _get(self, offset: int) -> int:
+        return _POS.unpack_from(self._map, offset)[0]
+
+    def _set(self, offset: int, value: int) -> None:
+        _POS.pack_into(self._map, offset, value)
+
+    @property
+    def dropped(self) -> int:
+        """Records dropped so far because the ring was full."""
+        return self._get(_DROPPED_OFFSET)
+
+    @property
+    def pending(self) -> int:
+        """Bytes written by producers and not yet consumed."""
+        return self._get(_WRITE_POS_OFFSET) - self._get(_READ_POS_OFFSET)
+
+    def close(self) -> None:
+        self._map.close()
+
+
+class RingProducer(_Ring):
+    """
+    Reference producer: appends text and binary command records to a ring file.
+
+    Writes never block: when the ring is full the record is dropped, counted in
+    the header and False is returned, so the producer decides whether to retry.
+
+    Example:
+        ring = RingProducer('/dev/shm/mapcat.ring')
+        ring.send_command('add-polyline', array('d', [52.5, 13.4, 52.6, 13.5]), 'color=blue')
+        ring.send_text('remove tag=old')
+    """
+
+    def send_text(self, text: str) -> bool:
+        """Append one or more newline-separated command lines."""
+        return self._append(TYPE_TEXT, 0, [text.encode('utf-8')])
+
+    def send_command(self, cmd: str, coords, params: str = '') -> bool:
+        """
+        Append a binary command.
+
+        Args:
+            cmd: One of COMMAND_CODES
+            coords: Flat float buffer [lat0, lng0, lat1, lng1, ...] (array('d'),
+                numpy float64 array, memoryview) or a sequence of (lat, lng) pairs
+            params: Parameter text, e.g. 'color=red tag=track'
+
+        Raises:
+            ValueError: If cmd has no binary form
+        """
+        code = COMMAND_CODES.get(cmd)
+        if code is None:
+            raise ValueError(f"No binary record for command '{cmd}'")
+        try:
+            view = memoryview(coords)
+        except TypeError:
+            view = None
+        if view is not None and view.format == 'd' and view.c_contiguous:
+            data = view.cast('B')
+        else:
+            values = view.tolist() if view is not None else coords
+            if values and not isinstance(values[0], (int, float)):
+                values = [value for pair in values for value in pair]
+            data = memoryview(array('d', values)).cast('B')
+        if len(data) % 16:
+            raise ValueError("Coordinates must be (lat, lng) pairs")
+        params_bytes = params.encode('utf-8')
+        header = _COORDS.pack(len(data) // 16, len(params_bytes))
+        return self._append(TYPE_COORDS, code, [header, data, params_bytes])
+
+    def _append(self, record_type: int, code: int, parts) -> bool:
+        length = sum(len(part) for part in parts)
+        size = _record_size(length)
+        write_pos = self._get(_WRITE_POS_OFFSET)
+        offset = write_pos % self.capacity
+        pad = self.capacity - offset if offset + size > self.capacity else 0
+        if size > self.capacity or write_pos + pad + size - self._get(_READ_POS_OFFSET) > self.capacity:
+            self._set(_DROPPED_OFFSET, self._get(_DROPPED_OFFSET) + 1)
+            return False
+        if pad:
+            _RECORD.pack_into(self._map, HEADER_SIZE + offset, pad - _RECORD.size, TYPE_PAD, 0)
+            offset = 0
+        position = HEADER_SIZE + offset
+        _RECORD.pack_into(self._map, position, length, record_type, code)
+        position += _RECORD.size
+        for part in parts:
+            self._map[position:position + len(part)] = part
+            position += len(part)
+        # Publish only once the record is complete
+        self._set(_WRITE_POS_OFFSET, write_pos + pad + size)
+        return True
+
+
+class RingConsumer(_Ring):
+    """Reads records published by a producer and frees their space."""
+
+    def read(self, max_bytes: int = MAX_RING_BATCH) -> List[Tuple[int, Any]]:
+        """
+        Consume the published records, up to about max_bytes.
+
+        Returns:
+            List of (TYPE_TEXT, [lines]) and (TYPE_COORDS, parsed command dict)
+            items in ring order; malformed COORDS records are logged and skipped.
+        """
+        read_pos = self._get(_READ_POS_OFFSET)
+        write_pos = self._get(_WRITE_POS_OFFSET)
+        if write_pos - read_pos > self.capacity or write_pos < read_pos:
+            _log_error(self.path, f"Corrupt positions (read {read_pos}, write {write_pos}), skipping to the end")
+            self._set(_READ_POS_OFFSET, write_pos)
+            return []
+        items: List[Tuple[int, Any]] = []
+        end = min(write_pos, read_pos + max_bytes)
+        while read_pos < end:
+            offset = read_pos % self.capacity
+            length, record_type, code = _RECORD.unpack_from(self._map, HEADER_SIZE + offset)
+            size = _record_size(length)
+            if offset + size > self.capacity or read_pos + size > write_pos:
+                _log_error(self.path, f"Corrupt record at position {read_pos}, skipping to the end")
+                read_pos = write_pos
+                break
+            start = HEADER_SIZE + offset + _RECORD.size
+            if record_type == TYPE_TEXT:
+                lines = self._map[start:start + length].decode('utf-8', 'replace').split('\n')
+                if items and items[-1][0] == TYPE_TEXT:
+                    items[-1][1].extend(lines)
+                else:
+                    items.append((TYPE_TEXT, lines))
+            elif record_type == TYPE_COORDS:
+                parsed = _decode_coords(self._map[start:start + length], code)
+                if parsed is not None:
+                    items.append((TYPE_COORDS, parsed))
+            elif record_type != TYPE_PAD:
+                _log_error(self.path, f"Unknown record type {record_type}, skipping")
+            read_pos += size
+        self._set(_READ_POS_OFFSET, read_pos)
+        return items
+
+
+async def run_ring(path: str, sink: LineSink, command_sink: CommandSink,
+                   poll_interval: float = RING_POLL_INTERVAL) -> None:
+    """
+    Consume a ring file until cancelled, creating it if needed.
+
+    Text records go to sink like any other input; binary records skip the text
+    parser and go to command_sink. Both are called in ring order with the
+    source tag ring:<path>.
+    """
+    try:
+        ring = RingConsumer(path)
+    except RingError as e:
+        _log_error(path, str(e))
+        return
+    source = f"ring:{path}"
+    delay = 0.0
+    _consumers[path] = ring
+    try:
+        while True:
+            items = ring.read()
+            if not items:
+                # Back off gradually so a busy producer is picked up quickly
+                delay = min(poll_interval, delay * 2 or 0.0005)
+                await asyncio.sleep(delay)
+                continue
+            delay = 0.0
+            commands: List[Dict[str, Any]] = []
+            for record_type, item in items:
+                if record_type == TYPE_COORDS:
+                    commands.append(item)
+                    continue
+                if commands:
+                    await command_sink(source, commands)
+                    commands = []
+                await sink(source, item)
+            if commands:
+                await command_sink(source, commands)
+            await asyncio.sleep(0)  # let WebSocket traffic through between batches
+    finally:
+        del _consumers[path]
+        ring.close()
+
+
+_consumers: Dict[str, RingConsumer] = {}  # rings consumed by run_ring, for the stats command
+
+
+def ring_stats() -> List[Dict[str, Any]]:
+    """Stats source: fill level of every consumed ring."""
+    return [{'path': path, 'capacity': ring.capacity, 'pending_bytes': ring.pending, 'dropped': ring.dropped}
+            for path, ring in list(_consumers.items())]
+
+
+stats.add_source('rings', ring_stats)
+
+
+def _decode_coords(payload: bytes, code: int) -> Optional[Dict[str, Any]]:
+    """Turn a COORDS record payload into a parsed command dict, or None if invalid."""
+    cmd = COMMAND_NAMES.get(code)
+    if cmd is None:
+        _log_error("ring", f"Unknown command code {code} in binary record")
+        return None
+    if len(payload) < _COORDS.size:
+        _log_error("ring", f"Truncated {cmd} record")
+        return None
+    count, params_length = _COORDS.unpack_from(payload, 0)
+    coords_end = _COORDS.size + count * 16
+    if coords_end + params_length != len(payload):
+        _log_error("ring", f"Malformed {cmd} record: sizes do not match the payload")
+        return None
+    values = memoryview(payload)[_COORDS.size:coords_end].cast('d').tolist()
+    coords = [[values[i], values[i + 1]] for i in range(0, len(values), 2)]
+    for lat, lng in coords:
+        if not (-90 <= lat <= 90):
+            _log_error("ring", f"Latitude out of range: {lat}")
+            return None
+        if not (-180 <= lng <= 180):
+            _log_error("ring", f"Longitude out of range: {lng}")
+            return None
+
+    params_text = payload[coords_end:].decode('utf-8', 'replace').strip()
+    params: Dict[str, Any] = {}
+    if params_text:
+        parsed_params = parser.parse_command(f"{cmd} {params_text}")
+        if parsed_params is None or parsed_params['coords']:
+            _log_error("ring", f"Invalid parameters in binary {cmd} record: {params_text}")
+            return None
+        params = parsed_params['params']
+    return {
+        'cmd': cmd,
+        'coords': coords,
+        'params': params,
+        '_original_line': f"{cmd} <{count} binary coords> {params_text}".rstrip(),
+    }
+
+
+def _record_size(length: int) -> int:
+    return (_RECORD.size + length + 7) & ~7
+
+
+def _log_error(source: str, message: str):
+    """Log error to stderr in red."""
+    diagnostics.error("ring", message, f"ring {source}")
@@ -0,0 +1,184 @@
+"""
+Declarative command schemas.
+
+Each command lists its coordinate count, its parameters (type, default, range)
+and its help text. Schemas are compiled once into validator functions used by
+the command handlers, and the help output is rendered from the same table.
+"""
+from typing import Any, Callable, Dict, NamedTuple, Optional, Tuple
+
+
+class Param(NamedTuple):
+    """One key=value parameter of a command."""
+    name: str
+    type: type = str  # str values are kept as given; int/float values are converted
+    default: Any = None  # None: not set when missing
+    minimum: Optional[float] = None
+    maximum: Optional[float] = None
+    metavar: str = '<value>'
+    help: str = ''
+
+
+class CommandSchema(NamedTuple):
+    """Everything mapcat knows about one command."""
+    name: str
+    usage: str
+    summary: str
+    example: str
+    min_coords: int = 0
+    max_coords: Optional[int] = 0  # None: no upper limit
+    params: Tuple[Param, ...] = ()
+    one_of: Tuple[str, ...] = ()  # exactly one of these params is required
+    feature_type: Optional[str] = None  # set for commands that add a feature
+    informational: bool = False  # prints to stdout and broadcasts nothing
+
+
+# validate(parsed_cmd) -> (params with defaults applied and values converted, None)
+#                      or (None, error message)
+Validator = Callable[[Dict[str, Any]], Tuple[Optional[Dict[str, Any]], Optional[str]]]
+
+ID = Param('id', metavar='<id>', help='Unique identifier (auto-generated if not provided)')
+TAG = Param('tag', metavar='<tag>', help='Tag for grouping features')
+COLOR = Param('color', default='#007cff', metavar='<color>', help='CSS color (named: red, blue; hex: #FF5733)')
+LABEL = Param('label', metavar='<text>', help='Label text (use quotes for spaces: label="My Point")')
+OPACITY = Param('opacity', float, 1.0, 0.0, 1.0, '<0.0-1.0>', 'Transparency')
+ZORDER = Param('zorder', int, 0, metavar='<int>', help='Drawing order (lower = behind; safe range: -400 to +600)')
+
+COMMAND_SCHEMAS: Dict[str, CommandSchema] = {schema.name: schema for schema in [
+    CommandSchema(
+        'add-point', 'add-point (lat,lng) [parameters]', 'Add a point marker to the map',
+        'add-point (52.5,13.4) color=red label="Home" radius=6 border=3',
+        min_coords=1, max_coords=1, feature_type='point',
+        params=(
+            ID, TAG, COLOR, LABEL, OPACITY,
+            Param('radius', int, 4, 0, metavar='<pixels>', help='Circle radius in pixels'),
+            Param('border', int, 2, 0, metavar='<pixels>', help='Border width in pixels'),
+            ZORDER,
+        ),
+    ),
+    CommandSchema(
+        'add-polyline', 'add-polyline (lat,lng);(lat,lng);... [parameters]', 'Add a line connecting multiple points',
+        'add-polyline (52.5,13.4);(52.6,13.5) color=blue width=5',
+        min_coords=2, max_coords=None, feature_type='polyline',
+        params=(
+            ID, TAG, COLOR._replace(help='Line color'), LABEL, OPACITY,
+            Param('width', int, 2, 0, metavar='<pixels>', help='Line width in pixels'),
+            Param('markers', int, 0, 0, metavar='<pixels>', help='Circle radius at points (0=off)'),
+            Param('markerBorder', int, 2, 0, metavar='<pixels>', help='Border width of the point circles'),
+            ZORDER,
+        ),
+    ),
+    CommandSchema(
+        'add-polygon', 'add-polygon (lat,lng);(lat,lng);... [parameters]', 'Add a filled polygon area',
+        'add-polygon (52.1,13.1);(52.2,13.2);(52.15,13.15) color=green opacity=0.5',
+        min_coords=3, max_coords=None, feature_type='polygon',
+        params=(
+            ID, TAG, COLOR._replace(help='Fill and border color'), LABEL,
+            OPACITY._replace(default=0.3, help='Fill transparency'),
+            Param('border', int, 2, 0, metavar='<pixels>', help='Border width in pixels'),
+            ZORDER,
+        ),
+    ),
+    CommandSchema(
+        'update-current-position', 'update-current-position (lat,lng)',
+        'Update the current position marker (blue chevron)', 'update-current-position (52.5,13.4)',
+        min_coords=1, max_coords=1,
+    ),
+    CommandSchema(
+        'remove', 'remove id=<id> | remove tag=<tag>', 'Remove a feature by its ID, or all features with a tag',
+        'remove id=my-point',
+        max_coords=None, params=(Param('id', metavar='<id>'), Param('tag', metavar='<tag>')), one_of=('id', 'tag'),
+    ),
+    CommandSchema('clear', 'clear', 'Remove all features from the map', 'clear', max_coords=None),
+    CommandSchema(
+        'stats', 'stats', 'Show feature counts, estimated memory use and queue sizes (also GET /stats as JSON)',
+        'stats', max_coords=None, informational=True,
+    ),
+    CommandSchema(
+        'browser-stats', 'browser-stats', 'Show render performance reported by each connected browser',
+        'browser-stats', max_coords=None, informational=True,
+    ),
+    CommandSchema('help', 'help', 'Show this help message', 'help', max_coords=None, informational=True),
+]}
+
+
+def _range_error(key: str, value: Any, minimum: Optional[float], maximum: Optional[float]) -> str:
+    if maximum is None:
+        return f"{key} must be at least {minimum}, got {value}"
+    if minimum is None:
+        return f"{key} must be at most {maximum}, got {value}"
+    return f"{key} must be between {minimum} and {maximum}, got {value}"
+
+
+def compile_validator(schema: CommandSchema) -> Validator:
+    """
+    Compile a schema into a validator function.
+
+    Everything that depends only on the schema (error messages, which
+    parameters need a default or a conversion) is resolved once here; the
+    validator only walks those parameters. Parameters that are not in the
+    schema are passed through unchanged.
+    """
+    name = schema.name
+    min_coords, max_coords = schema.min_coords, schema.max_coords
+    check_coords = min_coords > 0 or max_coords is not None
+    plural = '' if min_coords == 1 else 's'
+    amount = 'exactly' if min_coords == max_coords else 'at least'
+    coords_error = f"{name} requires {amount} {min_coords} coordinate{plural}, got {{}}"
+    # (name, type or None for str, default, minimum, maximum); str params without a default need no work
+    checked = tuple((param.name, None if param.type is str else param.type, param.default, param.minimum, param.maximum)
+                    for param in schema.params if param.type is not str or param.default is not None)
+    one_of = schema.one_of
+    alternatives = ' or '.join(one_of)
+    missing_error = f"{name} command requires either {alternatives} parameter"
+    both_error = f"{name} command accepts either {alternatives}, not both"
+
+    def validate(parsed_cmd: Dict[str, Any]) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+        if check_coords:
+            count = len(parsed_cmd['coords'])
+            if count < min_coords or (max_coords is not None and count > max_coords):
+                return None, coords_error.format(count)
+        params = parsed_cmd['params'].copy()
+        for key, convert, default, minimum, maximum in checked:
+            if key not in params:
+                if default is not None:
+                    params[key] = default
+                continue
+            if convert is None:
+                continue
+            try:
+                value = convert(params[key])
+            except (ValueError, TypeError, OverflowError):
+                return None, f"invalid {key} value: {params[key]!r}"
+            # Written as 'not >=' so that NaN fails the check
+            if (minimum is not None and not value >= minimum) or (maximum is not None and not value <= maximum):
+                return None, _range_error(key, value, minimum, maximum)
+            params[key] = value
+        if one_of:
+            present = sum(bool(params.get(key)) for key in one_of)
+            if present == 0:
+                return None, missing_error
+            if present > 1:
+                return None, both_error
+        return params, None
+
+    return validate
+
+
+VALIDATORS: Dict[str, Validator] = {name: compile_validator(schema) for name, schema in COMMAND_SCHEMAS.items()}
+
+
+def format_help(schema: CommandSchema) -> str:
+    """Render the help section of one command."""
+    lines = [schema.usage, f"  {schema.summary}"]
+    described = [param for param in schema.params if param.help]
+    if described:
+        lines.append("  Parameters:")
+        for param in described:
+            text = param.help
+            if param.default is not None:
+                text += f" (default: {param.default})"
+            lines.append(f"    {param.name + '=' + param.metavar:<17} - {text}")
+    lines.append(f"  Example: {schema.example}")
+    return '\n'.join(lines)
+
@@ -3,19 +3,32 @@
 WebSocket and HTTP server for mapcat.
 """
 import asyncio
-import functools
+import gzip
+import hashlib
+import importlib.metadata
+import json
+import math
 import os
+import re
 import subprocess
+import urllib.parse
 import websockets
-from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
-import threading
+from http import HTTPStatus
+from websockets.datastructures import Headers
+from websockets.http11 import Response
+from typing import NamedTuple, Optional
+
+from mapcat import diagnostics, flow, metrics, stats, tiles
 
 STATIC_DIR = os.path.join(os.path.dirname(__file__), 'static')
 
 
-@functools.lru_cache(maxsize=1)
 def _build_version() -> str:
-    """Return version string 'YYYY.MM.DD-shortHash' from the last git commit."""
+    """
+    Return version string 'YYYY.MM.DD-shortHash' from the last git commit, or
+    the installed package version outside a git checkout. Called once by
+    load_assets().
+    """
     try:
         result = subprocess.run(
             ['git', 'log', '-1', '--format=%cd %h', '--date=format:%Y.%m.%d'],
@@ -27,103 +40,376 @@ def _build_version() -> str:
             return f"{parts[0]}-{parts[1]}"
     except Exception:
         pass
-    return 'unknown'
-
-
-class StaticHandler(SimpleHTTPRequestHandler):
-	def do_GET(self):
-		clean_path = self.path.split('?')[0].rstrip('/')
-		if clean_path in ('', '/index.html'):
-			self._serve_index()
-		else:
-			super().do_GET()
-
-	def _serve_index(self):
-		html_path = os.path.join(STATIC_DIR, 'index.html')
-		with open(html_path, 'r', encoding='utf-8') as f:
-			content = f.read().replace('__VERSION__', _build_version())
-		encoded = content.encode('utf-8')
-		self.send_response(200)
-		self.send_header('Content-Type', 'text/html; charset=utf-8')
-		self.send_header('Content-Length', str(len(encoded)))
-		self.end_headers()
-		self.wfile.write(encoded)
-
-	def translate_path(self, path):
-		# Serve files from static directory
-		relpath = path.lstrip('/')
-		fullpath = os.path.join(STATIC_DIR, relpath)
-		if os.path.isdir(fullpath):
-			return os.path.join(fullpath, 'index.html')
-		return fullpath if os.path.exists(fullpath) else os.path.join(STATIC_DIR, 'index.html')
-	
-	def end_headers(self):
-		# Disable caching for development
-		self.send_header('Cache-Control', 'no-cache, no-store, must-revalidate')
-		self.send_header('Pragma', 'no-cache')
-		self.send_header('Expires', '0')
-		super().end_headers()
+    try:
+        return importlib.metadata.version('mapcat')
+    except importlib.metadata.PackageNotFoundError:
+        return 'unknown'
+
+
+CONTENT_TYPES = {
+	'.html': 'text/html; charset=utf-8',
+	'.js': 'text/javascript; charset=utf-8',
+	'.css': 'text/css; charset=utf-8',
+	'.svg': 'image/svg+xml',
+	'.png': 'image/png',
+	'.json': 'application/json',
+}
+COMPRESSIBLE = ('.html', '.js', '.css', '.svg', '.json')
+
+# Browsers keep their copy but revalidate it with the ETag on every load (a cheap 304)
+ASSET_CACHE_CONTROL = 'no-cache'
+TILE_CACHE_CONTROL = 'max-age=86400'
+TILE_ROUTE = re.compile(r'/tiles/(\d{1,2})/(\d{1,8})/(\d{1,8})\.\w+')
+
+tile_source = None  # tiles.TileCache or compatible; None serves tiles straight from tile_layer's URL
+tile_layer = tiles.OSM_LAYER  # Leaflet tileLayer options injected into index.html
+
+def set_tile_source(source):
+	"""Serve /tiles/{z}/{x}/{y} from source and point the page at it (call before start_server)."""
+	global tile_source, tile_layer
+	tile_source = source
+	tile_layer = source.layer()
+	stats.add_source('tiles', source.stats)
+	metrics.REGISTRY.add_collector('tiles', source.metrics)
+
+
+class StaticAsset(NamedTuple):
+	"""A file from the static directory, prepared once for serving."""
+	body: bytes
+	gzipped: Optional[bytes]  # None when compression does not pay off
+	etag: str
+	content_type: str
+
+
+assets = {}  # URL path ('/index.html', '/leaflet/leaflet.js', ...) -> StaticAsset
+
+def load_assets(static_dir=STATIC_DIR):
+	"""
+	Read, version-stamp and compress every static file into memory.
+
+	Called by start_server(), so files edited afterwards are served after a restart.
+	"""
+	version = _build_version()
+	loaded = {}
+	for directory, _, filenames in os.walk(static_dir):
+		for filename in filenames:
+			fullpath = os.path.join(directory, filename)
+			with open(fullpath, 'rb') as f:
+				body = f.read()
+			path = '/' + os.path.relpath(fullpath, static_dir).replace(os.sep, '/')
+			if path == '/index.html':
+				body = body.replace(b'__VERSION__', version.encode('utf-8'))
+				body = body.replace(b'__TILE_LAYER__', json.dumps(tile_layer).encode('utf-8'))
+			loaded[path] = prepare_asset(body, os.path.splitext(filename)[1].lower())
+	assets.clear()
+	assets.update(loaded)
+
+def prepare_asset(body, extension):
+	gzipped = None
+	if extension in COMPRESSIBLE:
+		compressed = gzip.compress(body, compresslevel=9, mtime=0)
+		if len(compressed) < len(body):
+			gzipped = compressed
+	etag = '"' + hashlib.sha256(body).hexdigest()[:20] + '"'
+	return StaticAsset(body, gzipped, etag, CONTENT_TYPES.get(extension, 'application/octet-stream'))
+
+
+def http_response(status, body=b'', content_type=None, extra_headers=()):
+	"""Build a plain HTTP response; the connection is closed after it is sent."""
+	headers = Headers()
+	if content_type is not None:
+		headers['Content-Type'] = content_type
+	headers['Content-Length'] = str(len(body))
+	headers['Connection'] = 'close'
+	for name, value in extra_headers:
+		headers[name] = value
+	return Response(status.value, status.phrase, headers, body)
+
+def http_error(status):
+	return http_response(status, f"{status.value} {status.phrase}\n".encode('utf-8'), 'text/plain; charset=utf-8')
+
+
+async def process_request(connection, request):
+	"""
+	Answer plain HTTP requests on the WebSocket port.
+
+	WebSocket upgrades return None and continue to ws_handler; everything else
+	is routed here, on the event loop, so handlers read State without locking.
+	"""
+	if any(value.lower() == 'websocket' for value in request.headers.get_all('Upgrade')):
+		return None
+	path = urllib.parse.unquote(urllib.parse.urlsplit(request.path).path).rstrip('/')
+	tile = TILE_ROUTE.fullmatch(path)
+	if tile:
+		return await _serve_tile(*map(int, tile.groups()))
+	elif path == '/metrics':
+		return _serve_metrics()
+	elif path == '/stats':
+		return _serve_stats()
+	if not assets:
+		load_assets()
+	# Unknown paths get the page, like a single-page app
+	return _serve_asset(assets.get(path) or assets['/index.html'], request.headers)
+
+def _serve_asset(asset, request_headers):
+	"""Serve an asset, as 304 if the browser's copy is current and gzipped if it accepts that."""
+	headers = [('ETag', asset.etag), ('Cache-Control', ASSET_CACHE_CONTROL), ('Vary', 'Accept-Encoding')]
+	if any(asset.etag in value or value.strip() == '*' for value in request_headers.get_all('If-None-Match')):
+		return http_response(HTTPStatus.NOT_MODIFIED, extra_headers=headers)
+	if asset.gzipped is not None and accepts_gzip(request_headers.get_all('Accept-Encoding')):
+		headers.append(('Content-Encoding', 'gzip'))
+		return http_response(HTTPStatus.OK, asset.gzipped, asset.content_type, headers)
+	return http_response(HTTPStatus.OK, asset.body, asset.content_type, headers)
+
+def accepts_gzip(accept_encoding):
+	"""True if the Accept-Encoding header values allow gzip (and do not say gzip;q=0)."""
+	for value in accept_encoding:
+		for item in value.split(','):
+			name, _, params = item.partition(';')
+			if name.strip().lower() in ('gzip', '*'):
+				quality = params.strip().lower()
+				return not quality.startswith('q=') or quality[2:].strip() not in ('0', '0.0', '0.00', '0.000')
+	return False
+
+async def _serve_tile(z, x, y):
+	if tile_source is None:
+		return http_error(HTTPStatus.NOT_FOUND)
+	try:
+		# Past websockets' open_timeout the browser would get an aborted connection
+		# instead of an error; a fetch that times out here keeps filling the cache
+		tile = await asyncio.wait_for(tile_source.get(z, x, y), tiles.REQUEST_TIMEOUT)
+	except tiles.TileError as e:
+		diagnostics.error("tiles", str(e))
+		return http_error(HTTPStatus.BAD_GATEWAY)
+	except TimeoutError:
+		diagnostics.error("tiles", f"tile {z}/{x}/{y}: no answer within {tiles.REQUEST_TIMEOUT:g}s")
+		return http_error(HTTPStatus.GATEWAY_TIMEOUT)
+	if tile is None:
+		return http_error(HTTPStatus.NOT_FOUND)
+	return http_response(HTTPStatus.OK, tile.data, tile.content_type, [('Cache-Control', TILE_CACHE_CONTROL)])
+
+def _serve_metrics():
+	encoded = metrics.REGISTRY.render().encode('utf-8')
+	return http_response(HTTPStatus.OK, encoded, 'text/plain; version=0.0.4; charset=utf-8')
+
+def _serve_stats():
+	state = state_getter() if state_getter else None
+	if state is None:
+		return http_error(HTTPStatus.SERVICE_UNAVAILABLE)
+	return http_response(HTTPStatus.OK, json.dumps(stats.collect(state)).encode('utf-8'), 'application/json')
 
 
 clients = set()
 state_getter = None  # Will be set by main.py to get current state
+flows = {}  # websocket -> flow.ClientFlow
+max_unacked = flow.DEFAULT_MAX_UNACKED
+
+# Latest render performance report of each browser, sent by index.html every few seconds
+PERF_FIELDS = ('interval_ms', 'messages', 'decode_ms', 'decode_max_ms', 'adds', 'add_ms', 'add_max_ms',
+	'features', 'layers', 'fps', 'long_tasks', 'long_task_ms')
+perf_reports = {}
 
 def set_state_getter(getter):
 	"""Set the function to get current state."""
 	global state_getter
 	state_getter = getter
 
+def set_max_unacked(count):
+	"""Set the per-client cap on unacknowledged messages for new connections (0 disables flow control)."""
+	global max_unacked
+	max_unacked = count
+
 async def broadcast(message):
-	"""Broadcast message to all connected WebSocket clients."""
+	"""Broadcast message to all connected WebSocket clients; clients over their flow control window get it later."""
 	if clients:
+		ready = [websocket for websocket in clients if flows[websocket].admit(message)]
 		# Use websockets.broadcast for efficient sending
-		websockets.broadcast(clients, message)
+		websockets.broadcast(ready, message)
+		metrics.BROADCAST_MESSAGES.inc(len(ready))
+		metrics.BROADCAST_BYTES.inc(len(message) * len(ready))  # JSON is ASCII: characters == bytes
+
+def feature_message(feature_id, feature_data):
+	"""Build the 'add' message for a stored feature."""
+	message = {
+		'action': 'add',
+		'id': feature_id,
+		'type': feature_data['type'],
+		'coords': feature_data['coords'][0] if feature_data['type'] == 'point' else feature_data['coords'],
+		'params': feature_data['params']
+	}
+	if 'meta' in feature_data:
+		message['meta'] = feature_data['meta']
+	return message
+
+
+def snapshot_message(state, replace=False):
+	"""
+	Build one 'snapshot' message holding an 'add' message for every feature.
+	With replace, the browser clears its map first (resync after flow control).
+	"""
+	message = {
+		'action': 'snapshot',
+		'features': [feature_message(feature_id, feature_data) for feature_id, feature_data in state.features.items()]
+	}
+	if replace:
+		message['replace'] = True
+	return message
+
+def _resync_snapshot():
+	state = state_getter() if state_getter else None
+	if state is None:
+		return json.dumps({'action': 'snapshot', 'features': [], 'replace': True})
+	return json.dumps(snapshot_message(state, replace=True))
+
 
 async def ws_handler(websocket):
 	"""Handle WebSocket connections."""
+	client_flow = flows[websocket] = flow.ClientFlow(_resync_snapshot, max_unacked)
 	clients.add(websocket)
 	
-	# Send current state to new client
+	# Send current state to new client as a single snapshot message
 	if state_getter:
-		import json
 		state = state_getter()
-		for feature_id, feature_data in state.features.items():
-			message = {
-				'action': 'add',
-				'id': feature_id,
-				'type': feature_data['type'],
-				'coords': feature_data['coords'][0] if feature_data['type'] == 'point' else feature_data['coords'],
-				'params': feature_data['params']
-			}
-			await websocket.send(json.dumps(message))
+		if state.features:
+			client_flow.count_sent()
+			await websocket.send(json.dumps(snapshot_message(state)))
 	
 	try:
 		async for message in websocket:
 			# Handle messages from client (e.g., error reports)
 			try:
-				import json
-				import sys
 				data = json.loads(message)
 				if data.get('type') == 'error':
-					# Print error to stderr
-					print(f"Browser error: {data.get('message', 'Unknown error')}", file=sys.stderr)
+					diagnostics.error("browser", data.get('message', 'Unknown error'))
+				elif data.get('type') == 'ack':
+					pending = client_flow.ack(data.get('seq'))
+					if pending is not None:
+						websockets.broadcast([websocket], pending)
+						metrics.BROADCAST_MESSAGES.inc()
+						metrics.BROADCAST_BYTES.inc(len(pending))
+				elif data.get('type') == 'perf':
+					perf_reports[websocket] = perf_report(data)
 			except Exception as e:
 				# Ignore malformed messages
 				pass
 	finally:
 		clients.remove(websocket)
+		flows.pop(websocket, None)
+		perf_reports.pop(websocket, None)
+
+def perf_report(data):
+	"""Keep the known numeric fields of a browser 'perf' message; anything else is dropped."""
+	report = {}
+	for field in PERF_FIELDS:
+		value = data.get(field)
+		if isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value) and value >= 0:
+			report[field] = float(value)
+	return report
+
+def client_name(websocket):
+	"""'host:port' of a client, as used in metric labels and browser-stats."""
+	address = getattr(websocket, 'remote_address', None)
+	if not address:
+		return 'unknown'
+	host, port = address[:2]
+	return f"{host}:{port}"
+
+def browser_stats():
+	"""
+	Summarize the latest perf report of each browser.
+
+	Returns:
+		List of (client name, stats) with fps, layers, features, messages_per_sec,
+		decode_avg_ms, decode_max_ms, add_avg_ms, add_max_ms, long_tasks and
+		long_task_ratio (share of the interval spent in long tasks); keys whose
+		inputs were not reported are missing.
+	"""
+	summaries = []
+	for websocket, report in list(perf_reports.items()):
+		stats = {key: report[key] for key in ('fps', 'layers', 'features', 'decode_max_ms', 'add_max_ms', 'long_tasks') if key in report}
+		interval = report.get('interval_ms')
+		if interval:
+			if 'messages' in report:
+				stats['messages_per_sec'] = report['messages'] * 1000 / interval
+			if 'long_task_ms' in report:
+				stats['long_task_ratio'] = min(report['long_task_ms'] / interval, 1.0)
+		if report.get('messages') and 'decode_ms' in report:
+			stats['decode_avg_ms'] = report['decode_ms'] / report['messages']
+		if report.get('adds') and 'add_ms' in report:
+			stats['add_avg_ms'] = report['add_ms'] / report['adds']
+		summaries.append((client_name(websocket), stats))
+	return summaries
+
+def client_metrics():
+	"""Collector for /metrics: connected clients and the bytes queued to each."""
+	queued = []
+	for websocket in list(clients):
+		transport = getattr(websocket, 'transport', None)
+		if transport is not None:
+			queued.append(({'client': client_name(websocket)}, transport.get_write_buffer_size()))
+	windows = [(client_name(websocket), client_flow) for websocket, client_flow in list(flows.items())]
+	return [
+		('mapcat_clients', 'gauge', 'Connected WebSocket clients', [({}, len(clients))]),
+		('mapcat_client_queued_bytes', 'gauge', 'Bytes waiting in the send buffer of each client', queued),
+		('mapcat_client_unacked_messages', 'gauge', 'Messages sent to each client and not yet acknowledged as rendered',
+			[({'client': name}, client_flow.unacked) for name, client_flow in windows if client_flow.enabled]),
+		('mapcat_client_deferred_messages', 'gauge', 'Messages held back by flow control for each client',
+			[({'client': name}, len(client_flow.deferred)) for name, client_flow in windows]),
+		('mapcat_client_coalesced_messages_total', 'counter', 'Messages merged into later updates or a resync instead of being sent',
+			[({'client': name}, client_flow.coalesced) for name, client_flow in windows]),
+		('mapcat_client_resyncs_total', 'counter', 'Full-map resyncs of clients that fell too far behind',
+			[({'client': name}, client_flow.resyncs) for name, client_flow in windows]),
+	]
+
+# (metric name, browser_stats key, scale to the metric unit, help)
+BROWSER_METRICS = (
+	('mapcat_browser_fps', 'fps', 1, 'Frames per second rendered by the browser'),
+	('mapcat_browser_layers', 'layers', 1, 'Leaflet layers on the browser map'),
+	('mapcat_browser_messages_per_second', 'messages_per_sec', 1, 'WebSocket messages received by the browser per second'),
+	('mapcat_browser_decode_seconds', 'decode_avg_ms', 0.001, 'Mean JSON decode time per message'),
+	('mapcat_browser_decode_max_seconds', 'decode_max_ms', 0.001, 'Longest JSON decode in the last report interval'),
+	('mapcat_browser_add_feature_seconds', 'add_avg_ms', 0.001, 'Mean addFeature time per feature'),
+	('mapcat_browser_add_feature_max_seconds', 'add_max_ms', 0.001, 'Longest addFeature in the last report interval'),
+	('mapcat_browser_long_tasks', 'long_tasks', 1, 'Long tasks (main thread blocked over 50 ms) in the last report interval'),
+	('mapcat_browser_long_task_ratio', 'long_task_ratio', 1, 'Share of the last report interval spent in long tasks'),
+)
+
+def browser_metrics():
+	"""Collector for /metrics: the latest render performance report of each browser."""
+	summaries = browser_stats()
+	return [
+		(name, 'gauge', help, [({'client': client}, stats[key] * scale) for client, stats in summaries if key in stats])
+		for name, key, scale, help in BROWSER_METRICS
+	]
+
+
+def client_stats():
+	"""Stats source: send buffer and flow control window of each client."""
+	result = []
+	for websocket in list(clients):
+		transport = getattr(websocket, 'transport', None)
+		client_flow = flows.get(websocket)
+		result.append({
+			'client': client_name(websocket),
+			'queued_bytes': transport.get_write_buffer_size() if transport is not None else 0,
+			'unacked': client_flow.unacked if client_flow is not None and client_flow.enabled else 0,
+			'deferred': len(client_flow.deferred) if client_flow is not None else 0,
+			'deferred_bytes': client_flow.deferred_bytes if client_flow is not None else 0,
+		})
+	return result
+
 
-def start_http_server(port):
-	httpd = ThreadingHTTPServer(('0.0.0.0', port), StaticHandler)
-	thread = threading.Thread(target=httpd.serve_forever, daemon=True)
-	thread.start()
-	return httpd
+metrics.REGISTRY.add_collector('clients', client_metrics)
+metrics.REGISTRY.add_collector('browsers', browser_metrics)
+stats.add_source('clients', client_stats)
 
 
-async def start_ws_server(port):
-	ws_port = port + 1
-	return await websockets.serve(ws_handler, '0.0.0.0', ws_port, process_request=None, ping_interval=None)
+async def start_server(port, host='0.0.0.0'):
+	"""
+	Serve the page, /metrics, /stats and WebSocket connections on one port.
 
-def start_server(port):
-	start_http_server(port)
-	asyncio.run(start_ws_server(port))
+	Returns:
+		The websockets Server (use as an async context manager, or close() it)
+	"""
+	load_assets()
+	return await websockets.serve(ws_handler, host, port, process_request=process_request, ping_interval=None)
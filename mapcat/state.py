@@ -2,19 +2,35 @@
 In-memory store for geo features.
 """
 import secrets
+import sys
 from typing import Optional, Dict, List, Any
 
+# Per-object sizes for the memory estimate (CPython). Coordinates shared between
+# features are counted for each of them.
+_POINTER_SIZE = 8
+_LIST_SIZE = sys.getsizeof([])
+_PAIR_SIZE = sys.getsizeof([0.0, 0.0]) + 2 * sys.getsizeof(0.0)
+_FEATURE_SIZE = sys.getsizeof({'type': None, 'coords': None, 'params': None})
+_PARAM_VALUE_SIZE = sys.getsizeof('#007cff')  # values are taken to be short strings; keys are shared
+_SLOT_SIZE = 3 * _POINTER_SIZE  # hash, key and value of a dict entry (used_ids set entries are similar)
+
 
 class State:
     """
     Manages the in-memory state of all geographic features.
     
     Features are stored by ID with their type, coordinates, and parameters.
+    Feature counts per type and tag, vertex counts per type and estimated
+    memory use are kept up to date incrementally, so reading them is O(1).
     """
     
     def __init__(self):
         self.features: Dict[str, Dict[str, Any]] = {}
         self.used_ids: set = set()
+        self.feature_counts: Dict[str, int] = {}  # type -> number of features
+        self.vertex_counts: Dict[str, int] = {}  # type -> number of coordinates
+        self.tag_counts: Dict[str, int] = {}  # tag -> number of features
+        self.estimated_bytes: Dict[str, int] = {'coords': 0, 'params': 0, 'features': 0}
     
     def add_feature(self, feature_type: str, coords: List[List[float]], 
                    params: Dict[str, str], feature_id: Optional[str] = None) -> str:
@@ -45,6 +61,12 @@ class State:
             'params': params
         }
         self.used_ids.add(feature_id)
+        self.feature_counts[feature_type] = self.feature_counts.get(feature_type, 0) + 1
+        self.vertex_counts[feature_type] = self.vertex_counts.get(feature_type, 0) + len(coords)
+        tag = params.get('tag')
+        if tag is not None:
+            self.tag_counts[tag] = self.tag_counts.get(tag, 0) + 1
+        self._account(feature_id, coords, params, 1)
         
         return feature_id
     
@@ -71,7 +93,7 @@ class State:
             True if the feature was removed, False if it didn't exist
         """
         if feature_id in self.features:
-            del self.features[feature_id]
+            self._uncount(feature_id, self.features.pop(feature_id))
             self.used_ids.discard(feature_id)
             return True
         return False
@@ -90,6 +112,7 @@ class State:
         for feature_id, feature_data in list(self.features.items()):
             if feature_data['params'].get('tag') == tag:
                 del self.features[feature_id]
+                self._uncount(feature_id, feature_data)
                 self.used_ids.discard(feature_id)
                 removed_ids.append(feature_id)
         return removed_ids
@@ -104,7 +127,31 @@ class State:
         removed_ids = list(self.features.keys())
         self.features.clear()
         self.used_ids.clear()
+        self.feature_counts.clear()
+        self.vertex_counts.clear()
+        self.tag_counts.clear()
+        self.estimated_bytes = dict.fromkeys(self.estimated_bytes, 0)
         return removed_ids
+
+    def _uncount(self, feature_id: str, feature_data: Dict[str, Any]) -> None:
+        feature_type = feature_data['type']
+        self.feature_counts[feature_type] -= 1
+        self.vertex_counts[feature_type] -= len(feature_data['coords'])
+        tag = feature_data['params'].get('tag')
+        if tag is not None:
+            remaining = self.tag_counts[tag] - 1
+            if remaining:
+                self.tag_counts[tag] = remaining
+            else:
+                del self.tag_counts[tag]  # tags come and go; keep the table small
+        self._account(feature_id, feature_data['coords'], feature_data['params'], -1)
+
+    def _account(self, feature_id: str, coords: List[List[float]], params: Dict[str, Any], sign: int) -> None:
+        """Add (sign=1) or subtract (sign=-1) the estimated size of a feature in O(1)."""
+        sizes = self.estimated_bytes
+        sizes['coords'] += sign * (_LIST_SIZE + len(coords) * (_POINTER_SIZE + _PAIR_SIZE))
+        sizes['params'] += sign * (sys.getsizeof(params) + len(params) * _PARAM_VALUE_SIZE)
+        sizes['features'] += sign * (_FEATURE_SIZE + sys.getsizeof(feature_id) + 2 * _SLOT_SIZE)
     
     def _generate_id(self) -> str:
         """
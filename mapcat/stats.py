@@ -0,0 +1,130 @@
+"""
+State and memory accounting for the stats command and GET /stats.
+
+collect() only reads counters that State keeps up to date as features are
+added and removed, plus small sources registered by other modules (chunk
+sessions, input queues, rings, WebSocket clients, tiles), so it costs the
+same with ten features or a million.
+"""
+import os
+import sys
+from typing import Any, Callable, Dict, Optional
+
+from mapcat.state import State
+
+TOP_TAGS = 10  # tags listed by format_stats; the JSON has all of them
+
+# A source returns a JSON-serializable value reported under its key
+Source = Callable[[], Any]
+
+_sources: Dict[str, Source] = {}
+
+
+def add_source(key: str, source: Source) -> None:
+    """Register (or replace) a source of values reported under key."""
+    _sources[key] = source
+
+
+def collect(state: State) -> Dict[str, Any]:
+    """Gather the statistics of a State and all registered sources (call on the event loop)."""
+    feature_types = {feature_type: count for feature_type, count in state.feature_counts.items() if count}
+    vertex_types = {feature_type: count for feature_type, count in state.vertex_counts.items() if count}
+    estimated = dict(state.estimated_bytes)
+    stats: Dict[str, Any] = {
+        'features': {
+            'total': sum(feature_types.values()),
+            'by_type': feature_types,
+            'by_tag': dict(state.tag_counts),
+        },
+        'vertices': {
+            'total': sum(vertex_types.values()),
+            'by_type': vertex_types,
+        },
+        'memory': {
+            'state_estimated_bytes': sum(estimated.values()),
+            'state_breakdown_bytes': estimated,
+            'rss_bytes': rss_bytes(),
+        },
+    }
+    for key, source in list(_sources.items()):
+        stats[key] = source()
+    return stats
+
+
+def rss_bytes() -> Optional[int]:
+    """
+    Resident set size of this process.
+
+    Reads /proc on Linux; elsewhere falls back to the peak RSS from
+    getrusage(). Returns None if neither is available (Windows).
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024  # macOS reports bytes, Linux KiB
+
+
+def format_stats(stats: Dict[str, Any]) -> str:
+    """Render collect() output as text for the stats command."""
+    features = stats['features']
+    lines = [f"Features: {features['total']}{_breakdown(features['by_type'])}"]
+    tags = sorted(features['by_tag'].items(), key=lambda item: (-item[1], item[0]))
+    if tags:
+        shown = ', '.join(f"{tag} {count}" for tag, count in tags[:TOP_TAGS])
+        more = f", ... ({len(tags) - TOP_TAGS} more)" if len(tags) > TOP_TAGS else ''
+        lines.append(f"  by tag: {shown}{more}")
+    lines.append(f"Vertices: {stats['vertices']['total']}{_breakdown(stats['vertices']['by_type'])}")
+
+    memory = stats['memory']
+    breakdown = ', '.join(f"{key} {format_bytes(value)}" for key, value in memory['state_breakdown_bytes'].items())
+    rss = format_bytes(memory['rss_bytes']) if memory['rss_bytes'] is not None else 'unknown'
+    lines.append(f"Memory: state ~{format_bytes(memory['state_estimated_bytes'])} ({breakdown}), process RSS {rss}")
+
+    chunker = stats.get('chunker')
+    if chunker is not None:
+        lines.append(f"Chunker: {chunker['sessions']} open sessions, {format_bytes(chunker['buffered_bytes'])} buffered")
+    ingest = stats.get('ingest')
+    if ingest is not None:
+        lines.append(f"Ingest queue: {ingest['queued_batches']} of {ingest['max_batches']} batches")
+    for ring in stats.get('rings', []):
+        lines.append(f"Ring {ring['path']}: {format_bytes(ring['pending_bytes'])} of {format_bytes(ring['capacity'])} pending, "
+                     f"{ring['dropped']} records dropped by producers")
+    tiles = stats.get('tiles')
+    if tiles is not None and tiles['source'] == 'mbtiles':
+        lines.append(f"Tiles from {tiles['path']}: {tiles['hits']} from memory, {tiles['reads']} read, {tiles['missing']} missing, {tiles['errors']} errors; "
+                     f"{tiles['hot_tiles']} hot tiles, {format_bytes(tiles['hot_bytes'])} of {format_bytes(tiles['max_hot_bytes'])}")
+    elif tiles is not None:
+        lines.append(f"Tile cache: {tiles['tiles']} tiles, {format_bytes(tiles['bytes'])} of {format_bytes(tiles['max_bytes'])}; "
+                     f"{tiles['hits']} hits, {tiles['misses']} misses, {tiles['deduplicated']} deduplicated, "
+                     f"{tiles['evictions']} evicted, {tiles['errors']} errors")
+    clients = stats.get('clients', [])
+    lines.append(f"Clients: {len(clients)}")
+    for client in clients:
+        lines.append(f"  {client['client']}: {format_bytes(client['queued_bytes'])} queued, "
+                     f"{client['unacked']} unacked, {client['deferred']} deferred")
+    return '\n'.join(lines)
+
+
+def format_bytes(count: int) -> str:
+    """Human-readable size: 512 B, 12.3 KB, 4.0 MB."""
+    if count < 1024:
+        return f"{count} B"
+    value = count / 1024
+    for unit in ('KB', 'MB'):
+        if value < 1024:
+            return f"{value:.1f} {unit}"
+        value /= 1024
+    return f"{value:.1f} GB"
+
+
+def _breakdown(counts: Dict[str, int]) -> str:
+    if not counts:
+        return ''
+    return ' (' + ', '.join(f"{key} {count}" for key, count in counts.items()) + ')'
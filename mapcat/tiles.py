@@ -0,0 +1,254 @@
+"""
+Map tiles served by mapcat's own HTTP server.
+
+By default the page loads OpenStreetMap tiles straight from the internet. With
+--tile-cache DIR the page requests /tiles/{z}/{x}/{y}.png from mapcat instead,
+and TileCache answers from a size-bounded on-disk cache, fetching missing tiles
+from the upstream server once:
+
+    DIR/{z}/{x}/{y}.tile    raw tile bytes, as received from upstream
+
+The least recently used tiles are deleted when the cache grows over its size
+limit. A tile file's mtime is its last use, so the order survives restarts.
+Concurrent requests for a tile that is being fetched wait for that one fetch.
+
+A tile source is anything with the TileCache interface: get(), layer(),
+stats() and metrics().
+"""
+import asyncio
+import os
+import urllib.error
+import urllib.request
+from collections import OrderedDict
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+DEFAULT_UPSTREAM = 'https://tile.openstreetmap.org/{z}/{x}/{y}.png'
+DEFAULT_CACHE_MB = 512
+FETCH_TIMEOUT = 10.0  # seconds per upstream socket operation
+REQUEST_TIMEOUT = 5.0  # seconds to answer a tile request, well below the 10 s websockets allows process_request
+MAX_ZOOM = 22
+USER_AGENT = 'mapcat tile cache (https://github.com/MaximTkachenko-TomTom/mapcat)'
+TILE_PATH = 'tiles/{z}/{x}/{y}.png'  # served by server.process_request
+
+# Leaflet tileLayer options of the default layer, injected into index.html
+OSM_LAYER = {
+    'url': 'https://tile.openstreetmap.org/{z}/{x}/{y}.png',
+    'maxZoom': 19,
+    'attribution': '© OpenStreetMap',
+}
+
+Key = Tuple[int, int, int]
+
+
+class TileError(Exception):
+    """A tile could not be fetched or read (served as 502 Bad Gateway)."""
+
+
+class Tile(NamedTuple):
+    data: bytes
+    content_type: str
+
+
+def image_type(data: bytes) -> str:
+    """Content type of a raster tile, from its magic bytes."""
+    if data.startswith(b'\x89PNG'):
+        return 'image/png'
+    if data.startswith(b'\xff\xd8'):
+        return 'image/jpeg'
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'image/webp'
+    return 'application/octet-stream'
+
+
+def valid_tile(z: int, x: int, y: int, max_zoom: int = MAX_ZOOM) -> bool:
+    return 0 <= z <= max_zoom and 0 <= x < 2 ** z and 0 <= y < 2 ** z
+
+
+def _retrieve_exception(task: asyncio.Task) -> None:
+    # Every waiter may have gone away; do not log the failure as never retrieved
+    if not task.cancelled():
+        task.exception()
+
+
+class TileCache:
+    """
+    Tile proxy with an LRU disk cache.
+
+    Args:
+        directory: Cache directory (created if missing)
+        max_bytes: Size limit of the cached tiles
+        upstream: URL template of the tile server, with {z}, {x}, {y} (and optionally {s})
+        subdomains: Values for {s}, rotated per request
+
+    Raises:
+        OSError: If the directory cannot be created or scanned
+    """
+
+    def __init__(self, directory: str, max_bytes: int = DEFAULT_CACHE_MB * 1024 * 1024,
+                 upstream: str = DEFAULT_UPSTREAM, subdomains: str = 'abc'):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.upstream = upstream
+        self.subdomains = subdomains or 'a'
+        self.index: 'OrderedDict[Key, int]' = OrderedDict()  # key -> size, least recently used first
+        self.total_bytes = 0
+        self._inflight: Dict[Key, asyncio.Task] = {}
+        self._requests = 0
+        self.hits = 0
+        self.misses = 0
+        self.deduplicated = 0
+        self.evictions = 0
+        self.errors = 0
+        os.makedirs(directory, exist_ok=True)
+        self._scan()
+
+    def path(self, key: Key) -> str:
+        z, x, y = key
+        return os.path.join(self.directory, str(z), str(x), f"{y}.tile")
+
+    def _scan(self) -> None:
+        """Rebuild the LRU index from the files on disk, oldest mtime first."""
+        found = []
+        for directory, _, filenames in os.walk(self.directory):
+            relative = os.path.relpath(directory, self.directory).split(os.sep)
+            for filename in filenames:
+                name, extension = os.path.splitext(filename)
+                if extension != '.tile' or len(relative) != 2:
+                    continue
+                try:
+                    key = (int(relative[0]), int(relative[1]), int(name))
+                    info = os.stat(os.path.join(directory, filename))
+                except (ValueError, OSError):
+                    continue
+                found.append((info.st_mtime, key, info.st_size))
+        for _, key, size in sorted(found):
+            self.index[key] = size
+            self.total_bytes += size
+        self._evict()
+
+    async def get(self, z: int, x: int, y: int) -> Optional[Tile]:
+        """
+        Return a tile from the cache, fetching it from upstream if needed.
+
+        Returns:
+            The tile, or None if it does not exist (invalid coordinates or 404 upstream)
+
+        Raises:
+            TileError: If the upstream server failed
+        """
+        if not valid_tile(z, x, y):
+            return None
+        key = (z, x, y)
+        self._requests += 1
+        if key in self.index:
+            data = await asyncio.to_thread(self._read, key)
+            if data is not None:
+                self.hits += 1
+                if key in self.index:  # not evicted while it was being read
+                    self.index.move_to_end(key)
+                return Tile(data, image_type(data))
+            # Deleted behind our back: forget it and fetch again
+            if key in self.index:
+                self.total_bytes -= self.index.pop(key)
+        task = self._inflight.get(key)
+        if task is not None:
+            self.deduplicated += 1
+        else:
+            self.misses += 1
+            task = self._inflight[key] = asyncio.ensure_future(self._fetch(key))
+            task.add_done_callback(_retrieve_exception)
+        # shield: a browser that gives up on a tile does not cancel it for the others
+        return await asyncio.shield(task)
+
+    def _read(self, key: Key) -> Optional[bytes]:
+        """Runs in a worker thread: read a cached tile and mark it as used."""
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path)
+        except OSError:
+            return None
+        return data
+
+    async def _fetch(self, key: Key) -> Optional[Tile]:
+        try:
+            tile = await asyncio.to_thread(self._download_and_store, key, self._url(key))
+            if tile is not None:
+                self.total_bytes += len(tile.data) - self.index.pop(key, 0)
+                self.index[key] = len(tile.data)
+                self._evict()
+            return tile
+        except TileError:
+            self.errors += 1
+            raise
+        finally:
+            del self._inflight[key]
+
+    def _url(self, key: Key) -> str:
+        z, x, y = key
+        subdomain = self.subdomains[self._requests % len(self.subdomains)]
+        return self.upstream.format(z=z, x=x, y=y, s=subdomain)
+
+    def _download_and_store(self, key: Key, url: str) -> Optional[Tile]:
+        """Runs in a worker thread: fetch a tile and write it to disk atomically."""
+        request = urllib.request.Request(url, headers={'User-Agent': USER_AGENT})
+        try:
+            with urllib.request.urlopen(request, timeout=FETCH_TIMEOUT) as response:
+                data = response.read()
+        except urllib.error.HTTPError as e:
+            if e.code == 404:
+                return None
+            raise TileError(f"{url}: HTTP {e.code}")
+        except (OSError, ValueError) as e:
+            raise TileError(f"{url}: {e}")
+        path = self.path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            temporary = f"{path}.{os.getpid()}.tmp"
+            with open(temporary, 'wb') as f:
+                f.write(data)
+            os.replace(temporary, path)
+        except OSError as e:
+            raise TileError(f"cannot store tile {path}: {e}")
+        return Tile(data, image_type(data))
+
+    def _evict(self) -> None:
+        while self.total_bytes > self.max_bytes and self.index:
+            key, size = self.index.popitem(last=False)
+            self.total_bytes -= size
+            self.evictions += 1
+            try:
+                os.remove(self.path(key))
+            except OSError:
+                pass
+
+    def layer(self) -> Dict[str, Any]:
+        """Leaflet tileLayer options for index.html."""
+        return dict(OSM_LAYER, url=TILE_PATH)
+
+    def stats(self) -> Dict[str, Any]:
+        """Stats source for the stats command and GET /stats."""
+        return {
+            'source': 'cache',
+            'tiles': len(self.index),
+            'bytes': self.total_bytes,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'deduplicated': self.deduplicated,
+            'evictions': self.evictions,
+            'errors': self.errors,
+            'fetching': len(self._inflight),
+        }
+
+    def metrics(self) -> List[Tuple[str, str, str, List]]:
+        """Collector for /metrics."""
+        return [
+            ('mapcat_tile_requests_total', 'counter', 'Tile requests, by result (hit, miss, deduplicated: joined a fetch in progress)',
+                [({'result': 'hit'}, self.hits), ({'result': 'miss'}, self.misses), ({'result': 'deduplicated'}, self.deduplicated)]),
+            ('mapcat_tile_cache_tiles', 'gauge', 'Tiles in the disk cache', [({}, len(self.index))]),
+            ('mapcat_tile_cache_bytes', 'gauge', 'Size of the tiles in the disk cache', [({}, self.total_bytes)]),
+            ('mapcat_tile_cache_evictions_total', 'counter', 'Tiles deleted to stay under the size limit', [({}, self.evictions)]),
+            ('mapcat_tile_fetch_errors_total', 'counter', 'Failed upstream tile fetches', [({}, self.errors)]),
+        ]
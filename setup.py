@@ -7,15 +7,16 @@ setup(
     author='Maxim Tkachenko',
     packages=find_packages(),
     package_data={
-        'mapcat': ['static/*'],
+        'mapcat': ['static/*', 'static/leaflet/*', 'static/leaflet/images/*'],
     },
     include_package_data=True,
     install_requires=[
-        'websockets',
+        'websockets>=14',
     ],
     entry_points={
         'console_scripts': [
             'mapcat=mapcat.main:main',
+            'mapcat-loadgen=mapcat.loadgen:main',
         ],
     },
     python_requires='>=3.11',
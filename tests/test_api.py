@@ -0,0 +1,145 @@
+"""
+Tests for the in-process Python API.
+"""
+import asyncio
+import json
+import socket
+import threading
+from array import array
+from unittest.mock import patch
+import pytest
+from mapcat import api, server
+
+
+def test_add_features_without_loop():
+    session = api.Session()
+    point_id = session.add_point((52.5, 13.4), color='red', id='p1')
+    line_id = session.add_polyline([(52.5, 13.4), (52.6, 13.5)], width=3)
+    polygon_id = session.add_polygon([(52.1, 13.1), (52.2, 13.2), (52.15, 13.15)], tag='area')
+
+    assert point_id == 'p1'
+    assert session.state.get_feature('p1')['params']['color'] == 'red'
+    assert session.state.get_feature(line_id)['params']['width'] == 3
+    assert session.state.get_feature(polygon_id)['coords'][2] == [52.15, 13.15]
+
+
+def test_flat_float_buffer():
+    session = api.Session()
+    line_id = session.add_polyline(array('d', [52.5, 13.4, 52.6, 13.5, 52.7, 13.6]))
+    assert session.state.get_feature(line_id)['coords'] == [[52.5, 13.4], [52.6, 13.5], [52.7, 13.6]]
+
+
+def test_two_dimensional_buffer():
+    session = api.Session()
+    flat = memoryview(array('d', [52.5, 13.4, 52.6, 13.5]))
+    line_id = session.add_polyline(flat.cast('B').cast('d', (2, 2)))
+    assert session.state.get_feature(line_id)['coords'] == [[52.5, 13.4], [52.6, 13.5]]
+
+
+@pytest.mark.parametrize("coords", [
+    [(91, 13.4), (52.6, 13.5)],
+    [(52.5, 181), (52.6, 13.5)],
+    [(52.5,), (52.6, 13.5)],
+    array('d', [52.5, 13.4, 52.6]),
+])
+def test_invalid_coordinates_raise(coords):
+    with pytest.raises(ValueError):
+        api.Session().add_polyline(coords)
+
+
+def test_handler_rejection_returns_none(capsys):
+    session = api.Session()
+    session.add_point((52.5, 13.4), id='dup')
+    assert session.add_point((52.6, 13.5), id='dup') is None
+    assert session.add_polyline([(52.5, 13.4)]) is None
+    assert "already exists" in capsys.readouterr().err
+
+
+def test_remove_and_clear():
+    session = api.Session()
+    session.add_point((52.5, 13.4), id='a', tag='t')
+    session.add_point((52.6, 13.5), id='b', tag='t')
+    session.add_point((52.7, 13.6), id='c')
+
+    assert session.remove(id='c')
+    assert session.remove(tag='t')
+    assert not session.state.features
+    session.add_point((52.7, 13.6))
+    session.clear()
+    assert not session.state.features
+
+
+def test_broadcasts_and_batch_on_running_loop():
+    broadcasts = []
+
+    async def fake_broadcast(msg):
+        broadcasts.append(json.loads(msg))
+
+    async def run():
+        session = api.Session()
+        session.add_point((52.5, 13.4), id='single')
+        with session.batch():
+            session.add_point((52.6, 13.5), id='b1')
+            session.update_current_position((52.6, 13.5))
+        await asyncio.sleep(0)
+
+    with patch("mapcat.server.broadcast", side_effect=fake_broadcast):
+        asyncio.run(run())
+
+    assert broadcasts[0]['id'] == 'single'
+    assert broadcasts[1]['action'] == 'batch'
+    assert [m['action'] for m in broadcasts[1]['messages']] == ['add', 'update-current-position']
+
+
+def test_calls_from_other_thread_run_on_loop():
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    seen_threads = []
+
+    async def fake_broadcast(msg):
+        seen_threads.append(threading.current_thread())
+
+    try:
+        with patch("mapcat.server.broadcast", side_effect=fake_broadcast):
+            session = api.Session(loop=loop)
+            assert session.add_point((52.5, 13.4), id='x') == 'x'
+            asyncio.run_coroutine_threadsafe(asyncio.sleep(0.01), loop).result()
+    finally:
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+
+    assert seen_threads == [thread]
+    assert session.state.get_feature('x') is not None
+
+
+def test_batch_from_caller_thread_after_start():
+    broadcasts = []
+
+    async def fake_broadcast(msg):
+        broadcasts.append(json.loads(msg))
+
+    try:
+        with patch("mapcat.server.broadcast", side_effect=fake_broadcast):
+            session = api.start(port=0)
+            session.add_point((52.5, 13.4), id='single')
+            with session.batch():
+                session.add_point((52.6, 13.5), id='b1')
+                session.add_point((52.7, 13.6), id='b2')
+            asyncio.run_coroutine_threadsafe(asyncio.sleep(0.01), session._loop).result()
+    finally:
+        server.set_state_getter(None)
+
+    assert [m.get('id') for m in broadcasts] == ['single', None]
+    assert [m['id'] for m in broadcasts[1]['messages']] == ['b1', 'b2']
+
+
+def test_start_raises_when_port_is_in_use():
+    with socket.socket() as taken:
+        taken.bind(('0.0.0.0', 0))
+        taken.listen()
+        try:
+            with pytest.raises(OSError):
+                api.start(port=taken.getsockname()[1])
+        finally:
+            server.set_state_getter(None)
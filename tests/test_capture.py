@@ -0,0 +1,122 @@
+"""
+Tests for input recording and replay.
+"""
+import asyncio
+import gzip
+import subprocess
+import sys
+import pytest
+from mapcat import capture
+
+
+class Collector:
+    """Sink that records (source, line) pairs and the loop time of each batch."""
+
+    def __init__(self):
+        self.items = []
+        self.times = []
+
+    async def __call__(self, source, lines):
+        self.times.append(asyncio.get_running_loop().time())
+        self.items.extend((source, line) for line in lines)
+
+
+def record(path, batches):
+    recorder = capture.Recorder(str(path))
+    for source, lines in batches:
+        recorder.record(source, lines)
+    recorder.close()
+
+
+@pytest.mark.parametrize("name", ["cap.txt", "cap.txt.gz"])
+def test_record_and_replay_round_trip(tmp_path, name):
+    path = tmp_path / name
+    record(path, [
+        ("stdin", ["add-point (52.5,13.4)\n", "  leading spaces and\ttab"]),
+        ("tcp:127.0.0.1:5000", ["chunk a 1/1 clear "]),
+        ("stdin", ["", "carriage\rreturn\r\n"]),
+    ])
+    sink = Collector()
+    stats = asyncio.run(capture.run_replay(str(path), sink, speed=None))
+
+    assert sink.items == [
+        ("stdin", "add-point (52.5,13.4)"),
+        ("stdin", "  leading spaces and\ttab"),
+        ("tcp:127.0.0.1:5000", "chunk a 1/1 clear "),
+        ("stdin", ""),
+        ("stdin", "carriage\rreturn\r"),
+    ]
+    assert stats.lines == 5
+
+
+def test_replay_respects_timing_and_speed(tmp_path):
+    path = tmp_path / "cap.txt"
+    path.write_text(
+        "#mapcat-capture 1\n"
+        "@0 stdin\n"
+        "0 0 first\n"
+        "200000 0 second\n"
+    )
+
+    def replay(speed):
+        sink = Collector()
+        asyncio.run(capture.run_replay(str(path), sink, speed=speed))
+        return sink.times[1] - sink.times[0]
+
+    assert replay(1.0) >= 0.19
+    assert replay(4.0) < 0.15
+
+
+def test_replay_rejects_non_capture_file(tmp_path):
+    path = tmp_path / "cmds.txt"
+    path.write_text("add-point (52.5,13.4)\n")
+    with pytest.raises(capture.CaptureError):
+        asyncio.run(capture.run_replay(str(path), Collector()))
+
+
+def test_replay_skips_malformed_records(tmp_path, capsys):
+    path = tmp_path / "cap.txt"
+    path.write_text("#mapcat-capture 1\n@0 stdin\nnot-a-record\n0 7 unknown-source\n0 0 ok\n")
+    sink = Collector()
+    asyncio.run(capture.run_replay(str(path), sink, speed=None))
+
+    assert sink.items == [("stdin", "ok")]
+    assert "malformed" in capsys.readouterr().err
+
+
+def test_replay_truncated_gzip(tmp_path, capsys):
+    """A gzip capture cut off (recorder killed) replays what was written."""
+    full = tmp_path / "cap.txt.gz"
+    record(full, [("stdin", [f"line{i}" for i in range(2000)])])
+    data = full.read_bytes()
+    truncated = tmp_path / "cut.txt.gz"
+    truncated.write_bytes(data[:len(data) - 12])
+    sink = Collector()
+    asyncio.run(capture.run_replay(str(truncated), sink, speed=None))
+
+    assert sink.items[0] == ("stdin", "line0")
+    assert "truncated" in capsys.readouterr().err
+
+
+def test_recording_sink_passes_lines_through(tmp_path):
+    path = tmp_path / "cap.txt"
+    recorder = capture.Recorder(str(path))
+    sink = Collector()
+    asyncio.run(recorder.wrap(sink)("stdin", ["clear"]))
+    recorder.close()
+
+    assert sink.items == [("stdin", "clear")]
+    header, source, entry = path.read_text().splitlines()
+    assert header == capture.CAPTURE_HEADER
+    assert source == "@0 stdin"
+    assert entry.endswith(" 0 clear")
+
+
+def test_unwritable_record_path_is_reported(tmp_path):
+    """The startup error reaches stderr although piped input logs through the buffered writer."""
+    path = tmp_path / "missing" / "cap.txt"
+    result = subprocess.run([sys.executable, "-m", "mapcat.main", "--no-open", "--record", str(path)],
+                            stdin=subprocess.DEVNULL, capture_output=True, text=True, timeout=30)
+
+    assert result.returncode == 1
+    assert f"Cannot open capture file {path}" in result.stderr
@@ -2,7 +2,7 @@
 Tests for the chunked protocol (Chunker class).
 """
 import pytest
-from mapcat.chunker import Chunker, MAX_SESSIONS, MAX_TOTAL_CHUNKS
+from mapcat.chunker import Chunker, SourceChunkers, MAX_SESSIONS, MAX_SOURCES, MAX_TOTAL_CHUNKS
 
 
 def test_in_order_chunks():
@@ -220,3 +220,178 @@ def test_commit_actual_chunks_exceed_limit_rejected(capsys):
     assert result is None
     captured = capsys.readouterr()
     assert "exceeds limit" in captured.err.lower()
+
+
+def test_v2_chunks_auto_commit():
+    """Self-describing chunks execute as soon as the last one arrives, without commit."""
+    chunker = Chunker()
+    assert chunker.add_chunk_v2("v1", seq=2, total=2, content=";(52.7,13.6) color=blue") is None
+    assert chunker.has_session("v1")
+    result = chunker.add_chunk_v2("v1", seq=1, total=2, content="add-polyline (52.5,13.4);(52.6,13.5)")
+
+    assert result is not None
+    assert result['cmd'] == 'add-polyline'
+    assert len(result['coords']) == 3
+    assert not chunker.has_session("v1")
+
+
+def test_v2_single_chunk():
+    """A v2 session with total=1 executes immediately."""
+    chunker = Chunker()
+    result = chunker.add_chunk_v2("v2", seq=1, total=1, content="add-point (52.5,13.4)")
+
+    assert result is not None
+    assert result['coords'] == [[52.5, 13.4]]
+
+
+def test_v2_seq_out_of_range_rejected(capsys):
+    """seq outside 1..total is rejected and opens no session."""
+    chunker = Chunker()
+    assert chunker.add_chunk_v2("v3", seq=3, total=2, content="x") is None
+
+    captured = capsys.readouterr()
+    assert "seq" in captured.err.lower()
+    assert not chunker.has_session("v3")
+
+
+def test_v2_total_exceeds_limit_rejected(capsys):
+    """total > MAX_TOTAL_CHUNKS is rejected."""
+    chunker = Chunker()
+    assert chunker.add_chunk_v2("v4", seq=1, total=MAX_TOTAL_CHUNKS + 1, content="x") is None
+
+    captured = capsys.readouterr()
+    assert "total" in captured.err.lower()
+    assert not chunker.has_session("v4")
+
+
+def test_v2_total_mismatch_ignored(capsys):
+    """A chunk whose total disagrees with the session is ignored."""
+    chunker = Chunker()
+    chunker.add_chunk_v2("v5", seq=1, total=2, content="add-polyline (52.5,13.4)")
+    assert chunker.add_chunk_v2("v5", seq=2, total=3, content=";(52.6,13.5)") is None
+
+    captured = capsys.readouterr()
+    assert "v5" in captured.err
+    assert len(chunker._sessions["v5"].chunks) == 1
+
+
+def _compressed(text, raw=False):
+    import base64
+    import zlib
+    if raw:
+        compressor = zlib.compressobj(wbits=-zlib.MAX_WBITS)
+        data = compressor.compress(text.encode()) + compressor.flush()
+    else:
+        data = zlib.compress(text.encode())
+    return "z:" + base64.b64encode(data).decode()
+
+
+def test_compressed_payload_split_across_chunks():
+    """A base64 zlib payload split across chunks is decompressed before parsing."""
+    coords = ";".join(f"(52.{i},13.{i})" for i in range(1, 200))
+    payload = _compressed(f"add-polyline {coords} color=blue")
+    chunker = Chunker()
+    chunker.open_session("c1")
+    chunker.add_chunk("c1", seq=2, content=payload[40:])
+    chunker.add_chunk("c1", seq=1, content=payload[:40])
+    result = chunker.commit_session("c1", total=2)
+
+    assert result is not None
+    assert result['cmd'] == 'add-polyline'
+    assert len(result['coords']) == 199
+    assert result['params']['color'] == 'blue'
+
+
+def test_compressed_raw_deflate_payload():
+    """Raw deflate streams (no zlib header) are accepted too."""
+    chunker = Chunker()
+    result = chunker.add_chunk_v2("c2", seq=1, total=1, content=_compressed("add-point (52.5,13.4)", raw=True))
+
+    assert result is not None
+    assert result['coords'] == [[52.5, 13.4]]
+
+
+def test_compressed_payload_invalid_base64(capsys):
+    """Garbage after z: logs an error and returns None."""
+    chunker = Chunker()
+    result = chunker.add_chunk_v2("c3", seq=1, total=1, content="z:not*base64")
+
+    assert result is None
+    captured = capsys.readouterr()
+    assert "base64" in captured.err.lower()
+
+
+def test_compressed_payload_truncated(capsys):
+    """A payload missing its tail logs an error instead of parsing partial text."""
+    payload = _compressed("add-point (52.5,13.4) color=red label=\"Home\"")
+    truncated = payload[:len(payload) - 8]
+    chunker = Chunker()
+    result = chunker.add_chunk_v2("c4", seq=1, total=1, content=truncated)
+
+    assert result is None
+    captured = capsys.readouterr()
+    assert "c4" in captured.err
+
+
+def test_compressed_payload_size_limit(capsys, monkeypatch):
+    """Output beyond MAX_DECOMPRESSED_BYTES is rejected."""
+    from mapcat import chunker as chunker_module
+    monkeypatch.setattr(chunker_module, "MAX_DECOMPRESSED_BYTES", 1024)
+    chunker = Chunker()
+    result = chunker.add_chunk_v2("c5", seq=1, total=1, content=_compressed("add-point " + " " * 4096 + "(52.5,13.4)"))
+
+    assert result is None
+    captured = capsys.readouterr()
+    assert "exceeds limit" in captured.err.lower()
+
+
+def test_sources_have_separate_namespaces():
+    """The same session id from two sources refers to two independent sessions."""
+    chunkers = SourceChunkers()
+    a = chunkers.for_source("dev-a")
+    b = chunkers.for_source("dev-b")
+    a.open_session("s1")
+    b.open_session("s1")
+    a.add_chunk("s1", seq=1, content="add-point (52.1,13.1)")
+    b.add_chunk("s1", seq=1, content="add-point (52.2,13.2)")
+
+    assert a.commit_session("s1", total=1)['coords'] == [[52.1, 13.1]]
+    assert b.commit_session("s1", total=1)['coords'] == [[52.2, 13.2]]
+
+
+def test_busy_source_does_not_evict_other_sources(capsys):
+    """MAX_SESSIONS is enforced per source: flooding one source leaves others intact."""
+    chunkers = SourceChunkers()
+    quiet = chunkers.for_source("quiet")
+    quiet.open_session("keep")
+    busy = chunkers.for_source("busy")
+    for i in range(MAX_SESSIONS * 2):
+        busy.open_session(f"b{i}")
+
+    assert quiet.has_session("keep")
+    assert len(busy._sessions) == MAX_SESSIONS
+    captured = capsys.readouterr()
+    assert "chunker[busy]" in captured.err
+
+
+def test_for_source_returns_same_chunker():
+    """Repeated lookups of a source return the same Chunker."""
+    chunkers = SourceChunkers()
+    assert chunkers.for_source("x") is chunkers.for_source("x")
+    assert chunkers.for_source("x").source == "x"
+
+
+def test_max_sources_drops_least_recently_active(capsys):
+    """Beyond MAX_SOURCES, the least recently active source is dropped."""
+    chunkers = SourceChunkers()
+    for i in range(MAX_SOURCES):
+        chunkers.for_source(f"src{i}")
+    chunkers.for_source("src0")  # src0 becomes most recently active
+    chunkers.for_source("new")
+
+    sources = chunkers.sources()
+    assert len(sources) == MAX_SOURCES
+    assert "src0" in sources
+    assert "src1" not in sources
+    captured = capsys.readouterr()
+    assert "src1" in captured.err
@@ -255,3 +255,16 @@ def test_zorder_invalid_value_does_not_crash():
         result = handler(state, parsed)
         assert result is None
     assert len(state.features) == 0
+
+
+def test_browser_stats_table(capsys):
+    from mapcat.commands import format_browser_stats
+    assert COMMAND_HANDLERS['browser-stats'](State(), {'cmd': 'browser-stats', 'coords': [], 'params': {}}) is None
+    assert 'No browser performance reports' in capsys.readouterr().out
+
+    table = format_browser_stats([('127.0.0.1:5000', {'fps': 59.84, 'layers': 12.0, 'decode_avg_ms': 0.125,
+                                                      'long_tasks': 1.0, 'long_task_ratio': 0.25})])
+    header, row = table.splitlines()
+    assert header.split()[:3] == ['client', 'fps', 'layers']
+    assert row.split()[:3] == ['127.0.0.1:5000', '59.8', '12']
+    assert '0.12/-' in row and '1 (25% busy)' in row
@@ -0,0 +1,49 @@
+"""
+Tests for diagnostics output: rate limiting, buffering and JSON lines.
+"""
+import json
+from mapcat.diagnostics import Diagnostics
+
+
+def test_default_writes_immediately(capsys):
+    d = Diagnostics()
+    d.error('parse', 'Invalid command', 'parse foo')
+    d.warning('chunker', 'missing chunk', 'chunker[tcp:1]')
+    d.success('add-point', 'add-point (52.5,13.4)')
+
+    out, err = capsys.readouterr()
+    assert 'FAIL: parse foo' in err and 'FAIL: Invalid command' in err
+    assert 'WARN: chunker[tcp:1]: missing chunk' in err
+    assert 'OK: add-point (52.5,13.4)' in out
+
+
+def test_rate_limit_summarizes_per_category(capsys):
+    d = Diagnostics(rate_limit=3, window=60)
+    for i in range(10):
+        d.error('parse', f'bad {i}')
+    d.error('remove', 'not found')
+    d.close()
+
+    err = capsys.readouterr().err
+    assert err.count('FAIL: bad') == 3
+    assert 'FAIL: not found' in err
+    assert 'FAIL: parse x7 more in last 60s (last: bad 9)' in err
+
+
+def test_buffered_output_is_written_on_flush(capsys):
+    d = Diagnostics(buffered=True)
+    d.error('parse', 'queued')
+    d.flush()
+    assert 'FAIL: queued' in capsys.readouterr().err
+    d.close()
+
+
+def test_json_lines(capsys):
+    d = Diagnostics(rate_limit=1, json_format=True, window=60)
+    d.error('parse', 'first', 'parse x')
+    d.error('parse', 'second')
+    d.close()
+
+    records = [json.loads(line) for line in capsys.readouterr().err.splitlines()]
+    assert records[0]['level'] == 'error' and records[0]['header'] == 'parse x' and records[0]['message'] == 'first'
+    assert records[1]['suppressed'] == 1 and records[1]['last'] == 'second'
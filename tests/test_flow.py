@@ -0,0 +1,131 @@
+"""
+Tests for render-acknowledgement flow control.
+"""
+import asyncio
+import json
+import websockets
+from mapcat import flow, server
+from mapcat.state import State
+
+
+def position(lat):
+    return json.dumps({'action': 'update-current-position', 'coords': [lat, 13.4], 'params': {}})
+
+
+def add(feature_id):
+    return json.dumps({'action': 'add', 'id': feature_id})
+
+
+def snapshot():
+    return json.dumps({'action': 'snapshot', 'features': [], 'replace': True})
+
+
+def test_clients_that_never_ack_get_everything():
+    client_flow = flow.ClientFlow(snapshot, max_unacked=2)
+    assert all(client_flow.admit(add(str(i))) for i in range(10))
+    assert client_flow.sent == 10
+
+
+def test_window_defers_and_batches():
+    client_flow = flow.ClientFlow(snapshot, max_unacked=2)
+    assert client_flow.ack(0) is None  # enables flow control
+    assert client_flow.admit(add('a')) and client_flow.admit(add('b'))
+    assert not client_flow.admit(add('c'))
+    assert not client_flow.admit(position(1))
+    assert not client_flow.admit(add('d'))
+    assert not client_flow.admit(position(2))
+    assert client_flow.coalesced == 1
+
+    assert client_flow.ack(1) is not None  # one slot free: everything deferred goes as one batch
+    assert client_flow.sent == 3 and client_flow.unacked == 2
+    assert client_flow.deferred == [] and client_flow.position is None
+
+
+def test_batch_keeps_order_and_latest_position():
+    client_flow = flow.ClientFlow(snapshot, max_unacked=1)
+    client_flow.ack(0)
+    client_flow.admit(add('a'))
+    for message in (add('b'), position(1), add('c'), position(2)):
+        client_flow.admit(message)
+    batch = json.loads(client_flow.ack(1))
+    assert batch['action'] == 'batch'
+    assert [m.get('id') for m in batch['messages']] == ['b', 'c', None]
+    assert batch['messages'][-1]['coords'] == [2, 13.4]
+    # New messages queue behind the unacknowledged batch
+    assert not client_flow.admit(add('d'))
+    assert client_flow.ack(1) is None  # stale ack
+    assert json.loads(client_flow.ack(2))['id'] == 'd'
+
+
+def test_too_much_deferred_resyncs_with_snapshot():
+    client_flow = flow.ClientFlow(snapshot, max_unacked=1, max_deferred=3)
+    client_flow.ack(0)
+    client_flow.admit(add('a'))
+    for i in range(10):
+        client_flow.admit(add(str(i)))
+    assert client_flow.resync and client_flow.resyncs == 1
+    assert client_flow.deferred == []
+    assert client_flow.coalesced == 10
+    assert json.loads(client_flow.ack(1)) == {'action': 'snapshot', 'features': [], 'replace': True}
+    assert not client_flow.resync
+
+
+def test_old_deferred_messages_resync():
+    client_flow = flow.ClientFlow(snapshot, max_unacked=1, max_lag=0.0)
+    client_flow.ack(0)
+    client_flow.admit(add('a'))
+    client_flow.admit(add('b'))
+    client_flow.deferred_since -= 1
+    client_flow.admit(add('c'))
+    assert client_flow.resync
+
+
+def test_invalid_acks_are_ignored():
+    client_flow = flow.ClientFlow(snapshot)
+    for seq in ('3', None, True, 1.5):
+        assert client_flow.ack(seq) is None
+    assert not client_flow.enabled
+    client_flow.ack(100)  # cannot acknowledge more than was sent
+    assert client_flow.acked == 0
+
+
+def test_slow_browser_is_sent_a_bounded_number_of_messages():
+    state = State()
+    state.add_feature('point', [[52.5, 13.4]], {}, 'initial')
+    server.set_state_getter(lambda: state)
+    server.set_max_unacked(4)
+
+    async def run():
+        async with websockets.serve(server.ws_handler, '127.0.0.1', 0) as ws_server:
+            port = ws_server.sockets[0].getsockname()[1]
+            async with websockets.connect(f"ws://127.0.0.1:{port}") as ws:
+                snapshot_message = json.loads(await ws.recv())
+                await ws.send(json.dumps({'type': 'ack', 'seq': 1}))
+                for _ in range(100):
+                    if all(client_flow.enabled for client_flow in server.flows.values()):
+                        break
+                    await asyncio.sleep(0.01)
+
+                for i in range(50):
+                    await server.broadcast(add(f"f{i}"))
+                received = []
+                while True:
+                    try:
+                        received.append(json.loads(await asyncio.wait_for(ws.recv(), 0.2)))
+                    except asyncio.TimeoutError:
+                        break
+
+                await ws.send(json.dumps({'type': 'ack', 'seq': 5}))
+                batch = json.loads(await asyncio.wait_for(ws.recv(), 1))
+                return snapshot_message, received, batch
+
+    try:
+        snapshot_message, received, batch = asyncio.run(run())
+    finally:
+        server.set_max_unacked(flow.DEFAULT_MAX_UNACKED)
+        server.set_state_getter(None)
+
+    assert snapshot_message['action'] == 'snapshot'
+    assert [m['id'] for m in received] == ['f0', 'f1', 'f2', 'f3']
+    assert batch['action'] == 'batch'
+    assert [m['id'] for m in batch['messages']] == [f"f{i}" for i in range(4, 50)]
@@ -0,0 +1,277 @@
+"""
+Tests for the input line readers.
+"""
+import asyncio
+import io
+import json
+import os
+import threading
+from unittest.mock import patch
+from mapcat import inputs
+from mapcat.main import stdin_broadcast_loop
+from mapcat.state import State
+
+
+def collect(gen):
+    async def run():
+        lines = []
+        async for batch in gen:
+            lines.extend(batch)
+        return lines
+    return asyncio.run(run())
+
+
+def write_pipe(data):
+    """Return a readable file object for a pipe fed with data by a writer thread."""
+    read_fd, write_fd = os.pipe()
+
+    def writer():
+        with os.fdopen(write_fd, 'wb') as w:
+            w.write(data)
+
+    threading.Thread(target=writer, daemon=True).start()
+    return os.fdopen(read_fd, 'rb')
+
+
+def test_bulk_reader_pipe_small_blocks():
+    """Lines spanning block boundaries are reassembled, including multibyte UTF-8."""
+    data = "add-point (52.5,13.4) label=\"Straße\"\nclear\nlast-without-newline".encode()
+    with write_pipe(data) as r:
+        lines = collect(inputs.read_lines_bulk(r, block_size=5))
+
+    assert lines == ['add-point (52.5,13.4) label="Straße"', 'clear', 'last-without-newline']
+
+
+def test_bulk_reader_regular_file(tmp_path):
+    """Regular files are read in blocks through the executor."""
+    path = tmp_path / "cmds.txt"
+    path.write_text("".join(f"line{i}\n" for i in range(1000)))
+    with open(path, 'rb') as f:
+        lines = collect(inputs.read_lines_bulk(f, block_size=64))
+
+    assert lines == [f"line{i}" for i in range(1000)]
+
+
+def test_bulk_reader_keeps_empty_lines():
+    """Empty lines are passed through; the caller decides to skip them."""
+    with write_pipe(b"a\n\nb\n") as r:
+        lines = collect(inputs.read_lines_bulk(r))
+
+    assert lines == ['a', '', 'b']
+
+
+def test_executor_reader():
+    """The readline-based reader yields one line per batch."""
+    lines = collect(inputs.read_lines_executor(io.StringIO("a\nb\n")))
+    assert lines == ['a\n', 'b\n']
+
+
+def test_has_fileno():
+    assert not inputs.has_fileno(io.StringIO(""))
+    with write_pipe(b"") as r:
+        assert inputs.has_fileno(r)
+
+
+def test_piped_stdin_uses_bulk_reader():
+    """stdin_broadcast_loop processes a real stdin pipe through the bulk reader."""
+    broadcasts = []
+
+    async def fake_broadcast(msg):
+        broadcasts.append(json.loads(msg))
+
+    data = b"add-point (52.5,13.4) id=p1\nchunk c 1/2 add-point (52.6,\nchunk c 2/2 13.5)\n"
+    with write_pipe(data) as r:
+        with patch("sys.stdin", r), patch("mapcat.server.broadcast", side_effect=fake_broadcast), \
+                patch.object(inputs, "read_lines_executor", side_effect=AssertionError("executor reader used")):
+            asyncio.run(stdin_broadcast_loop(is_tty=False, state=State(), verbose=False))
+
+    assert [b["coords"] for b in broadcasts] == [[52.5, 13.4], [52.6, 13.5]]
+
+
+class Collector:
+    """Sink that records (source, line) pairs."""
+
+    def __init__(self):
+        self.items = []
+
+    async def __call__(self, source, lines):
+        self.items.extend((source, line) for line in lines if line)
+
+    def lines(self):
+        return [line for _, line in self.items]
+
+
+async def wait_for(predicate, timeout=3.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not predicate():
+        assert asyncio.get_running_loop().time() < deadline, "timed out"
+        await asyncio.sleep(0.01)
+
+
+def free_port(kind):
+    import socket
+    with socket.socket(socket.AF_INET, kind) as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def test_run_file_reads_whole_file(tmp_path):
+    path = tmp_path / "cmds.txt"
+    path.write_text("a\nb\nc")
+    sink = Collector()
+    asyncio.run(inputs.run_file(str(path), sink))
+
+    assert sink.items == [(f"file:{path}", "a"), (f"file:{path}", "b"), (f"file:{path}", "c")]
+
+
+def test_run_file_missing_logs_error(tmp_path, capsys):
+    sink = Collector()
+    asyncio.run(inputs.run_file(str(tmp_path / "nope.txt"), sink))
+
+    assert sink.items == []
+    assert "nope.txt" in capsys.readouterr().err
+
+
+def test_follow_appends_rotation_and_truncation(tmp_path):
+    """A followed file yields appended lines and survives rotation and truncation."""
+    path = tmp_path / "log.txt"
+    path.write_text("first\n")
+    sink = Collector()
+
+    async def run():
+        task = asyncio.create_task(inputs.run_file(str(path), sink, follow=True, poll_interval=0.01))
+        await wait_for(lambda: sink.lines() == ["first"])
+
+        with open(path, "a") as f:
+            f.write("second\npart")
+        await wait_for(lambda: sink.lines()[-1:] == ["second"])
+        with open(path, "a") as f:
+            f.write("ial\n")
+        await wait_for(lambda: sink.lines()[-1:] == ["partial"])
+
+        # Rotation: rename away and create a new file under the same name
+        os.rename(path, tmp_path / "log.txt.1")
+        path.write_text("rotated\n")
+        await wait_for(lambda: sink.lines()[-1:] == ["rotated"])
+
+        # Truncation in place
+        with open(path, "w") as f:
+            f.write("")
+        await asyncio.sleep(0.05)
+        with open(path, "a") as f:
+            f.write("after-truncate\n")
+        await wait_for(lambda: sink.lines()[-1:] == ["after-truncate"])
+
+        task.cancel()
+
+    asyncio.run(run())
+    assert sink.lines() == ["first", "second", "partial", "rotated", "after-truncate"]
+
+
+def test_fifo_reopens_for_next_writer(tmp_path):
+    path = tmp_path / "cmds.fifo"
+    os.mkfifo(path)
+    sink = Collector()
+
+    async def run():
+        task = asyncio.create_task(inputs.run_fifo(str(path), sink))
+        loop = asyncio.get_running_loop()
+        for text in ("one\n", "two\n"):
+            await loop.run_in_executor(None, path.write_text, text)
+            await wait_for(lambda: sink.lines()[-1:] == [text.strip()])
+        task.cancel()
+
+    asyncio.run(run())
+    assert sink.items == [(f"fifo:{path}", "one"), (f"fifo:{path}", "two")]
+
+
+def test_fifo_without_writer_shuts_down(tmp_path):
+    """Cancelling a FIFO source that waits for its first writer leaves no thread behind."""
+    path = tmp_path / "idle.fifo"
+    os.mkfifo(path)
+
+    async def run():
+        task = asyncio.create_task(inputs.run_fifo(str(path), Collector()))
+        await asyncio.sleep(0.1)
+        assert not task.done()
+        task.cancel()
+
+    thread = threading.Thread(target=asyncio.run, args=(run(),), daemon=True)
+    thread.start()
+    thread.join(5)
+    assert not thread.is_alive()
+
+
+def test_tcp_listener_tags_each_connection():
+    port = free_port(__import__("socket").SOCK_STREAM)
+    sink = Collector()
+
+    async def run():
+        task = asyncio.create_task(inputs.run_tcp_listener("127.0.0.1", port, sink))
+        for _ in range(100):
+            try:
+                _, w1 = await asyncio.open_connection("127.0.0.1", port)
+                break
+            except OSError:
+                await asyncio.sleep(0.01)
+        _, w2 = await asyncio.open_connection("127.0.0.1", port)
+        w1.write(b"from-one\npart")
+        w2.write(b"from-two\n")
+        await w1.drain()
+        w1.write(b"ial\n")
+        await wait_for(lambda: len(sink.items) == 3)
+        w1.close()
+        w2.close()
+        task.cancel()
+
+    asyncio.run(run())
+    assert sorted(sink.lines()) == ["from-one", "from-two", "partial"]
+    sources = {source for source, _ in sink.items}
+    assert len(sources) == 2
+    assert all(source.startswith("tcp:127.0.0.1:") for source in sources)
+
+
+def test_udp_listener_splits_datagrams():
+    import socket
+    port = free_port(socket.SOCK_DGRAM)
+    sink = Collector()
+
+    async def run():
+        task = asyncio.create_task(inputs.run_udp_listener("127.0.0.1", port, sink))
+        await asyncio.sleep(0.05)
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+            s.sendto(b"a\nb\n", ("127.0.0.1", port))
+            sender = s.getsockname()
+        await wait_for(lambda: len(sink.items) == 2)
+        task.cancel()
+        return sender
+
+    sender = asyncio.run(run())
+    assert sink.items == [(f"udp:127.0.0.1:{sender[1]}", "a"), (f"udp:127.0.0.1:{sender[1]}", "b")]
+
+
+def test_parse_listen_address():
+    assert inputs.parse_listen_address("9000") == ("127.0.0.1", 9000)
+    assert inputs.parse_listen_address("0.0.0.0:9000") == ("0.0.0.0", 9000)
+    assert inputs.parse_listen_address("[::1]:9000") == ("::1", 9000)
+
+
+def test_line_sink_namespaces_sources():
+    """make_line_sink gives each source its own chunk sessions."""
+    from mapcat.chunker import SourceChunkers
+    from mapcat.main import make_line_sink
+
+    broadcasts = []
+
+    async def fake_broadcast(msg):
+        broadcasts.append(json.loads(msg))
+
+    async def run():
+        sink = make_line_sink(State(), SourceChunkers(), verbose=False)
+        with patch("mapcat.server.broadcast", side_effect=fake_broadcast):
+            await sink("tcp:a", ["chunk x 1/2 add-point (52.1,"])
+            await sink("tcp:b", ["chunk x 1/2 add-point (52.2,", "chunk x 2/2 13.2)"])
+            await sink("tcp:a", ["chunk x 2/2 13.1)"])
+
+    asyncio.run(run())
+    assert [b["coords"] for b in broadcasts] == [[52.2, 13.2], [52.1, 13.1]]
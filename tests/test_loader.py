@@ -0,0 +1,120 @@
+"""
+Tests for the --load bulk loader.
+"""
+import asyncio
+import gzip
+import pytest
+from mapcat import diagnostics, loader, server
+from mapcat.chunker import Chunker
+from mapcat.main import handle_line
+from mapcat.state import State
+
+COMMANDS = (
+    "add-point (52.5,13.4) id=p1 color=red\n"
+    "begin id=s1\n"
+    "s1 add-polyline (52.5,13.4);(52.6,1 seq=1\n"
+    "s1 3.5) id=l1 seq=2\n"
+    "commit id=s1 total=2\n"
+    "chunk c2 1/1 add-polygon (52.1,13.1);(52.2,13.2);(52.15,13.15) id=g1\n"
+    "add-point (91,13.4)\n"
+    "remove id=p1\n"
+    "add-point (52.7,13.7) id=p2"
+)
+
+
+def load(path, state, workers=1, **kwargs):
+    chunker = Chunker()
+
+    async def apply_raw(line):
+        await handle_line(line, state, chunker, False, False)
+
+    return asyncio.run(loader.load_file(str(path), state, apply_raw, workers=workers, **kwargs))
+
+
+def test_load_plain_file(tmp_path):
+    path = tmp_path / "cmds.txt"
+    path.write_text(COMMANDS)
+    state = State()
+    stats = load(path, state)
+
+    assert set(state.features) == {"l1", "g1", "p2"}
+    assert state.get_feature("l1")["coords"] == [[52.5, 13.4], [52.6, 13.5]]
+    assert stats.bytes == len(COMMANDS)
+    assert stats.lines == 9
+    assert stats.failed == 1
+
+
+def test_load_gzip_file(tmp_path):
+    path = tmp_path / "cmds.txt.gz"
+    with gzip.open(path, "wt") as f:
+        f.write(COMMANDS)
+    state = State()
+    load(path, state)
+
+    assert set(state.features) == {"l1", "g1", "p2"}
+
+
+def test_load_with_worker_processes_keeps_order(tmp_path, monkeypatch):
+    """Blocks parsed by worker processes are applied in file order."""
+    monkeypatch.setattr(loader, "LOAD_BLOCK_SIZE", 256)
+    lines = [f"add-point (52.{i},13.{i}) id=p{i}" for i in range(200)]
+    lines += [f"remove id=p{i}" for i in range(0, 200, 2)]
+    path = tmp_path / "cmds.txt"
+    path.write_text("\n".join(lines) + "\n")
+    state = State()
+    stats = load(path, state, workers=2, pause_gc=True)
+
+    assert sorted(state.features) == sorted(f"p{i}" for i in range(1, 200, 2))
+    assert stats.commands == 300
+    assert stats.failed == 0
+
+
+def test_worker_parse_errors_reach_stderr(tmp_path, capfd, monkeypatch):
+    """Workers of a parent with buffered diagnostics still print why a line failed."""
+    # A running fork server keeps the stderr of the test that started it; spawned workers get capfd's
+    monkeypatch.setattr(loader, "WORKER_START_METHOD", "spawn")
+    path = tmp_path / "cmds.txt"
+    path.write_text(COMMANDS)
+    diagnostics.configure(buffered=True, rate_limit=0)
+    try:
+        stats = load(path, State(), workers=2)
+    finally:
+        diagnostics.configure(buffered=False, rate_limit=0)
+
+    assert stats.failed == 1
+    assert "Latitude out of range: 91.0" in capfd.readouterr().err
+
+
+def test_iter_blocks_cut_at_newlines():
+    import io
+    blocks = list(loader.iter_blocks(io.BytesIO(b"aaaa\nbb\ncccccc\nd"), block_size=6))
+    assert b"".join(blocks) == b"aaaa\nbb\ncccccc\nd"
+    assert all(block.endswith(b"\n") for block in blocks[:-1])
+
+
+def test_load_missing_file_raises(tmp_path):
+    with pytest.raises(loader.LoadError):
+        load(tmp_path / "missing.txt", State())
+
+
+def test_condensed_line_keeps_error_preview():
+    """Condensing a long line keeps the 48+16 character preview used in error logs."""
+    params = "(52.5,13.4);" * 50 + " color=red"
+    line = "add-polyline " + params
+    condensed = loader._condense_line("add-polyline", line)
+
+    assert len(condensed) < len(line)
+    condensed_params = condensed.split(None, 1)[1]
+    assert condensed_params[:48] == params[:48]
+    assert condensed_params[-16:] == params[-16:]
+
+
+def test_snapshot_message_holds_all_features():
+    state = State()
+    state.add_feature("point", [[52.5, 13.4]], {"color": "red"}, feature_id="p1")
+    state.add_feature("polyline", [[52.5, 13.4], [52.6, 13.5]], {}, feature_id="l1")
+    snapshot = server.snapshot_message(state)
+
+    assert snapshot["action"] == "snapshot"
+    assert [f["id"] for f in snapshot["features"]] == ["p1", "l1"]
+    assert snapshot["features"][0]["coords"] == [52.5, 13.4]
@@ -0,0 +1,89 @@
+"""
+Tests for the synthetic load generator and latency harness.
+"""
+import json
+import pytest
+from mapcat import loadgen, parser
+from mapcat.chunker import Chunker
+from mapcat.commands import COMMAND_HANDLERS
+from mapcat.state import State
+
+
+def test_stream_is_reproducible():
+    assert loadgen.LoadGenerator(seed=5).lines(500) == loadgen.LoadGenerator(seed=5).lines(500)
+    assert loadgen.LoadGenerator(seed=5).lines(500) != loadgen.LoadGenerator(seed=6).lines(500)
+
+
+def test_every_line_parses_and_chunks_assemble():
+    chunker = Chunker('test')
+    commands = []
+    for line, probe_id in loadgen.LoadGenerator(seed=3).lines(3000):
+        if line.startswith('chunk '):
+            _, session_id, position, content = line.split(' ', 3)
+            seq, total = map(int, position.split('/'))
+            command = chunker.add_chunk_v2(session_id, seq, total, content)
+            assert (command is not None) == (probe_id is not None)
+            if command is None:
+                continue
+        else:
+            command = parser.parse_command(line)
+        assert command is not None, line
+        if probe_id is not None:
+            assert command['params']['id'] == probe_id
+        commands.append(command['cmd'])
+    assert {'update-current-position', 'add-polyline', 'add-point', 'add-polygon', 'remove'} <= set(commands)
+
+
+def test_probes_are_the_added_feature_ids():
+    for line, probe_id in loadgen.LoadGenerator(seed=1).lines(1000):
+        if line.startswith('add-'):
+            assert f"id={probe_id} " in line
+
+
+@pytest.mark.parametrize("seed", [2, 3])
+def test_every_command_applies_across_clears(seed):
+    """Removes find their features and adds never repeat a live id, also after clear() mid-stream."""
+    generator = loadgen.LoadGenerator(seed=seed)
+    state, chunker = State(), Chunker('test')
+
+    def stream(count):
+        yield from generator.lines(count)
+        while True:  # stop between a track's remove and its re-add, which is still pending
+            line, probe_id = generator.lines(1)[0]
+            yield line, probe_id
+            if line.startswith('remove id=track-'):
+                return
+
+    for count in (1500, 777, 1000):
+        for line, _ in stream(count):
+            if line.startswith('chunk '):
+                _, session_id, position, content = line.split(' ', 3)
+                seq, total = map(int, position.split('/'))
+                command = chunker.add_chunk_v2(session_id, seq, total, content)
+                if command is None:
+                    continue
+            else:
+                command = parser.parse_command(line)
+            assert COMMAND_HANDLERS[command['cmd']](state, command) is not None, line
+        COMMAND_HANDLERS[generator.clear()](state, {'cmd': 'clear', 'coords': [], 'params': {}})
+
+
+def test_consumer_matches_adds_in_batches_and_snapshots():
+    consumer = loadgen.Consumer()
+    consumer.expect('a', 1_000)
+    consumer.expect('b', 2_000)
+    consumer.expect('a', 3_000)
+    consumer._handle({'action': 'batch', 'messages': [{'action': 'add', 'id': 'a'}, {'action': 'remove', 'id': 'a'}]}, 11_000)
+    consumer._handle({'action': 'snapshot', 'features': [{'action': 'add', 'id': 'b'}, {'action': 'add', 'id': 'a'}]}, 12_000)
+    consumer._handle({'action': 'add', 'id': 'unknown'}, 13_000)
+    assert consumer.received == 3 and consumer.outstanding == 0
+    assert consumer.latency.max >= 10_000 * 0.99
+
+
+def test_bench_against_a_real_process(tmp_path):
+    output = tmp_path / 'load.json'
+    loadgen.main(['bench', '--rate', '200', '--duration', '0.5', '--output', str(output)])
+    result = json.loads(output.read_text())
+    step = result['steps'][0]
+    assert step['probes'] > 0 and step['received'] == step['probes']
+    assert step['p50_ms'] <= step['p99_ms'] <= step['max_ms']
@@ -0,0 +1,90 @@
+"""
+Tests for native logcat line parsing and logcat-mode ingestion.
+"""
+import asyncio
+import json
+from unittest.mock import patch
+from mapcat import logcat
+from mapcat.chunker import SourceChunkers
+from mapcat.main import make_line_sink
+from mapcat.state import State
+
+
+def test_threadtime_line():
+    result = logcat.parse_line("10-19 12:34:56.789  1234  5678 D Mapcat  : add-point (52.5,13.4)\n")
+    assert result == ("add-point (52.5,13.4)", {
+        'time': '10-19 12:34:56.789', 'pid': '1234', 'tid': '5678', 'level': 'D',
+    })
+
+
+def test_threadtime_long_pids():
+    message, meta = logcat.parse_line("10-19 12:34:56.789 1234567 7654321 I Mapcat  : clear")
+    assert message == "clear"
+    assert meta['pid'] == '1234567'
+    assert meta['tid'] == '7654321'
+
+
+def test_brief_line():
+    assert logcat.parse_line("D/Mapcat( 1234): clear") == ("clear", {'pid': '1234', 'level': 'D'})
+
+
+def test_time_line():
+    message, meta = logcat.parse_line("10-19 12:34:56.789 D/Mapcat  ( 1234): clear")
+    assert message == "clear"
+    assert meta == {'pid': '1234', 'level': 'D', 'time': '10-19 12:34:56.789'}
+
+
+def test_other_tags_rejected():
+    assert logcat.parse_line("10-19 12:34:56.789  1234  5678 I ActivityManager: Start proc") is None
+    assert logcat.parse_line("10-19 12:34:56.789  1234  5678 D MapcatX : add-point (1,2)") is None
+    assert logcat.parse_line("D/MapcatX( 1234): add-point (1,2)") is None
+    assert logcat.parse_line("--------- beginning of main") is None
+    assert logcat.parse_line("") is None
+
+
+def test_message_content_kept_verbatim():
+    """Only the single separator space after the colon is removed."""
+    message, _ = logcat.parse_line("10-19 12:34:56.789  1234  5678 D Mapcat  : chunk a 1/2 add-point ")
+    assert message == "chunk a 1/2 add-point "
+
+
+def run_sink(lines, state):
+    broadcasts = []
+
+    async def fake_broadcast(msg):
+        broadcasts.append(json.loads(msg))
+
+    async def run():
+        sink = make_line_sink(state, SourceChunkers(), verbose=False, logcat_format=True)
+        with patch("mapcat.server.broadcast", side_effect=fake_broadcast):
+            await sink("stdin", lines)
+
+    asyncio.run(run())
+    return broadcasts
+
+
+def test_logcat_sink_filters_and_attaches_meta():
+    state = State()
+    broadcasts = run_sink([
+        "10-19 12:34:56.789  1234  5678 I ActivityManager: add-point (1,2) id=foreign",
+        "10-19 12:34:56.790  1234  5678 D Mapcat  : add-point (52.5,13.4) id=p1",
+    ], state)
+
+    assert len(broadcasts) == 1
+    assert broadcasts[0]["id"] == "p1"
+    assert broadcasts[0]["meta"]["pid"] == "1234"
+    assert broadcasts[0]["meta"]["time"] == "10-19 12:34:56.790"
+    assert state.get_feature("p1")["meta"]["tid"] == "5678"
+
+
+def test_logcat_sink_separates_chunk_sessions_by_pid():
+    """Two processes using the same chunk session id do not collide."""
+    broadcasts = run_sink([
+        "10-19 12:00:00.000   100   100 D Mapcat  : chunk x 1/2 add-point (52.1,",
+        "10-19 12:00:00.001   200   200 D Mapcat  : chunk x 1/2 add-point (52.2,",
+        "10-19 12:00:00.002   200   200 D Mapcat  : chunk x 2/2 13.2)",
+        "10-19 12:00:00.003   100   100 D Mapcat  : chunk x 2/2 13.1)",
+    ], State())
+
+    assert [b["coords"] for b in broadcasts] == [[52.2, 13.2], [52.1, 13.1]]
+    assert [b["meta"]["pid"] for b in broadcasts] == ["200", "100"]
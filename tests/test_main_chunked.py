@@ -189,3 +189,78 @@ def test_handler_returns_none_no_broadcast_loop_continues():
 
     assert len(broadcasts) == 1
     assert broadcasts[0]["id"] == "after"
+
+
+def test_v2_chunks_execute_without_commit():
+    """Self-describing chunks are assembled and dispatched on the last chunk."""
+    broadcasts = run_loop([
+        "chunk v1 2/2 ;(52.7,13.6) color=blue",
+        "chunk v1 1/2 add-polyline (52.5,13.4);(52.6,13.5)",
+    ])
+
+    assert len(broadcasts) == 1
+    assert broadcasts[0]["type"] == "polyline"
+    assert len(broadcasts[0]["coords"]) == 3
+    assert broadcasts[0]["params"]["color"] == "blue"
+
+
+def test_v2_chunk_content_keeps_boundary_space():
+    """A split falling on a space is preserved in v2 chunk content."""
+    broadcasts = run_loop([
+        "chunk sp 1/2 add-point ",
+        "chunk sp 2/2 (52.5,13.4) color=red",
+    ])
+
+    assert len(broadcasts) == 1
+    assert broadcasts[0]["coords"] == [52.5, 13.4]
+
+
+def test_v2_and_v1_sessions_coexist():
+    """v2 chunks and begin/commit sessions can be interleaved."""
+    broadcasts = run_loop([
+        "begin id=old",
+        "chunk new 1/2 add-point (52.1,",
+        "old add-point (52.2,13.2) seq=1",
+        "chunk new 2/2 13.1)",
+        "commit id=old total=1",
+    ])
+
+    assert len(broadcasts) == 2
+    assert broadcasts[0]["coords"] == [52.1, 13.1]
+    assert broadcasts[1]["coords"] == [52.2, 13.2]
+
+
+def test_malformed_v2_header_logs_error(capsys):
+    """A chunk line without <seq>/<total> logs an error."""
+    broadcasts = run_loop(["chunk abc 1 add-point (52.5,13.4)"])
+
+    assert broadcasts == []
+    captured = capsys.readouterr()
+    assert "chunk" in captured.err.lower()
+
+
+def test_handle_line_sources_do_not_collide():
+    """Interleaved sessions with the same id from two sources stay separate."""
+    from mapcat.chunker import SourceChunkers
+    from mapcat.main import handle_line
+
+    broadcasts = []
+
+    async def fake_broadcast(msg):
+        broadcasts.append(json.loads(msg))
+
+    async def run():
+        state = State()
+        chunkers = SourceChunkers()
+        feed = [
+            ("a", "chunk x 1/2 add-point (52.1,"),
+            ("b", "chunk x 1/2 add-point (52.2,"),
+            ("b", "chunk x 2/2 13.2)"),
+            ("a", "chunk x 2/2 13.1)"),
+        ]
+        with patch("mapcat.server.broadcast", side_effect=fake_broadcast):
+            for source, line in feed:
+                await handle_line(line, state, chunkers.for_source(source), False, False)
+
+    asyncio.run(run())
+    assert [b["coords"] for b in broadcasts] == [[52.2, 13.2], [52.1, 13.1]]
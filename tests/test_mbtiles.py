@@ -0,0 +1,115 @@
+"""
+Tests for serving tiles from MBTiles archives.
+"""
+import asyncio
+import sqlite3
+import urllib.request
+
+import pytest
+
+from mapcat import mbtiles, server, stats, tiles
+from mapcat.state import State
+
+JPEG = b'\xff\xd8\xff\xe0'
+
+
+def make_archive(path, metadata=None, tiles=((1, 0, 0), (1, 1, 0), (2, 3, 1))):
+    """Write an MBTiles file whose tile data names its XYZ coordinates."""
+    connection = sqlite3.connect(path)
+    connection.execute("CREATE TABLE metadata (name TEXT, value TEXT)")
+    connection.execute("CREATE TABLE tiles (zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER, tile_data BLOB)")
+    metadata = {'name': 'Test', 'format': 'jpg', 'minzoom': '1', 'maxzoom': '2', 'bounds': '13.0,52.0,14.0,53.0'} if metadata is None else metadata
+    connection.executemany("INSERT INTO metadata VALUES (?, ?)", metadata.items())
+    for z, x, y in tiles:
+        tms_y = (1 << z) - 1 - y
+        connection.execute("INSERT INTO tiles VALUES (?, ?, ?, ?)", (z, x, tms_y, JPEG + f"{z}/{x}/{y}".encode().ljust(96, b'.')))
+    connection.commit()
+    connection.close()
+    return str(path)
+
+
+def test_tiles_are_read_with_the_y_axis_flipped(tmp_path):
+    source = mbtiles.MBTilesSource(make_archive(tmp_path / 'map.mbtiles'))
+
+    async def run():
+        return await source.get(2, 3, 1), await source.get(2, 3, 2), await source.get(3, 0, 0)
+    tile, missing, too_deep = asyncio.run(run())
+
+    assert tile.data.startswith(JPEG + b'2/3/1') and tile.content_type == 'image/jpeg'
+    assert missing is None and too_deep is None
+    assert source.missing == 1
+
+
+def test_read_errors_are_not_reported_as_missing_tiles(tmp_path):
+    source = mbtiles.MBTilesSource(make_archive(tmp_path / 'map.mbtiles'), connections=1)
+    connection = source._pool.get()
+    connection.close()  # every query on it fails with an sqlite3.Error
+    source._pool.put(connection)
+
+    with pytest.raises(tiles.TileError):
+        asyncio.run(source.get(2, 3, 1))
+    assert (source.errors, source.missing) == (1, 0)
+
+
+def test_hot_cache_serves_repeated_tiles_from_memory(tmp_path):
+    source = mbtiles.MBTilesSource(make_archive(tmp_path / 'map.mbtiles'), connections=2, hot_bytes=200)
+
+    async def run():
+        await asyncio.gather(*(source.get(1, x % 2, 0) for x in range(20)))
+        reads = source.reads
+        for _ in range(5):
+            await source.get(1, 0, 0)
+        await source.get(2, 3, 1)  # evicts the least recently used tile
+        return reads
+    reads = asyncio.run(run())
+
+    assert source.reads == reads + 1
+    assert list(source.hot) == [(1, 0, 0), (2, 3, 1)]
+    assert source.hot_total == 200
+
+
+def test_layer_options_come_from_metadata(tmp_path):
+    source = mbtiles.MBTilesSource(make_archive(tmp_path / 'map.mbtiles', {'format': 'png', 'maxzoom': '14', 'attribution': '© Lab', 'bounds': 'bad'}))
+    assert source.layer() == {'url': 'tiles/{z}/{x}/{y}.png', 'minZoom': 0, 'maxNativeZoom': 14, 'maxZoom': 19, 'attribution': '© Lab'}
+    layer = mbtiles.MBTilesSource(make_archive(tmp_path / 'other.mbtiles')).layer()
+    assert layer['url'] == 'tiles/{z}/{x}/{y}.jpg' and layer['attribution'] == 'Test'
+    assert layer['bounds'] == [[52.0, 13.0], [53.0, 14.0]]
+
+
+def test_unusable_files_are_rejected(tmp_path):
+    (tmp_path / 'text.mbtiles').write_text('not sqlite ' * 100)
+    sqlite3.connect(tmp_path / 'empty.mbtiles').execute("CREATE TABLE other (x)").connection.close()
+    vector = make_archive(tmp_path / 'vector.mbtiles', {'format': 'pbf'})
+    for path in (tmp_path / 'missing.mbtiles', tmp_path / 'text.mbtiles', tmp_path / 'empty.mbtiles', vector):
+        with pytest.raises(mbtiles.MBTilesError):
+            mbtiles.MBTilesSource(str(path))
+
+
+def test_server_serves_archive_tiles(tmp_path):
+    source = mbtiles.MBTilesSource(make_archive(tmp_path / 'map.mbtiles'))
+    previous = server.tile_source, server.tile_layer
+    server.set_tile_source(source)
+
+    def client(port):
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/tiles/1/1/0.jpg") as response:
+            tile = response.headers['Content-Type'], response.read()
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/") as response:
+            return tile, response.read()
+
+    async def run():
+        async with await server.start_server(0, '127.0.0.1') as http_server:
+            port = http_server.sockets[0].getsockname()[1]
+            return await asyncio.get_running_loop().run_in_executor(None, client, port)
+
+    try:
+        (content_type, data), page = asyncio.run(run())
+    finally:
+        server.tile_source, server.tile_layer = previous
+        del stats._sources['tiles']
+        server.metrics.REGISTRY.collectors.pop('tiles')
+        server.load_assets()
+
+    assert content_type == 'image/jpeg' and data.startswith(JPEG + b'1/1/0')
+    assert b'"url": "tiles/{z}/{x}/{y}.jpg"' in page and b'"maxNativeZoom": 2' in page
+    summary = stats.format_stats(dict(stats.collect(State()), tiles=source.stats()))
+    assert 'Tiles from' in summary and '0 from memory, 1 read, 0 missing, 0 errors' in summary
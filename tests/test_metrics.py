@@ -0,0 +1,131 @@
+"""
+Tests for the /metrics registry and the values mapcat feeds into it.
+"""
+import asyncio
+import json
+import threading
+from unittest.mock import AsyncMock, patch
+import websockets
+from mapcat import metrics, server
+from mapcat.chunker import SourceChunkers
+from mapcat.main import handle_line, register_metrics
+from mapcat.state import State
+
+
+def test_counter_and_histogram_render():
+    registry = metrics.Registry()
+    counter = registry.counter('x_total', 'Things', ['kind'])
+    counter.inc(2, 'a"b')
+    histogram = registry.histogram('y_seconds', 'Durations', buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 5.0):
+        histogram.observe(value)
+
+    text = registry.render()
+    assert 'x_total{kind="a\\"b"} 2' in text
+    assert 'y_seconds_bucket{le="0.1"} 1' in text
+    assert 'y_seconds_bucket{le="1"} 3' in text
+    assert 'y_seconds_bucket{le="+Inf"} 4' in text
+    assert 'y_seconds_sum 6.05' in text and 'y_seconds_count 4' in text
+
+
+def test_state_counts_are_incremental():
+    state = State()
+    state.add_feature('point', [[1, 1]], {'tag': 't'}, 'p')
+    state.add_feature('polyline', [[1, 1], [2, 2], [3, 3]], {'tag': 't'}, 'l')
+    state.add_feature('polyline', [[1, 1], [2, 2]], {}, 'l2')
+    assert state.feature_counts == {'point': 1, 'polyline': 2}
+    assert state.vertex_counts == {'point': 1, 'polyline': 5}
+
+    state.remove_features_by_tag('t')
+    assert state.feature_counts == {'point': 0, 'polyline': 1}
+    assert state.vertex_counts == {'point': 0, 'polyline': 2}
+    state.remove_feature('l2')
+    assert state.vertex_counts['polyline'] == 0
+    state.add_feature('point', [[1, 1]], {})
+    state.clear_all()
+    assert state.feature_counts == {} and state.vertex_counts == {}
+
+
+def test_commands_and_failures_are_counted():
+    state = State()
+    chunkers = SourceChunkers()
+    chunker = chunkers.for_source('stdin')
+    commands = metrics.COMMANDS.value('add-point')
+    parse_failures = metrics.PARSE_FAILURES.value()
+    handler_failures = metrics.HANDLER_FAILURES.value('remove')
+
+    async def run():
+        with patch("mapcat.server.broadcast", new=AsyncMock()):
+            await handle_line("add-point (52.5,13.4)", state, chunker, False, False)
+            await handle_line("add-point (95,13.4)", state, chunker, False, False)
+            await handle_line("remove id=missing", state, chunker, False, False)
+            await handle_line("begin id=s1", state, chunker, False, False)
+            await handle_line("s1 add-point (52 seq=1", state, chunker, False, False)
+
+    asyncio.run(run())
+    assert metrics.COMMANDS.value('add-point') == commands + 1
+    assert metrics.PARSE_FAILURES.value() == parse_failures + 1
+    assert metrics.HANDLER_FAILURES.value('remove') == handler_failures + 1
+
+    register_metrics(state, chunkers)
+    text = metrics.REGISTRY.render()
+    assert 'mapcat_features{type="point"} 1' in text
+    assert 'mapcat_chunk_sessions 1' in text
+    assert 'mapcat_chunk_buffered_bytes 13' in text
+
+
+def test_scrape_from_another_thread_runs_on_loop():
+    registry = metrics.Registry()
+    seen = []
+    registry.add_collector('probe', lambda: seen.append(threading.current_thread()) or [])
+
+    async def run():
+        registry.loop = asyncio.get_running_loop()
+        text = await asyncio.get_running_loop().run_in_executor(None, registry.render_threadsafe)
+        return text
+
+    asyncio.run(run())
+    assert seen == [threading.main_thread()]
+
+
+def test_browser_perf_reports_per_client():
+    report = {
+        'type': 'perf', 'interval_ms': 5000, 'messages': 200, 'decode_ms': 40, 'decode_max_ms': 3,
+        'adds': 100, 'add_ms': 50, 'add_max_ms': 4, 'layers': 101, 'fps': 58.5,
+        'long_tasks': 2, 'long_task_ms': 500, 'features': 'many', 'unknown': 1,
+    }
+
+    async def run():
+        async with websockets.serve(server.ws_handler, '127.0.0.1', 0) as ws_server:
+            port = ws_server.sockets[0].getsockname()[1]
+            async with websockets.connect(f"ws://127.0.0.1:{port}") as ws:
+                await ws.send(json.dumps(report))
+                await ws.send('not json')
+                for _ in range(100):
+                    if server.perf_reports:
+                        break
+                    await asyncio.sleep(0.01)
+                summaries = server.browser_stats()
+                text = metrics.REGISTRY.render()
+            for _ in range(100):
+                if not server.perf_reports:
+                    break
+                await asyncio.sleep(0.01)
+            return summaries, text, dict(server.perf_reports)
+
+    summaries, text, remaining = asyncio.run(run())
+    [(client, stats)] = summaries
+    assert client.startswith('127.0.0.1:')
+    assert 'features' not in stats  # non-numeric values are dropped
+    assert stats['messages_per_sec'] == 40
+    assert stats['decode_avg_ms'] == 0.2
+    assert stats['add_avg_ms'] == 0.5
+    assert stats['long_task_ratio'] == 0.1
+    assert f'mapcat_browser_fps{{client="{client}"}} 58.5' in text
+    assert f'mapcat_browser_add_feature_max_seconds{{client="{client}"}} 0.004' in text
+    assert remaining == {}  # forgotten on disconnect
+
+
+def test_perf_report_rejects_bad_values():
+    report = server.perf_report({'fps': float('nan'), 'layers': -1, 'messages': True, 'adds': 3})
+    assert report == {'adds': 3.0}
@@ -153,3 +153,45 @@ def test_parse_unmatched_nested_parens():
     """Test that unmatched nested parentheses are rejected."""
     result = parse_command('add-point ((52.5,13.4)')
     assert result is None
+
+
+@pytest.fixture
+def cache():
+    from mapcat import parser
+    cache = parser.enable_cache(maxsize=2, min_length=20)
+    yield cache
+    parser.enable_cache(0)
+
+
+def test_cache_hits_return_independent_dicts(cache):
+    line = 'add-polygon (52.1,13.1);(52.2,13.2);(52.15,13.15) color=green'
+    first = parse_command(line)
+    first['params']['color'] = 'red'
+    first['_original_line'] = line
+    second = parse_command('  ' + line + '\n')
+
+    assert second == {'cmd': 'add-polygon', 'coords': ((52.1, 13.1), (52.2, 13.2), (52.15, 13.15)), 'params': {'color': 'green'}}
+    assert second['coords'] is first['coords']
+    assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 1
+
+
+def test_cache_is_bounded_lru(cache):
+    lines = [f'add-point (52.{i},13.4) label=cached-line-{i}' for i in range(3)]
+    parse_command(lines[0])
+    parse_command(lines[1])
+    parse_command(lines[0])  # lines[0] is now most recently used
+    parse_command(lines[2])  # evicts lines[1]
+    parse_command(lines[0])
+    parse_command(lines[1])
+
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['size']) == (2, 4, 2)
+
+
+def test_cache_skips_short_and_invalid_lines(cache, capsys):
+    parse_command('clear')
+    assert parse_command('add-point (95,13.4) label=out-of-range') is None
+    assert parse_command('add-point (95,13.4) label=out-of-range') is None
+
+    assert cache.stats()['size'] == 0
+    assert capsys.readouterr().err.count('Latitude out of range') == 2
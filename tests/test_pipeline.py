@@ -0,0 +1,147 @@
+"""
+Tests for the staged ingest pipeline (worker-pool parsing, ordered apply).
+"""
+import asyncio
+import json
+from unittest.mock import patch
+from mapcat import diagnostics, loader, pipeline, profiling
+from mapcat.chunker import SourceChunkers
+from mapcat.main import make_ingest_pipeline, make_line_sink
+from mapcat.state import State
+
+
+def run_batches(batches, workers=2, logcat_format=False):
+    """Feed (source, lines) batches through a pipelined sink; return state and broadcasts."""
+    state = State()
+    broadcasts = []
+
+    async def fake_broadcast(msg):
+        broadcasts.append(json.loads(msg))
+
+    async def run():
+        ingest = make_ingest_pipeline(state, False, workers)
+        sink = make_line_sink(state, SourceChunkers(), False, logcat_format, ingest)
+        with patch("mapcat.server.broadcast", side_effect=fake_broadcast):
+            for source, lines in batches:
+                await sink(source, lines)
+            await ingest.join()
+        ingest.close()
+
+    asyncio.run(run())
+    return state, broadcasts
+
+
+def test_pooled_batches_keep_command_order(monkeypatch):
+    """Batches parsed in worker processes are applied in submission order."""
+    monkeypatch.setattr(pipeline, "PARALLEL_MIN_LINES", 4)
+    monkeypatch.setattr(pipeline, "MAX_POOL_BATCH", 8)
+    adds = [f"add-point (52.{i},13.{i}) id=p{i}" for i in range(50)]
+    removes = [f"remove id=p{i}" for i in range(0, 50, 2)]
+    small = ["add-point (1,1) id=small"]
+    state, broadcasts = run_batches([("a", adds), ("b", small), ("a", removes)])
+
+    assert sorted(state.features) == sorted([f"p{i}" for i in range(1, 50, 2)] + ["small"])
+    assert [b.get("id") for b in broadcasts[:51]] == [f"p{i}" for i in range(50)] + ["small"]
+
+
+def test_pooled_batch_with_chunk_protocol_lines(monkeypatch):
+    """Chunked-protocol lines inside a pooled batch still go through the chunker in order."""
+    monkeypatch.setattr(pipeline, "PARALLEL_MIN_LINES", 1)
+    state, broadcasts = run_batches([("a", [
+        "begin id=s1",
+        "s1 add-polyline (52.5,13.4);(52.6,1 seq=1",
+        "s1 3.5) id=l1 seq=2",
+        "commit id=s1 total=2",
+        "chunk v 1/2 add-point ",
+        "chunk v 2/2 (52.1,13.1) id=v1",
+        "not-a-command (1,2)",
+        "add-point (52.9,13.9) id=last",
+    ])])
+
+    assert [b["id"] for b in broadcasts] == ["l1", "v1", "last"]
+    assert state.get_feature("l1")["coords"] == [[52.5, 13.4], [52.6, 13.5]]
+
+
+def test_long_line_parsed_in_pool(monkeypatch):
+    """A single line above PARALLEL_MIN_LINE_BYTES goes to the pool."""
+    monkeypatch.setattr(pipeline, "PARALLEL_MIN_LINE_BYTES", 100)
+    coords = ";".join(f"(52.{i},13.{i})" for i in range(1, 100))
+    submitted = []
+    original = pipeline.IngestPipeline._get_pool
+
+    def spy(self):
+        submitted.append(True)
+        return original(self)
+
+    monkeypatch.setattr(pipeline.IngestPipeline, "_get_pool", spy)
+    state, broadcasts = run_batches([("a", [f"add-polyline {coords} id=long"])])
+
+    assert submitted
+    assert len(state.get_feature("long")["coords"]) == 99
+
+
+def test_invalid_line_in_pooled_batch_logged(monkeypatch, capsys):
+    monkeypatch.setattr(pipeline, "PARALLEL_MIN_LINES", 1)
+    state, broadcasts = run_batches([("a", ["add-point (91,13)", "add-point (52,13) id=ok"])])
+
+    assert [b["id"] for b in broadcasts] == ["ok"]
+    assert "invalid command" in capsys.readouterr().err.lower()
+
+
+def test_worker_parse_errors_reach_stderr(monkeypatch, capfd):
+    """Workers of a parent with buffered diagnostics still print the parser's reason."""
+    monkeypatch.setattr(pipeline, "PARALLEL_MIN_LINES", 1)
+    # A running fork server keeps the stderr of the test that started it; spawned workers get capfd's
+    monkeypatch.setattr(loader, "WORKER_START_METHOD", "spawn")
+    diagnostics.configure(buffered=True, rate_limit=0)
+    try:
+        run_batches([("a", ["add-point (91,13) id=bad", "add-point (52,13) id=ok"])])
+    finally:
+        diagnostics.configure(buffered=False, rate_limit=0)
+    assert "Latitude out of range: 91.0" in capfd.readouterr().err
+
+
+def failing_parse(lines, timed=False):
+    raise ValueError("worker bug")
+
+
+def test_batch_is_parsed_inline_when_worker_raises(monkeypatch, capsys):
+    monkeypatch.setattr(pipeline, "PARALLEL_MIN_LINES", 1)
+    monkeypatch.setattr(pipeline, "parse_lines", failing_parse)
+    state, broadcasts = run_batches([("a", ["add-point (52,13) id=a", "add-point (52,14) id=b"])])
+
+    assert [b["id"] for b in broadcasts] == ["a", "b"]
+    assert "parsing it inline" in capsys.readouterr().err
+
+
+def test_pooled_batch_records_parse_and_total_stages(monkeypatch):
+    """Under --profile, parse times measured in the workers reach the parent's histograms."""
+    monkeypatch.setattr(pipeline, "PARALLEL_MIN_LINES", 1)
+    profiler = profiling.start()
+    try:
+        run_batches([("a", ["add-point (52,13) id=a", "add-polyline (1,1);(2,2) id=b"])])
+    finally:
+        profiling.stop()
+
+    recorded = {key: histogram.count for key, histogram in profiler.histograms.items()}
+    for stage in ('parse', 'handler', 'broadcast', 'total'):
+        assert recorded[(stage, 'add-point')] == 1
+        assert recorded[(stage, 'add-polyline')] == 1
+    assert profiler.histograms[('parse', 'add-point')].min > 0
+
+
+def test_logcat_entries_through_pipeline(monkeypatch):
+    monkeypatch.setattr(pipeline, "PARALLEL_MIN_LINES", 1)
+    state, broadcasts = run_batches([("stdin", [
+        "10-19 12:00:00.000   100   100 I Other   : add-point (1,1) id=foreign",
+        "10-19 12:00:00.001   100   100 D Mapcat  : add-point (52.5,13.4) id=p1",
+    ])], logcat_format=True)
+
+    assert [b["id"] for b in broadcasts] == ["p1"]
+    assert broadcasts[0]["meta"]["pid"] == "100"
+
+
+def test_single_worker_parses_inline():
+    """With one worker, batches are parsed and applied on the event loop."""
+    state, broadcasts = run_batches([("a", [f"add-point (52.{i},13.{i})" for i in range(100)])], workers=1)
+    assert len(state.features) == 100
@@ -0,0 +1,122 @@
+"""
+Tests for --profile: latency histograms, stage instrumentation and output files.
+"""
+import asyncio
+import json
+import random
+from unittest.mock import AsyncMock, patch
+import pytest
+from mapcat import profiling
+from mapcat.chunker import Chunker
+from mapcat.main import handle_line
+from mapcat.state import State
+
+
+@pytest.fixture
+def profiler():
+    profiler = profiling.start()
+    yield profiler
+    profiling.stop()
+
+
+def test_histogram_percentiles_within_one_percent():
+    histogram = profiling.LatencyHistogram()
+    values = [random.randint(1, 10_000_000) for _ in range(5000)]
+    for value in values:
+        histogram.record(value)
+    values.sort()
+
+    assert histogram.count == 5000
+    assert histogram.min == values[0] and histogram.max == values[-1]
+    for percent in (50, 90, 99, 100):
+        exact = values[max(0, -(-len(values) * percent // 100) - 1)]
+        assert exact <= histogram.percentile(percent) <= exact * 1.01 + 1
+
+
+def test_histogram_small_values_are_exact():
+    histogram = profiling.LatencyHistogram()
+    for value in range(100):
+        histogram.record(value)
+    assert histogram.percentile(50) == 49
+    assert histogram.percentile(100) == 99
+    assert profiling.LatencyHistogram().percentile(50) == 0
+
+
+def test_stages_recorded_per_command(profiler):
+    state = State()
+    chunker = Chunker()
+
+    async def run():
+        with patch("mapcat.server.broadcast", new_callable=AsyncMock):
+            await handle_line("add-point (52.5,13.4)\n", state, chunker, False, False)
+            await handle_line("add-polyline (1,1);(2,2)\n", state, chunker, False, False)
+            await handle_line("garbage (\n", state, chunker, False, False)
+            await handle_line("begin id=s\n", state, chunker, False, False)
+            await handle_line("s add-point (1,1) seq=1\n", state, chunker, False, False)
+            await handle_line("commit id=s total=1\n", state, chunker, False, False)
+    asyncio.run(run())
+
+    recorded = {key: histogram.count for key, histogram in profiler.histograms.items()}
+    for stage in ('parse', 'handler', 'serialize', 'broadcast', 'total'):
+        assert recorded[(stage, 'add-polyline')] == 1
+    for stage in ('handler', 'serialize', 'broadcast', 'total'):
+        assert recorded[(stage, 'add-point')] == 2  # direct and assembled
+    assert recorded[('parse', 'add-point')] == 1  # the assembled command is parsed by commit
+    assert recorded[('parse', 'invalid')] == 1
+    assert recorded[('chunk', 'begin')] == 1
+    assert recorded[('chunk', 'chunk')] == 1
+    assert recorded[('chunk', 'commit')] == 1
+
+    report = profiler.report()
+    assert report.index('parse') < report.index('handler') < report.index('total')
+    assert 'p99.9' in report
+
+
+def test_read_stage_times_batches(profiler):
+    async def batches():
+        yield ['a']
+        yield ['b', 'c']
+
+    async def run():
+        return [batch async for batch in profiler.timed(batches())]
+    assert asyncio.run(run()) == [['a'], ['b', 'c']]
+    assert profiler.histograms[('read', '*')].count == 2
+
+
+def test_inactive_profiler_records_nothing():
+    assert profiling.active is None
+
+    async def run():
+        with patch("mapcat.server.broadcast", new_callable=AsyncMock) as broadcast:
+            await handle_line("add-point (52.5,13.4)\n", State(), Chunker(), False, False)
+            return broadcast.await_count
+    assert asyncio.run(run()) == 1
+
+
+def test_trace_and_sample_files(tmp_path):
+    trace_path = tmp_path / "trace.json"
+    sample_path = tmp_path / "stacks.folded"
+    profiler = profiling.Profiler(str(trace_path), str(sample_path), sample_interval=0.0005)
+    start = profiling.now()
+    while profiling.now() - start < 50_000_000:  # keep the sampled thread busy for 50ms
+        start_span = profiling.now()
+        sum(range(1000))
+        profiler.record('handler', 'add-point', start_span)
+    profiler.close()
+
+    trace = json.loads(trace_path.read_text())
+    event = trace['traceEvents'][0]
+    assert event['name'] == 'handler' and event['ph'] == 'X' and event['cat'] == 'add-point'
+    assert event['dur'] >= 0
+
+    lines = sample_path.read_text().splitlines()
+    assert lines
+    stack, count = lines[0].rsplit(' ', 1)
+    assert int(count) >= 1
+    assert 'test_trace_and_sample_files' in sample_path.read_text()
+
+
+def test_unwritable_output_raises(tmp_path):
+    profiler = profiling.Profiler(str(tmp_path / "missing" / "trace.json"))
+    with pytest.raises(profiling.ProfileError):
+        profiler.close()
@@ -0,0 +1,100 @@
+"""
+Tests for the shared-memory ring buffer input.
+"""
+import asyncio
+from array import array
+from unittest.mock import AsyncMock, patch
+import pytest
+from mapcat import ring
+from mapcat.main import make_command_sink, make_line_sink
+from mapcat.chunker import SourceChunkers
+from mapcat.state import State
+
+
+def test_text_and_binary_records_in_order(tmp_path):
+    path = str(tmp_path / "mapcat.ring")
+    consumer = ring.RingConsumer(path)
+    producer = ring.RingProducer(path)
+
+    assert producer.send_text("add-point (52.5,13.4) id=a\nclear")
+    assert producer.send_command('add-polyline', array('d', [52.5, 13.4, 52.6, 13.5]), 'color=blue label="Two words"')
+    assert producer.send_command('add-point', [(1.5, 2.5)])
+    assert producer.send_text("remove id=a")
+
+    items = consumer.read()
+    assert items[0] == (ring.TYPE_TEXT, ["add-point (52.5,13.4) id=a", "clear"])
+    assert items[1][1]['cmd'] == 'add-polyline'
+    assert items[1][1]['coords'] == [[52.5, 13.4], [52.6, 13.5]]
+    assert items[1][1]['params'] == {'color': 'blue', 'label': 'Two words'}
+    assert items[2][1]['coords'] == [[1.5, 2.5]] and items[2][1]['params'] == {}
+    assert items[3] == (ring.TYPE_TEXT, ["remove id=a"])
+    assert consumer.read() == []
+
+
+def test_wraparound_and_full_ring(tmp_path):
+    path = str(tmp_path / "mapcat.ring")
+    producer = ring.RingProducer(path, capacity=4096)
+    consumer = ring.RingConsumer(path)
+    line = "add-point (52.5,13.4) " + "x" * 1000
+
+    received = []
+    for i in range(20):
+        assert producer.send_text(f"{line} {i}")
+        received += [text for _, lines in consumer.read() for text in lines]
+    assert received == [f"{line} {i}" for i in range(20)]
+
+    sent = 0
+    while producer.send_text(line):
+        sent += 1
+    assert sent == 3 and producer.dropped == 1  # 1032-byte records, plus padding at the wrap
+    assert producer.send_text("x" * 5000) is False
+
+
+def test_invalid_binary_records_are_skipped(tmp_path, capsys):
+    path = str(tmp_path / "mapcat.ring")
+    producer = ring.RingProducer(path)
+    consumer = ring.RingConsumer(path)
+
+    producer.send_command('add-point', [(95.0, 13.4)])
+    producer.send_command('add-point', [(52.5, 13.4)], 'bad token')
+    producer.send_command('add-point', [(52.5, 13.4)], 'id=ok')
+    items = consumer.read()
+
+    assert [item['params'] for _, item in items] == [{'id': 'ok'}]
+    err = capsys.readouterr().err
+    assert "Latitude out of range" in err and "Invalid parameters" in err
+    with pytest.raises(ValueError):
+        producer.send_command('remove', [])
+
+
+def test_not_a_ring_file(tmp_path):
+    path = tmp_path / "other"
+    path.write_bytes(b"x" * 200)
+    with pytest.raises(ring.RingError):
+        ring.RingConsumer(str(path))
+
+
+def test_run_ring_dispatches_to_state(tmp_path):
+    path = str(tmp_path / "mapcat.ring")
+    state = State()
+
+    async def run():
+        sink = make_line_sink(state, SourceChunkers(), verbose=False)
+        task = asyncio.create_task(ring.run_ring(path, sink, make_command_sink(state, False), poll_interval=0.001))
+        await asyncio.sleep(0.01)
+        producer = ring.RingProducer(path)
+        producer.send_text("add-point (52.5,13.4) id=text")
+        producer.send_command('add-polyline', [(52.5, 13.4), (52.6, 13.5)], 'id=binary tag=t')
+        producer.send_text("remove id=text")
+        for _ in range(100):
+            await asyncio.sleep(0.005)
+            if 'binary' in state.features and 'text' not in state.features:
+                break
+        task.cancel()
+        producer.close()
+
+    with patch("mapcat.server.broadcast", new=AsyncMock()):
+        asyncio.run(run())
+
+    assert list(state.features) == ['binary']
+    assert state.get_feature('binary')['params']['tag'] == 't'
@@ -0,0 +1,90 @@
+"""
+Tests for the declarative command schemas and their compiled validators.
+"""
+import pytest
+from mapcat import parser
+from mapcat.commands import COMMAND_HANDLERS, HELP_TEXT, handle_add_point, handle_remove
+from mapcat.schema import COMMAND_SCHEMAS, VALIDATORS, CommandSchema, Param, compile_validator
+from mapcat.state import State
+
+
+def test_every_handler_has_a_schema():
+    assert set(COMMAND_SCHEMAS) == set(COMMAND_HANDLERS)
+
+
+def test_defaults_conversion_and_passthrough():
+    params, error = VALIDATORS['add-polyline']({'coords': [[1, 1], [2, 2]], 'params': {'width': '5', 'foo': 'bar'}})
+    assert error is None
+    assert params == {'width': 5, 'foo': 'bar', 'color': '#007cff', 'opacity': 1.0,
+                      'markers': 0, 'markerBorder': 2, 'zorder': 0}
+    params, _ = VALIDATORS['add-polygon']({'coords': [[1, 1], [2, 2], [3, 3]], 'params': {}})
+    assert params['opacity'] == 0.3
+
+
+def test_given_params_are_not_modified():
+    given = {'radius': '6'}
+    VALIDATORS['add-point']({'coords': [[1, 1]], 'params': given})
+    assert given == {'radius': '6'}
+
+
+@pytest.mark.parametrize("params, message", [
+    ({'opacity': 'abc'}, "invalid opacity value: 'abc'"),
+    ({'opacity': '1.5'}, "opacity must be between 0.0 and 1.0, got 1.5"),
+    ({'opacity': 'nan'}, "opacity must be between 0.0 and 1.0, got nan"),
+    ({'radius': '-1'}, "radius must be at least 0, got -1"),
+    ({'radius': '4.5'}, "invalid radius value: '4.5'"),
+])
+def test_invalid_values_are_rejected(params, message):
+    assert VALIDATORS['add-point']({'coords': [[1, 1]], 'params': params}) == (None, message)
+
+
+def test_invalid_value_does_not_crash_handler(capsys):
+    state = State()
+    assert handle_add_point(state, {'cmd': 'add-point', 'coords': [[1, 1]], 'params': {'opacity': 'x'}}) is None
+    assert not state.features
+    assert "invalid opacity value" in capsys.readouterr().err
+
+
+def test_coordinate_counts():
+    assert VALIDATORS['add-point']({'coords': [], 'params': {}}) == (None, "add-point requires exactly 1 coordinate, got 0")
+    assert VALIDATORS['add-polygon']({'coords': [[1, 1]], 'params': {}}) == \
+        (None, "add-polygon requires at least 3 coordinates, got 1")
+    assert VALIDATORS['clear']({'coords': [[1, 1]], 'params': {}}) == ({}, None)
+
+
+def test_one_of(capsys):
+    state = State()
+    assert handle_remove(state, {'cmd': 'remove', 'coords': [], 'params': {}}) is None
+    assert handle_remove(state, {'cmd': 'remove', 'coords': [], 'params': {'id': 'a', 'tag': 'b'}}) is None
+    err = capsys.readouterr().err
+    assert "requires either id or tag" in err and "either id or tag, not both" in err
+
+
+def test_new_command_from_schema():
+    schema = CommandSchema('add-circle', 'add-circle (lat,lng)', 'Add a circle', 'add-circle (1,1) meters=50',
+                           min_coords=1, max_coords=1,
+                           params=(Param('meters', float, 10.0, 0.0, 1e6), Param('note', default='')))
+    validate = compile_validator(schema)
+    assert validate({'coords': [[1, 1]], 'params': {'meters': '50'}}) == ({'meters': 50.0, 'note': ''}, None)
+    assert validate({'coords': [[1, 1]], 'params': {'meters': '2e6'}})[1] == \
+        "meters must be between 0.0 and 1000000.0, got 2000000.0"
+
+
+def test_help_is_generated_from_schemas():
+    for schema in COMMAND_SCHEMAS.values():
+        assert schema.usage in HELP_TEXT and schema.example in HELP_TEXT
+    assert "markerBorder=<pixels>" in HELP_TEXT
+    assert "Fill transparency (default: 0.3)" in HELP_TEXT
+
+
+@pytest.mark.parametrize("line", [
+    'add-point (52.5,13.4) color=red label=Home',
+    'add-polyline (52.5,13.4);(52.6,13.5)  width=3',
+    'add-point ( 52.5, 13.4 ) color=red',
+    'add-point (52.5,13.4)) color=red',
+])
+def test_simple_split_matches_tokenizer(line):
+    """The quote-free fast path splits exactly like the tokenizer, or defers to it."""
+    fast = parser._split_simple(line)
+    if fast is not None:
+        assert fast == parser._tokenize(line)
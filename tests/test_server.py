@@ -0,0 +1,131 @@
+"""
+Tests for serving the page, static assets and WebSockets from one port.
+"""
+import asyncio
+import gzip
+import json
+import urllib.error
+import urllib.request
+import websockets
+from unittest.mock import patch
+from mapcat import server
+from mapcat.state import State
+
+
+def serve(client):
+    """Run server.start_server on a free port and call client(port) from a thread."""
+    async def run():
+        async with await server.start_server(0, '127.0.0.1') as http_server:
+            port = http_server.sockets[0].getsockname()[1]
+            return await asyncio.get_running_loop().run_in_executor(None, client, port)
+    return asyncio.run(run())
+
+
+def get(port, path):
+    with urllib.request.urlopen(f"http://127.0.0.1:{port}{path}") as response:
+        return response.status, response.headers, response.read()
+
+
+def test_index_has_the_version():
+    status, headers, body = serve(lambda port: get(port, '/'))
+    assert status == 200
+    assert headers['Content-Type'] == 'text/html; charset=utf-8'
+    assert b'__VERSION__' not in body and b'<html' in body
+
+
+def test_static_files_and_fallback_to_the_page():
+    def client(port):
+        return get(port, '/favicon.svg'), get(port, '/unknown/path?x=1'), get(port, '/../server.py'), get(port, '/%2e%2e/server.py')
+    favicon, unknown, *escapes = serve(client)
+    assert favicon[1]['Content-Type'] == 'image/svg+xml' and favicon[2].startswith(b'<svg')
+    assert b'<html' in unknown[2]
+    for status, _, body in escapes:
+        assert status == 200 and b'<html' in body
+
+
+def test_metrics_on_the_same_port():
+    status, headers, body = serve(lambda port: get(port, '/metrics'))
+    assert status == 200
+    assert headers['Content-Type'].startswith('text/plain; version=0.0.4')
+    assert b'mapcat_clients' in body
+
+
+def test_stats_without_state_is_unavailable():
+    server.set_state_getter(None)
+
+    def client(port):
+        try:
+            get(port, '/stats')
+        except urllib.error.HTTPError as error:
+            return error.code
+    assert serve(client) == 503
+
+
+def test_websocket_and_http_share_the_port():
+    state = State()
+    state.add_feature('point', [[52.5, 13.4]], {}, 'home')
+    server.set_state_getter(lambda: state)
+
+    async def run():
+        async with await server.start_server(0, '127.0.0.1') as http_server:
+            port = http_server.sockets[0].getsockname()[1]
+            async with websockets.connect(f"ws://127.0.0.1:{port}/") as ws:
+                snapshot = json.loads(await ws.recv())
+                page = await asyncio.get_running_loop().run_in_executor(None, get, port, '/')
+                await server.broadcast(json.dumps({'action': 'add', 'id': 'next'}))
+                update = json.loads(await ws.recv())
+        return snapshot, page, update
+
+    try:
+        snapshot, page, update = asyncio.run(run())
+    finally:
+        server.set_state_getter(None)
+    assert [feature['id'] for feature in snapshot['features']] == ['home']
+    assert page[0] == 200
+    assert update['id'] == 'next'
+
+
+def request(port, path, headers):
+    try:
+        with urllib.request.urlopen(urllib.request.Request(f"http://127.0.0.1:{port}{path}", headers=headers)) as response:
+            return response.status, response.headers, response.read()
+    except urllib.error.HTTPError as error:
+        return error.code, error.headers, error.read()
+
+
+def test_assets_are_gzipped_and_revalidated_with_etags():
+    def client(port):
+        plain = get(port, '/leaflet/leaflet.js')
+        compressed = request(port, '/leaflet/leaflet.js', {'Accept-Encoding': 'br, gzip;q=0.8'})
+        refused = request(port, '/leaflet/leaflet.js', {'Accept-Encoding': 'gzip;q=0'})
+        revalidated = request(port, '/leaflet/leaflet.js', {'If-None-Match': plain[1]['ETag']})
+        image = request(port, '/leaflet/images/layers.png', {'Accept-Encoding': 'gzip'})
+        return plain, compressed, refused, revalidated, image
+    plain, compressed, refused, revalidated, image = serve(client)
+
+    assert plain[1]['Content-Type'] == 'text/javascript; charset=utf-8'
+    assert b'Leaflet' in plain[2][:200] and plain[1]['Content-Encoding'] is None
+    assert compressed[1]['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(compressed[2]) == plain[2]
+    assert compressed[1]['ETag'] == plain[1]['ETag']
+    assert refused[1]['Content-Encoding'] is None
+    assert revalidated[0] == 304 and revalidated[2] == b''
+    assert image[1]['Content-Type'] == 'image/png' and image[1]['Content-Encoding'] is None
+
+
+def test_page_is_prepared_once_and_uses_bundled_leaflet():
+    with patch.object(server, '_build_version', return_value='2026.01.02-abc1234') as version:
+        pages = serve(lambda port: [get(port, '/')[2] for _ in range(3)])
+    assert version.call_count == 1
+    assert all(b'2026.01.02-abc1234' in page for page in pages)
+    assert b'unpkg.com' not in pages[0] and b'src="leaflet/leaflet.js"' in pages[0]
+    assert server.assets['/index.html'].etag != server.prepare_asset(b'other', '.html').etag
+
+
+def test_accepts_gzip():
+    assert server.accepts_gzip(['gzip, deflate, br'])
+    assert server.accepts_gzip(['deflate', 'gzip;q=0.5'])
+    assert server.accepts_gzip(['*'])
+    assert not server.accepts_gzip(['gzip;q=0'])
+    assert not server.accepts_gzip(['identity'])
+    assert not server.accepts_gzip([])
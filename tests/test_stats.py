@@ -0,0 +1,132 @@
+"""
+Tests for the stats command, GET /stats and State's incremental accounting.
+"""
+import asyncio
+import json
+import random
+import sys
+import urllib.request
+from mapcat import server, stats
+from mapcat.commands import COMMAND_HANDLERS
+from mapcat.state import State
+
+
+class NoWalkDict(dict):
+    """Feature dict that fails the test if stats iterates over it."""
+
+    def __iter__(self):
+        raise AssertionError("stats walked the features")
+
+    def items(self):
+        raise AssertionError("stats walked the features")
+
+    def values(self):
+        raise AssertionError("stats walked the features")
+
+
+def recount(state):
+    by_type, by_tag, vertices = {}, {}, 0
+    for feature in dict.values(state.features):
+        by_type[feature['type']] = by_type.get(feature['type'], 0) + 1
+        tag = feature['params'].get('tag')
+        if tag is not None:
+            by_tag[tag] = by_tag.get(tag, 0) + 1
+        vertices += len(feature['coords'])
+    return by_type, by_tag, vertices
+
+
+def test_incremental_counts_match_a_full_recount():
+    state = State()
+    rng = random.Random(7)
+    for step in range(2000):
+        action = rng.random()
+        if action < 0.7:
+            feature_type = rng.choice(['point', 'polyline', 'polygon'])
+            coords = [[rng.uniform(-90, 90), rng.uniform(-180, 180)] for _ in range(1 if feature_type == 'point' else rng.randint(2, 20))]
+            params = {'color': 'red', 'tag': rng.choice(['a', 'b', 'c'])} if rng.random() < 0.5 else {'color': 'blue'}
+            state.add_feature(feature_type, coords, params)
+        elif action < 0.95 and state.features:
+            state.remove_feature(rng.choice(list(state.features)))
+        elif action < 0.99:
+            state.remove_features_by_tag(rng.choice(['a', 'b', 'c']))
+        else:
+            state.clear_all()
+
+    by_type, by_tag, vertices = recount(state)
+    result = stats.collect(state)
+    assert result['features']['by_type'] == by_type
+    assert result['features']['by_tag'] == by_tag
+    assert result['vertices']['total'] == vertices
+
+    for feature_id in list(state.features):
+        state.remove_feature(feature_id)
+    assert state.estimated_bytes == {'coords': 0, 'params': 0, 'features': 0}
+    assert state.tag_counts == {}
+
+
+def test_memory_estimate_tracks_coordinates():
+    state = State()
+    state.add_feature('polyline', [[1.0, 2.0]] * 1000, {})
+    coords_bytes = state.estimated_bytes['coords']
+    assert 1000 * sys.getsizeof([0.0, 0.0]) < coords_bytes < 1000 * 200
+
+
+def test_collect_does_not_walk_features():
+    state = State()
+    for i in range(100):
+        state.add_feature('point', [[1, 1]], {'tag': 't'}, f"p{i}")
+    state.features = NoWalkDict(state.features)
+
+    result = stats.collect(state)
+    assert result['features'] == {'total': 100, 'by_type': {'point': 100}, 'by_tag': {'t': 100}}
+    assert result['memory']['state_estimated_bytes'] > 0
+    assert result['memory']['rss_bytes'] > 0
+
+
+def test_stats_command_prints_summary(capsys):
+    state = State()
+    state.add_feature('point', [[1, 1]], {'tag': 'home'})
+    assert COMMAND_HANDLERS['stats'](state, {'cmd': 'stats', 'coords': [], 'params': {}}) is None
+    out = capsys.readouterr().out
+    assert 'Features: 1 (point 1)' in out
+    assert 'by tag: home 1' in out
+    assert 'Memory: state ~' in out
+
+
+def test_sources_are_included():
+    stats.add_source('test-source', lambda: {'queued': 3})
+    try:
+        assert stats.collect(State())['test-source'] == {'queued': 3}
+    finally:
+        del stats._sources['test-source']
+
+
+def test_http_endpoint_serves_json():
+    state = State()
+    state.add_feature('polygon', [[1, 1], [2, 2], [3, 1]], {})
+    server.set_state_getter(lambda: state)
+
+    def fetch(port):
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/stats") as response:
+            assert response.headers['Content-Type'] == 'application/json'
+            return json.loads(response.read())
+
+    async def run():
+        async with await server.start_server(0, '127.0.0.1') as http_server:
+            port = http_server.sockets[0].getsockname()[1]
+            return await asyncio.get_running_loop().run_in_executor(None, fetch, port)
+
+    try:
+        body = asyncio.run(run())
+    finally:
+        server.set_state_getter(None)
+    assert body['features']['by_type'] == {'polygon': 1}
+    assert body['vertices']['total'] == 3
+    assert body['clients'] == []
+
+
+def test_format_bytes():
+    assert stats.format_bytes(512) == '512 B'
+    assert stats.format_bytes(2048) == '2.0 KB'
+    assert stats.format_bytes(5 * 1024 * 1024) == '5.0 MB'
+    assert stats.format_bytes(3 * 1024 ** 3) == '3.0 GB'
@@ -0,0 +1,229 @@
+"""
+Tests for the tile cache and proxy, against a local stand-in tile server.
+"""
+import asyncio
+import os
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from mapcat import server, stats, tiles
+from mapcat.state import State
+
+PNG = b'\x89PNG\r\n\x1a\n'
+
+
+class UpstreamHandler(BaseHTTPRequestHandler):
+    """Serves /{z}/{x}/{y}.png as a fake PNG of 100 bytes; z=9 is missing, z=8 fails."""
+
+    def do_GET(self):
+        self.server.requests.append(self.path)
+        time.sleep(self.server.delay)
+        z = self.path.split('/')[1]
+        if z == '9':
+            self.send_error(404)
+            return
+        if z == '8':
+            self.send_error(500)
+            return
+        body = (PNG + self.path.encode()).ljust(100, b'.')
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/png')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def upstream():
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), UpstreamHandler)
+    httpd.requests = []
+    httpd.delay = 0
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def cache_for(upstream, directory, max_bytes=1024 * 1024):
+    return tiles.TileCache(str(directory), max_bytes, f"http://127.0.0.1:{upstream.server_address[1]}/{{z}}/{{x}}/{{y}}.png")
+
+
+def test_miss_then_hit(upstream, tmp_path):
+    cache = cache_for(upstream, tmp_path)
+
+    async def run():
+        return await cache.get(3, 1, 2), await cache.get(3, 1, 2)
+    first, second = asyncio.run(run())
+
+    assert first == second and first.content_type == 'image/png'
+    assert first.data.startswith(PNG + b'/3/1/2.png')
+    assert upstream.requests == ['/3/1/2.png']
+    assert (tmp_path / '3' / '1' / '2.tile').read_bytes() == first.data
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_concurrent_requests_share_one_fetch(upstream, tmp_path):
+    upstream.delay = 0.2
+    cache = cache_for(upstream, tmp_path)
+
+    async def run():
+        return await asyncio.gather(*(cache.get(4, 5, 6) for _ in range(10)))
+    results = asyncio.run(run())
+
+    assert len(set(results)) == 1
+    assert upstream.requests == ['/4/5/6.png']
+    assert (cache.misses, cache.deduplicated) == (1, 9)
+
+
+def test_least_recently_used_tiles_are_evicted(upstream, tmp_path):
+    cache = cache_for(upstream, tmp_path, max_bytes=300)
+
+    async def run():
+        for x in range(3):
+            await cache.get(2, x, 0)
+        await cache.get(2, 0, 0)  # now the most recently used
+        await cache.get(2, 3, 0)
+    asyncio.run(run())
+
+    assert list(cache.index) == [(2, 2, 0), (2, 0, 0), (2, 3, 0)]
+    assert cache.total_bytes == 300 and cache.evictions == 1
+    assert not (tmp_path / '2' / '1' / '0.tile').exists()
+
+
+def test_index_is_rebuilt_from_disk(upstream, tmp_path):
+    cache = cache_for(upstream, tmp_path)
+
+    async def run():
+        for x in range(3):
+            await cache.get(2, x, 1)
+    asyncio.run(run())
+    os.utime(tmp_path / '2' / '0' / '1.tile', (time.time() + 10, time.time() + 10))
+    (tmp_path / 'README').write_text('not a tile')
+
+    reopened = cache_for(upstream, tmp_path, max_bytes=200)
+    assert list(reopened.index) == [(2, 2, 1), (2, 0, 1)]
+    assert reopened.total_bytes == 200
+
+
+def test_tile_deleted_behind_the_cache_is_fetched_again(upstream, tmp_path):
+    cache = cache_for(upstream, tmp_path)
+
+    async def run():
+        await cache.get(3, 1, 2)
+        (tmp_path / '3' / '1' / '2.tile').unlink()
+        return await cache.get(3, 1, 2)
+    tile = asyncio.run(run())
+
+    assert tile.data.startswith(PNG + b'/3/1/2.png')
+    assert upstream.requests == ['/3/1/2.png', '/3/1/2.png']
+    assert (cache.hits, cache.misses, cache.total_bytes) == (0, 2, 100)
+
+
+def test_missing_invalid_and_failing_tiles(upstream, tmp_path):
+    cache = cache_for(upstream, tmp_path)
+
+    async def run():
+        assert await cache.get(9, 1, 1) is None
+        assert await cache.get(2, 4, 0) is None  # x out of range
+        assert await cache.get(23, 0, 0) is None
+        with pytest.raises(tiles.TileError):
+            await cache.get(8, 1, 1)
+    asyncio.run(run())
+
+    assert upstream.requests == ['/9/1/1.png', '/8/1/1.png']
+    assert cache.index == {} and cache.errors == 1
+
+
+def test_server_proxies_tiles_and_points_the_page_at_them(upstream, tmp_path):
+    cache = cache_for(upstream, tmp_path)
+    previous = server.tile_source, server.tile_layer
+    server.set_tile_source(cache)
+
+    def fetch(port, path):
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}{path}") as response:
+                return response.status, response.headers['Content-Type'], response.read()
+        except urllib.error.HTTPError as error:
+            return error.code, None, None
+
+    def client(port):
+        return [fetch(port, path) for path in ('/tiles/1/1/0.png', '/tiles/9/0/0.png', '/tiles/8/0/0.png', '/')]
+
+    async def run():
+        async with await server.start_server(0, '127.0.0.1') as http_server:
+            port = http_server.sockets[0].getsockname()[1]
+            return await asyncio.get_running_loop().run_in_executor(None, client, port)
+
+    try:
+        tile, missing, failing, page = asyncio.run(run())
+    finally:
+        server.tile_source, server.tile_layer = previous
+        del stats._sources['tiles']
+        server.metrics.REGISTRY.collectors.pop('tiles')
+        server.load_assets()
+
+    assert tile[0] == 200 and tile[1] == 'image/png' and tile[2].startswith(PNG)
+    assert missing[0] == 404 and failing[0] == 502
+    assert b'"url": "tiles/{z}/{x}/{y}.png"' in page[2]
+    assert 'Tile cache: 1 tiles, 100 B of 1.0 MB; 0 hits, 3 misses' in stats.format_stats(dict(stats.collect(State()), tiles=cache.stats()))
+
+
+def test_slow_upstream_is_answered_with_gateway_timeout(upstream, tmp_path, monkeypatch):
+    upstream.delay = 1.0
+    monkeypatch.setattr(tiles, 'REQUEST_TIMEOUT', 0.2)
+    cache = cache_for(upstream, tmp_path)
+    previous = server.tile_source, server.tile_layer
+    server.set_tile_source(cache)
+
+    def fetch(port):
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/tiles/1/1/0.png") as response:
+                return response.status
+        except urllib.error.HTTPError as error:
+            return error.code
+
+    async def run():
+        async with await server.start_server(0, '127.0.0.1') as http_server:
+            port = http_server.sockets[0].getsockname()[1]
+            status = await asyncio.get_running_loop().run_in_executor(None, fetch, port)
+            await asyncio.sleep(1.2)  # the fetch went on in the background
+            return status
+
+    try:
+        status = asyncio.run(run())
+    finally:
+        server.tile_source, server.tile_layer = previous
+        del stats._sources['tiles']
+        server.metrics.REGISTRY.collectors.pop('tiles')
+        server.load_assets()
+
+    assert status == 504
+    assert list(cache.index) == [(1, 1, 0)]
+
+
+def test_page_uses_openstreetmap_by_default():
+    server.load_assets()
+    page = server.assets['/index.html'].body
+    assert b'"url": "https://tile.openstreetmap.org/{z}/{x}/{y}.png"' in page
+    assert b'__TILE_LAYER__' not in page
+
+
+def test_unusable_cache_directory_is_reported(tmp_path):
+    """The startup error reaches stderr although piped input logs through the buffered writer."""
+    (tmp_path / "file").write_text("not a directory")
+    directory = tmp_path / "file" / "tiles"
+    result = subprocess.run([sys.executable, "-m", "mapcat.main", "--no-open", "--tile-cache", str(directory)],
+                            stdin=subprocess.DEVNULL, capture_output=True, text=True, timeout=30)
+
+    assert result.returncode == 1
+    assert f"cannot use tile cache {directory}" in result.stderr